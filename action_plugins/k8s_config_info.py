@@ -3,8 +3,17 @@
 # Copyright: (c) 2019, Johnathan Kupferer <jkupfere@redhat.com>
 # GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
 
+import os
+
+import ansible.module_utils
 from ansible.plugins.action import ActionBase
-from copy import deepcopy
+
+# Role module_utils are shared by the action plugins
+ROLE_MODULE_UTILS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'module_utils')
+if ROLE_MODULE_UTILS not in ansible.module_utils.__path__:
+    ansible.module_utils.__path__.append(ROLE_MODULE_UTILS)
+
+from ansible.module_utils.k8s_config_controller import execute_module
 
 class ActionModule(ActionBase):
 
@@ -22,17 +31,12 @@ class ActionModule(ActionBase):
 
         register = k8s_module_args.pop('register', '')
 
-        result.update(
-            self._execute_module(
-                module_name='kubernetes.core.k8s_info',
-                module_args=k8s_module_args,
-                task_vars=task_vars,
-            )
-        )
+        result.update(execute_module(self, 'k8s_config_info', k8s_module_args, task_vars))
 
         if register:
+            # Shallow copy avoids a reference cycle without copying resources
             result['ansible_facts'] = {
-                register: deepcopy(result)
+                register: dict(result)
             }
             result['_ansible_facts_cacheable'] = False
 
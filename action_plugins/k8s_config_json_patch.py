@@ -3,8 +3,18 @@
 # Copyright: (c) 2019, Johnathan Kupferer <jkupfere@redhat.com>
 # GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
 
+import os
+
+import ansible.module_utils
 from ansible.plugins.action import ActionBase
 
+# Role module_utils are shared by the action plugins
+ROLE_MODULE_UTILS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'module_utils')
+if ROLE_MODULE_UTILS not in ansible.module_utils.__path__:
+    ansible.module_utils.__path__.append(ROLE_MODULE_UTILS)
+
+from ansible.module_utils.k8s_config_controller import execute_module
+
 class ActionModule(ActionBase):
 
     def run(self, tmp=None, task_vars=None):
@@ -19,11 +29,5 @@ class ActionModule(ActionBase):
         k8s_module_args = dict((k, v) for k, v in self._task.args.items() if k != 'api')
         k8s_module_args.update(k8s_api)
 
-        result.update(
-            self._execute_module(
-                module_name='k8s_config_json_patch',
-                module_args=k8s_module_args,
-                task_vars=task_vars,
-            )
-        )
+        result.update(execute_module(self, 'k8s_config_json_patch', k8s_module_args, task_vars))
         return result
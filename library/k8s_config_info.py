@@ -0,0 +1,308 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2019, Johnathan Kupferer
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+
+DOCUMENTATION = '''
+
+module: k8s_config_info
+
+short_description: Get kubernetes objects, optionally waiting for them to be ready
+
+version_added: "2.9"
+
+author:
+- "Johnathan Kupferer"
+
+description:
+- Use the OpenShift Python client to get K8s resources.
+- Compatible with C(kubernetes.core.k8s_info) options and results, with waiting implemented with a watch.
+- Authenticate using either a config file, certificates, password or token.
+
+extends_documentation_fragment:
+- kubernetes.core.k8s_auth_options
+- kubernetes.core.k8s_name_options
+
+options:
+  label_selectors:
+    description: List of label selectors to use to filter results.
+    type: list
+    elements: str
+  field_selectors:
+    description: List of field selectors to use to filter results.
+    type: list
+    elements: str
+  wait:
+    description:
+    - Wait for objects to be ready.
+    - With C(name), wait for the object to exist and be ready, otherwise wait for each object found.
+    - Each object is watched from its resource version rather than polled.
+    - Without C(wait_condition) or C(wait_jsonpath), Deployments wait for rollout to complete, Jobs wait to
+      complete and custom resource definitions wait to be established. Other objects are ready once they exist.
+    type: bool
+    default: false
+  wait_timeout:
+    description:
+    - Seconds to wait for objects to be ready with C(wait).
+    type: int
+    default: 120
+  wait_condition:
+    description:
+    - Status condition for objects to be ready with C(wait), given as C(type) and optional C(status), which
+      defaults to C(True), and C(reason).
+    type: dict
+  wait_jsonpath:
+    description:
+    - JSONPath expression, such as C({.status.phase}), which must be present for objects to be ready with C(wait),
+      with any value including empty or false unless C(wait_jsonpath_value) is given.
+    type: str
+  wait_jsonpath_value:
+    description:
+    - Value which the C(wait_jsonpath) expression must match.
+    type: str
+  result_format:
+    description:
+    - Format of objects returned in C(resources).
+    - C(full) returns complete objects as returned by the API server.
+    - C(summary) returns the C(apiVersion), C(kind), C(name), C(namespace), C(uid) and C(resourceVersion)
+      of each object.
+    - A list of JSONPath expressions, such as C({.status.phase}), returns a dict of each expression to
+      its value for each object. Expressions with C([*]) give a list of values.
+    type: raw
+    default: full
+  discovery_cache_dir:
+    description:
+    - Directory for the persistent API discovery cache shared by k8s_config modules.
+    - Defaults to C(~/.kube/cache/k8s_config).
+    type: path
+  discovery_cache_ttl:
+    description:
+    - Seconds before the API discovery cache is refreshed.
+    - The cache is also refreshed if the cluster server version changes.
+    type: int
+    default: 600
+  discovery_cache_invalidate:
+    description:
+    - Discard the API discovery cache before running.
+    type: bool
+    default: false
+  agent_socket:
+    description:
+    - Unix socket of the k8s_config agent which holds API connections open between module runs.
+    - Set by the k8s_config action plugins when called with C(agent) on a local connection.
+    - Requests are made directly if the agent is not running.
+    type: path
+  request_qps:
+    description:
+    - Average number of API requests per second, with bursts up to C(request_burst).
+    - The default of C(0) does not limit the request rate.
+    type: float
+    default: 0
+  request_burst:
+    description:
+    - Number of API requests which may be made at once before C(request_qps) applies.
+    type: int
+    default: 10
+  request_retries:
+    description:
+    - Number of times to retry API requests which fail with status 429, 500, 503 or 504, waiting for
+      C(Retry-After) if given or else backing off exponentially.
+    - Create requests, and JSON patches appending to lists which do not start with a C(test) operation, are only
+      retried on status 429, as they may have been processed despite a server error.
+    - Patch and replace requests are also retried on conflict, other than for server-side apply and
+      updates conditional on C(resourceVersion).
+    - A retried delete which is then not found succeeds, as the object was deleted by an earlier attempt.
+    type: int
+    default: 5
+
+requirements:
+  - "python >= 2.7"
+  - "openshift >= 0.6"
+  - "PyYAML >= 3.11"
+'''
+
+EXAMPLES = '''
+- name: Wait for Deployment rollout
+  k8s_config_info:
+    api_version: apps/v1
+    kind: Deployment
+    name: myapp
+    namespace: myproject
+    wait: true
+    wait_timeout: 300
+
+- name: Wait for pods to be running
+  k8s_config_info:
+    api_version: v1
+    kind: Pod
+    namespace: myproject
+    label_selectors:
+    - app=myapp
+    wait: true
+    wait_jsonpath: '{.status.phase}'
+    wait_jsonpath_value: Running
+'''
+
+RETURN = '''
+api_found:
+  description:
+  - Whether the requested kind was found in the cluster API.
+  returned: always
+  type: bool
+resources:
+  description:
+  - The objects found, formatted as given by C(result_format).
+  returned: success
+  type: list
+request_stats:
+  description:
+  - Counts of API C(requests), C(retries), C(conflict_retries) and C(throttled) requests, and
+    C(throttled_seconds) spent waiting on C(request_qps).
+  returned: success
+  type: dict
+'''
+
+import copy
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.kubernetes.core.plugins.module_utils.common import (
+    K8sAnsibleMixin, NAME_ARG_SPEC, AUTH_ARG_SPEC)
+from ansible.module_utils.k8s_config_agent import AGENT_ARG_SPEC, K8sConfigAgentMixin
+from ansible.module_utils.k8s_config_discovery import DISCOVERY_ARG_SPEC, K8sConfigDiscoveryMixin
+from ansible.module_utils.k8s_config_result import RESULT_FORMAT_ARG_SPEC, result_formatter
+from ansible.module_utils.k8s_config_scheduler import SCHEDULER_ARG_SPEC, K8sConfigSchedulerMixin
+from ansible.module_utils.k8s_config_wait import (
+    WATCH_WAIT_ARG_SPEC, WaitFailedException, ready_check, wait_for_object)
+
+try:
+    from openshift.dynamic.exceptions import DynamicApiError, NotFoundError
+except ImportError:
+    pass
+
+
+class KubernetesInfoModule(K8sConfigSchedulerMixin, K8sConfigDiscoveryMixin, K8sConfigAgentMixin, K8sAnsibleMixin):
+
+    @property
+    def argspec(self):
+        argument_spec = copy.deepcopy(NAME_ARG_SPEC)
+        argument_spec.update(copy.deepcopy(AUTH_ARG_SPEC))
+        argument_spec.update(copy.deepcopy(DISCOVERY_ARG_SPEC))
+        argument_spec.update(copy.deepcopy(AGENT_ARG_SPEC))
+        argument_spec.update(copy.deepcopy(SCHEDULER_ARG_SPEC))
+        argument_spec.update(copy.deepcopy(WATCH_WAIT_ARG_SPEC))
+        argument_spec.update(copy.deepcopy(RESULT_FORMAT_ARG_SPEC))
+        argument_spec['label_selectors'] = dict(
+            type='list',
+            elements='str',
+            default=[],
+        )
+        argument_spec['field_selectors'] = dict(
+            type='list',
+            elements='str',
+            default=[],
+        )
+        return argument_spec
+
+    def __init__(self, *args, **kwargs):
+        module = AnsibleModule(
+            argument_spec=self.argspec,
+            supports_check_mode=True,
+        )
+
+        self.module = module
+        self.check_mode = self.module.check_mode
+        self.params = self.module.params
+        self.fail_json = self.module.fail_json
+        self.fail = self.module.fail_json
+        self.exit_json = self.module.exit_json
+        self.warn = self.module.warn
+
+        super(KubernetesInfoModule, self).__init__(*args, **kwargs)
+
+        self.client = None
+        self.warnings = []
+
+        self.kind = self.params.get('kind')
+        self.api_version = self.params.get('api_version')
+        self.name = self.params.get('name')
+        self.namespace = self.params.get('namespace')
+        try:
+            self.format_result = result_formatter(self.params.get('result_format'))
+        except ValueError as e:
+            self.fail_json(msg=str(e))
+
+    def execute_module(self):
+        self.client = self.get_api_client()
+        resource = self.find_resource(self.kind, self.api_version, fail=False)
+        if not resource:
+            self.exit_json(changed=False, api_found=False, resources=[])
+
+        namespace = self.namespace if resource.namespaced else None
+        params = dict()
+        if self.params.get('label_selectors'):
+            params['label_selector'] = ','.join(self.params.get('label_selectors'))
+        if self.params.get('field_selectors'):
+            params['field_selector'] = ','.join(self.params.get('field_selectors'))
+        if namespace:
+            params['namespace'] = namespace
+        try:
+            if self.name:
+                try:
+                    resources = [resource.get(name=self.name, **params).to_dict()]
+                except NotFoundError:
+                    resources = []
+            else:
+                resources = resource.get(**params).to_dict().get('items', [])
+        except DynamicApiError as exc:
+            self.fail_json(
+                msg='Failed to retrieve requested object: {0}'.format(exc.body),
+                error=exc.status, status=exc.status, reason=exc.reason
+            )
+
+        if self.params.get('wait'):
+            resources = self.wait_for_resources(resource, namespace, resources)
+
+        self.exit_json(
+            changed=False,
+            api_found=True,
+            resources=[self.format_result(k8s_obj) for k8s_obj in resources],
+            request_stats=self.request_stats(),
+        )
+
+    def wait_for_resources(self, resource, namespace, resources):
+        ready = ready_check(resource.group, resource.kind, self.params)
+        deadline = time.time() + self.params.get('wait_timeout')
+        waited = []
+        # Without a match for name, wait for the object to be created
+        for k8s_obj in resources or ([None] if self.name else []):
+            name = k8s_obj['metadata']['name'] if k8s_obj else self.name
+            try:
+                waited.append(wait_for_object(
+                    resource, name,
+                    k8s_obj['metadata'].get('namespace') if k8s_obj else namespace,
+                    ready, deadline - time.time(), k8s_obj=k8s_obj
+                ))
+            except WaitFailedException as e:
+                self.fail_json(
+                    msg=str(e), api_found=True, resources=[self.format_result(k8s_obj) for k8s_obj in resources]
+                )
+            except DynamicApiError as exc:
+                self.fail_json(
+                    msg='Failed to watch object: {0}'.format(exc.body),
+                    error=exc.status, status=exc.status, reason=exc.reason
+                )
+        return waited
+
+
+def main():
+    KubernetesInfoModule().execute_module()
+
+if __name__ == '__main__':
+    main()
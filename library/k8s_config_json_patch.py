@@ -46,8 +46,100 @@ options:
     - If a test specifies C(operations) then a failed test does not produce an error.
     - List indexes may be given with a simple key query of the form C([?KEY=='VALUE']) to support for various kubernetes use cases where lists have name keys.
     - The list index query resolves to C(-) (end of list) if it fails to match when adding a value to a list.
+    - The processed patch is minimized before it is sent. Operations overwritten by later operations are dropped,
+      operations within a value just added are merged into the added value and tests of values known from earlier
+      operations are dropped. A processed patch of only tests is not sent.
     type: list
     version_added: "2.9"
+  label_selectors:
+    description:
+    - List of label selectors for objects to patch, instead of a single object given by C(name).
+    type: list
+    elements: str
+  field_selectors:
+    description:
+    - List of field selectors for objects to patch, instead of a single object given by C(name).
+    type: list
+    elements: str
+  names:
+    description:
+    - List of names of objects to patch, instead of a single object given by C(name).
+    - May be combined with C(label_selectors) and C(field_selectors), which must then also match.
+    - Names which are not found are reported as errors.
+    type: list
+    elements: str
+  all_namespaces:
+    description:
+    - Patch objects selected by C(label_selectors), C(field_selectors) or C(names) in all namespaces rather
+      than only in C(namespace).
+    - Either C(namespace) or C(all_namespaces) is required to select objects of namespaced kinds.
+    type: bool
+    default: false
+  parallelism:
+    description:
+    - Number of patch requests to send concurrently when patching objects selected by C(label_selectors),
+      C(field_selectors) or C(names).
+    - Objects are listed in pages and the patch is processed against each object as listed. Only objects
+      with changes are patched.
+    type: int
+    default: 10
+  optimistic_concurrency:
+    description:
+    - Guard each patch sent with a C(test) of C(/metadata/resourceVersion) so that a patch processed against
+      an object which has since changed is rejected rather than overwriting the change.
+    - When the patch is rejected the object is retrieved again, the patch is processed against the current
+      object and sent again, up to C(conflict_retries) times with a randomized backoff.
+    type: bool
+    default: false
+  conflict_retries:
+    description:
+    - Number of times to process and send the patch again when rejected with C(optimistic_concurrency).
+    type: int
+    default: 5
+  discovery_cache_dir:
+    description:
+    - Directory for the persistent API discovery cache shared by k8s_config modules.
+    - Defaults to C(~/.kube/cache/k8s_config).
+    type: path
+  discovery_cache_ttl:
+    description:
+    - Seconds before the API discovery cache is refreshed.
+    - The cache is also refreshed if the cluster server version changes.
+    type: int
+    default: 600
+  discovery_cache_invalidate:
+    description:
+    - Discard the API discovery cache before running.
+    type: bool
+    default: false
+  agent_socket:
+    description:
+    - Unix socket of the k8s_config agent which holds API connections open between module runs.
+    - Set by the k8s_config action plugins when called with C(agent) on a local connection.
+    - Requests are made directly if the agent is not running.
+    type: path
+  request_qps:
+    description:
+    - Average number of API requests per second, with bursts up to C(request_burst).
+    - The default of C(0) does not limit the request rate.
+    type: float
+    default: 0
+  request_burst:
+    description:
+    - Number of API requests which may be made at once before C(request_qps) applies.
+    type: int
+    default: 10
+  request_retries:
+    description:
+    - Number of times to retry API requests which fail with status 429, 500, 503 or 504, waiting for
+      C(Retry-After) if given or else backing off exponentially.
+    - Create requests, and JSON patches appending to lists which do not start with a C(test) operation, are only
+      retried on status 429, as they may have been processed despite a server error.
+    - Patch and replace requests are also retried on conflict, other than for server-side apply and
+      updates conditional on C(resourceVersion).
+    - A retried delete which is then not found succeeds, as the object was deleted by an earlier attempt.
+    type: int
+    default: 5
 
 requirements:
   - "python >= 2.7"
@@ -77,6 +169,20 @@ EXAMPLES = '''
       value:
         name: ENV_LEVEL
         value: dev
+
+- name: Set ENV_LEVEL environment variable in all Deployments labeled app=myapp
+  k8s_config_json_patch:
+    api_version: apps/v1
+    kind: Deployment
+    label_selectors:
+    - app=myapp
+    all_namespaces: true
+    patch:
+    - op: add
+      path: /spec/template/spec/containers/0/env/[?name=='ENV_LEVEL']
+      value:
+        name: ENV_LEVEL
+        value: dev
 '''
 
 RETURN = '''
@@ -88,17 +194,61 @@ result:
   contains:
     resource:
       description: The patched resource definition.
-      returned: success
+      returned: success, when patching a single object by C(name)
       type: complex
+    json_patch:
+      description: The processed patch, when patching a single object by C(name).
+      returned: changed
+      type: list
+    attempts:
+      description:
+      - Number of times the patch was sent, which is more than C(1) when retried on conflict with
+        C(optimistic_concurrency). Results of objects patched by selectors also include C(attempts).
+      returned: changed and not check mode
+      type: int
+    results:
+      description:
+      - Per-object results when patching objects selected by C(label_selectors), C(field_selectors) or C(names),
+        in the order listed.
+      - Each item gives the C(apiVersion), C(kind), C(name), C(namespace) and C(changed) status of one object,
+        and the processed C(json_patch) and patched C(resource) if changed.
+      - Failed objects include an C(error) with the failure C(msg) and, for API errors, C(status) and C(reason).
+      returned: success
+      type: list
+    summary:
+      description:
+      - Counts of objects C(matched), C(changed), C(unchanged) and C(failed) when patching objects selected by
+        C(label_selectors), C(field_selectors) or C(names).
+      returned: success
+      type: dict
+    request_stats:
+      description:
+      - Counts of API C(requests), C(retries), C(conflict_retries) and C(throttled) requests, and
+        C(throttled_seconds) spent waiting on C(request_qps).
+      returned: success
+      type: dict
 '''
 
 import copy
 import re
+import time
+
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.six import string_types
 from ansible_collections.kubernetes.core.plugins.module_utils.common import (
     K8sAnsibleMixin, COMMON_ARG_SPEC, NAME_ARG_SPEC, RESOURCE_ARG_SPEC, AUTH_ARG_SPEC,
     WAIT_ARG_SPEC, DELETE_OPTS_ARG_SPEC)
+from ansible.module_utils.k8s_config_agent import AGENT_ARG_SPEC, K8sConfigAgentMixin
+from ansible.module_utils.k8s_config_discovery import DISCOVERY_ARG_SPEC, K8sConfigDiscoveryMixin
+from ansible.module_utils.k8s_config_scheduler import SCHEDULER_ARG_SPEC, K8sConfigSchedulerMixin
+
+try:
+    from openshift.dynamic.exceptions import DynamicApiError
+except ImportError:
+    pass
 
 class JsonPatchFailException(Exception):
     pass
@@ -106,65 +256,229 @@ class JsonPatchFailException(Exception):
 match_list_search = re.compile(r'\[\?(.*?)==?\'(.*?)\'\]$')
 match_num = re.compile(r'\d+$')
 
-def resolve_path(obj, path):
+# Path token types
+PATH_KEY = 'key'
+PATH_INDEX = 'index'
+PATH_APPEND = 'append'
+PATH_QUERY = 'query'
+
+# Path token with unescaped key, list index for index tokens and
+# (search key, search value) for list query tokens. The key is used when
+# resolving in a dict whatever the type.
+PathToken = namedtuple('PathToken', ['type', 'key', 'index', 'query'])
+
+# Compiled paths by path string, bounded by PATH_CACHE_SIZE
+compiled_paths = {}
+compiled_tokens = {}
+PATH_CACHE_SIZE = 4096
+
+def compile_token(key):
+    token = compiled_tokens.get(key)
+    if token is None:
+        if key == '-':
+            token = PathToken(PATH_APPEND, key, None, None)
+        elif match_num.match(key):
+            token = PathToken(PATH_INDEX, key, int(key), None)
+        else:
+            list_search_match = match_list_search.match(key)
+            if list_search_match:
+                token = PathToken(PATH_QUERY, key, None, list_search_match.groups())
+            else:
+                token = PathToken(PATH_KEY, key, None, None)
+        if len(compiled_tokens) >= PATH_CACHE_SIZE:
+            compiled_tokens.clear()
+        compiled_tokens[key] = token
+    return token
+
+def compile_path(path):
+    """ Return tuple of PathToken for JSON pointer path string, cached by path """
+    tokens = compiled_paths.get(path)
+    if tokens is None:
+        tokens = tuple(compile_token(key) for key in path_to_list(path))
+        if len(compiled_paths) >= PATH_CACHE_SIZE:
+            compiled_paths.clear()
+        compiled_paths[path] = tokens
+    return tokens
+
+class ListIndex(object):
+    """
+    Index of list query matches for a process_patch call, so that repeated
+    queries of a list do not scan it. Each list is indexed by search key and
+    value to the first matching item when first queried. Changes made with
+    set_item, append_item and delete_item keep indexes up to date: appends
+    are added to indexes, other changes to a list drop its indexes, and
+    changing a search key of a dict in an indexed list drops the index of
+    that search key.
+    """
+
+    def __init__(self):
+        # id of list -> (list, {search key: {search value: first index}})
+        self.lists = {}
+        # id of dict in indexed list -> (dict, {id of list: list})
+        self.items = {}
+
+    def add_item(self, lst, i, item):
+        if not isinstance(item, dict):
+            return
+        self.items.setdefault(id(item), (item, {}))[1][id(lst)] = lst
+        for search_key, values in self.lists[id(lst)][1].items():
+            value = item.get(search_key)
+            if isinstance(value, string_types) and value not in values:
+                values[value] = i
+
+    def find(self, lst, search_key, search_value):
+        """ Return index of first dict in lst with search_key set to search_value, or None """
+        entry = self.lists.get(id(lst))
+        if entry is None:
+            entry = self.lists[id(lst)] = (lst, {})
+        values = entry[1].get(search_key)
+        if values is None:
+            values = entry[1][search_key] = {}
+            for i, item in enumerate(lst):
+                self.add_item(lst, i, item)
+        return values.get(search_value)
+
+    def invalidate(self, context, key):
+        if isinstance(context, list):
+            self.lists.pop(id(context), None)
+            return
+        for lst in self.items.get(id(context), (None, {}))[1].values():
+            entry = self.lists.get(id(lst))
+            if entry:
+                entry[1].pop(key, None)
+
+    def set_item(self, context, key, value):
+        self.invalidate(context, key)
+        context[key] = value
+
+    def delete_item(self, context, key):
+        self.invalidate(context, key)
+        del context[key]
+
+    def append_item(self, lst, item):
+        lst.append(item)
+        if id(lst) in self.lists:
+            self.add_item(lst, len(lst) - 1, item)
+
+    def copied_item(self, context, key, item):
+        """ Note copy of item replacing it, with the same content, in context """
+        if isinstance(context, list) and isinstance(item, dict) and id(context) in self.lists:
+            self.items.setdefault(id(item), (item, {}))[1][id(context)] = context
+
+class CopyOnWrite(object):
+    """
+    Containers of an object being patched which may be changed in place.
+    Other containers are shared with the existing object and are copied
+    into their parent before being changed, so only containers along
+    changed paths are copied. Values set from the patch are shared with the
+    processed patch and are not owned either, so that processed operations
+    are not changed by later operations.
+    """
+
+    def __init__(self):
+        # id of owned container -> container, referenced so ids are not reused
+        self.owned = {}
+
+    def adopt(self, value):
+        """ Own value, which must not be shared with the existing object """
+        if isinstance(value, (dict, list)):
+            self.owned[id(value)] = value
+        return value
+
+    def copy(self, value):
+        """ Return owned shallow copy of container value """
+        if isinstance(value, dict):
+            return self.adopt(dict(value))
+        elif isinstance(value, list):
+            return self.adopt(list(value))
+        return value
+
+    def own_item(self, context, key, index=None):
+        """ Return value at key of owned context, first copying it into context if not owned """
+        value = context[key]
+        if isinstance(value, (dict, list)) and id(value) not in self.owned:
+            value = self.copy(value)
+            context[key] = value
+            if index is not None:
+                index.copied_item(context, key, value)
+        return value
+
+def find_list_item(lst, search_key, search_value, index=None):
+    if index is not None:
+        return index.find(lst, search_key, search_value)
+    for i, item in enumerate(lst):
+        if isinstance(item, dict) \
+        and item.get(search_key) == search_value:
+            return i
+    return None
+
+def resolve_tokens(obj, tokens, index=None, cow=None):
+    """
+    Resolve compiled path in obj, returning value, context, key, matched path
+    and tuple of unmatched tokens. An unmatched "-" in a list is returned as
+    an index token for the end of the list. When the path continues through
+    a value which is not a container the context is None, as there is
+    nowhere to add the unmatched path. List queries use the given ListIndex
+    if any. Given CopyOnWrite, containers along the path are owned so that
+    the returned context may be changed.
+    """
     value = obj
     context = None
     key = None
     matched_path = []
-    unmatched_path = copy.deepcopy(path)
-    while unmatched_path:
+    position = 0
+    while position < len(tokens):
         if not isinstance(value, (dict, list)):
-            break
-        key = unmatched_path.pop(0)
+            return value, None, None, matched_path, tokens[position:]
+        token = tokens[position]
+        if cow is not None and context is not None:
+            value = cow.own_item(context, key, index)
         context = value
         value = None
-        if key == '-' and isinstance(context, list):
-            unmatched_path.insert(0, str(len(context)))
-            break
 
         if isinstance(context, dict):
+            key = token.key
             if key in context:
                 matched_path.append(key)
                 value = context[key]
+                position += 1
                 continue
-            else:
-                unmatched_path.insert(0, key)
-                break
+            break
+
+        if token.type == PATH_APPEND:
+            key = token.key
+            end = str(len(context))
+            return value, context, key, matched_path, (compile_token(end),) + tokens[position + 1:]
 
-        if match_num.match(key):
-            key = int(key)
+        if token.type == PATH_INDEX:
+            key = token.index
             if key < len(context):
-                matched_path.append(str(key))
+                matched_path.append(token.key)
                 value = context[key]
+                position += 1
                 continue
-            else:
-                unmatched_path.insert(0, str(key))
-                break
+            break
 
-        list_search_match = match_list_search.match(key)
-        if list_search_match:
-            search_key = list_search_match.group(1)
-            search_value = list_search_match.group(2)
-            n = None
-            for i, ci in enumerate(context):
-                if isinstance(ci, dict) \
-                and ci.get(search_key) == search_value:
-                    n = i
-                    value = ci
-                    break
-            if n != None:
-                matched_path.append(str(n))
-                key = n
-                if unmatched_path:
-                    continue
-                else:
-                    break
-            else:
-                unmatched_path.insert(0, key)
+        if token.type == PATH_QUERY:
+            key = token.key
+            i = find_list_item(context, token.query[0], token.query[1], index)
+            if i is None:
                 break
+            matched_path.append(str(i))
+            key = i
+            value = context[i]
+            position += 1
+            continue
 
-        raise JsonPatchFailException('Unable to match path dict key in list {0}'.format(path_from_list(path)))
-    return value, context, key, matched_path, unmatched_path
+        raise JsonPatchFailException('Unable to match path dict key in list {0}'.format(
+            path_from_list([token.key for token in tokens])
+        ))
+    return value, context, key, matched_path, tokens[position:]
+
+def resolve_path(obj, path):
+    """ Resolve path given as a list of keys, returning the unmatched path as a list of keys """
+    value, context, key, matched_path, unmatched = resolve_tokens(obj, tuple(compile_token(key) for key in path))
+    return value, context, key, matched_path, [token.key for token in unmatched]
 
 def path_to_list(path):
     return [
@@ -172,133 +486,207 @@ def path_to_list(path):
     ]
 
 def path_from_list(path, last=None):
-    if last:
-        return '/' + '/'.join([item.replace('~', '~0').replace('/', '~1') for item in path + [last]])
-    else:
+    if last is None:
         return '/' + '/'.join([item.replace('~', '~0').replace('/', '~1') for item in path])
+    else:
+        return '/' + '/'.join([item.replace('~', '~0').replace('/', '~1') for item in path] + [
+            last.replace('~', '~0').replace('/', '~1')
+        ])
 
-def _process_patch_add(patch_operation, patched_obj, value, context, matched_path, unmatched_path):
-    for item in unmatched_path[:0:-1]:
-        if match_num.match(item):
+def _process_patch_add(patch_operation, patched_obj, value, context, matched_path, unmatched_tokens, index, shared=True):
+    """
+    Add value at unmatched path in context, creating containers for the
+    unmatched path. Unless value is not shared, a copy is added so that the
+    processed operation is not changed by later operations.
+    """
+    if not isinstance(context, (dict, list)):
+        raise JsonPatchFailException('Unable to add, path not found {0}'.format(patch_operation))
+    for token in unmatched_tokens[:0:-1]:
+        if token.type == PATH_INDEX:
+            value = [value]
+        elif token.type == PATH_QUERY:
+            if not isinstance(value, dict):
+                raise JsonPatchFailException('Invalid placement of list query in path {0}'.format(patch_operation))
+            index.set_item(value, token.query[0], token.query[1])
             value = [value]
         else:
-            match = match_list_search.match(item)
-            if match:
-                if not isinstance(value, dict):
-                    raise JsonPatchFailException('Invalid placement of list query in path {0}'.format(patch_operation))
-                value[match.group(1)] = match.group(2)
-                value = [value]
-            else:
-                value = {item: value}
+            value = {token.key: value}
 
+    token = unmatched_tokens[0]
     if isinstance(context, dict):
-        context[unmatched_path[0]] = copy.deepcopy(value)
-        processed_path = path_from_list(matched_path, unmatched_path[0])
+        index.set_item(context, token.key, copy.deepcopy(value) if shared else value)
+        processed_path = path_from_list(matched_path, token.key)
     else:
-        if match_num.match(unmatched_path[0]):
-            context.append(copy.deepcopy(value))
+        if token.type == PATH_INDEX:
+            index.append_item(context, copy.deepcopy(value) if shared else value)
             processed_path = path_from_list(matched_path, '-')
-        else:
-            match = match_list_search.match(unmatched_path[0])
-            if not match:
-                raise JsonPatchFailException('Unable to add, invalid list index {0}'.format(patch_operation))
+        elif token.type == PATH_QUERY:
             if not isinstance(value, dict):
                 raise JsonPatchFailException('Invalid placement of list query in path {0}'.format(patch_operation))
-            value[match.group(1)] = match.group(2)
-            context.append(copy.deepcopy(value))
+            index.set_item(value, token.query[0], token.query[1])
+            index.append_item(context, copy.deepcopy(value) if shared else value)
             processed_path = path_from_list(matched_path, '-')
+        else:
+            raise JsonPatchFailException('Unable to add, invalid list index {0}'.format(patch_operation))
 
     return dict(op='add', path=processed_path, value=value)
 
-def process_patch_add(patch_operation, patched_obj):
-    path = path_to_list(patch_operation['path'])
-    value = copy.deepcopy(patch_operation.get('value'))
-    obj_value, context, key, matched_path, unmatched_path = resolve_path(patched_obj, path)
-    if unmatched_path:
-        return _process_patch_add(patch_operation, patched_obj, value, context, matched_path, unmatched_path)
+def set_queried_value(path, value):
+    """ Set queried key of dict value at compiled path ending in a list query, so it is matched when set again """
+    if path and path[-1].type == PATH_QUERY and isinstance(value, dict):
+        value[path[-1].query[0]] = path[-1].query[1]
+    return value
+
+def process_patch_add(patch_operation, patched_obj, index=None, cow=None):
+    if index is None:
+        index = ListIndex()
+    path = compile_path(patch_operation['path'])
+    value = set_queried_value(path, copy.deepcopy(patch_operation.get('value')))
+    obj_value, context, key, matched_path, unmatched = resolve_tokens(patched_obj, path, index, cow)
+    if unmatched:
+        # Values not owned are copied before being changed
+        return _process_patch_add(
+            patch_operation, patched_obj, value, context, matched_path, unmatched, index, shared=cow is None
+        )
     elif value == obj_value:
         # Already present with desired value, nothing to do
         return None
     elif patch_operation.get('replace', True):
-        context[key] = value
+        # Value is not owned, so it is copied before being changed by later operations
+        index.set_item(context, key, value)
         processed_path = path_from_list(matched_path)
         return dict(op='replace', path=processed_path, value=value)
     else:
         raise JsonPatchFailException('Unable to add, path already exists {0}'.format(patch_operation))
 
-def process_patch_copy(patch_operation, patched_obj):
-    src_path = path_to_list(patch_operation['from'])
-    dst_path = path_to_list(patch_operation['path'])
-    src_value, src_context, src_key, src_matched_path, src_unmatched_path = resolve_path(patched_obj, src_path)
-    dst_value, dst_context, dst_key, dst_matched_path, dst_unmatched_path = resolve_path(patched_obj, dst_path)
-    if src_unmatched_path:
+def process_patch_copy(patch_operation, patched_obj, index=None, cow=None):
+    if index is None:
+        index = ListIndex()
+    src_path = compile_path(patch_operation['from'])
+    dst_path = compile_path(patch_operation['path'])
+    src_value, src_context, src_key, src_matched_path, src_unmatched = resolve_tokens(patched_obj, src_path, index, cow)
+    dst_value, dst_context, dst_key, dst_matched_path, dst_unmatched = resolve_tokens(patched_obj, dst_path, index, cow)
+    if src_unmatched:
         raise JsonPatchFailException('Unable to copy, from path not found {0}'.format(patch_operation))
-    elif src_value == dst_value:
+    # Copied value is not shared with the source, which may be changed or contain the destination
+    value = set_queried_value(dst_path, copy.deepcopy(src_value))
+    if dst_unmatched:
+        # Handle as add to resolve any queries in the destination
+        return _process_patch_add(
+            patch_operation, patched_obj, value, dst_context, dst_matched_path, dst_unmatched, index, shared=cow is None
+        )
+    elif value == dst_value:
         # Already present with desired value, nothing to do
         return None
-    elif dst_unmatched_path:
-        # Handle as add to resolve any queries in the destination
-        return _process_patch_add(patch_operation, patched_obj, src_value, dst_context, dst_matched_path, dst_unmatched_path)
-    else:
-        dst_context[dst_key] = src_value
-        src_processed_path = path_from_list(src_matched_path)
-        dst_processed_path = path_from_list(dst_matched_path)
-        return {'op': 'copy', 'path': dst_processed_path, 'from': src_processed_path}
-
-def process_patch_move(patch_operation, patched_obj):
-    src_path = path_to_list(patch_operation['from'])
-    dst_path = path_to_list(patch_operation['path'])
-    src_value, src_context, src_key, src_matched_path, src_unmatched_path = resolve_path(patched_obj, src_path)
-    dst_value, dst_context, dst_key, dst_matched_path, dst_unmatched_path = resolve_path(patched_obj, dst_path)
-    if src_unmatched_path:
+    index.set_item(dst_context, dst_key, value)
+    if isinstance(dst_context, list):
+        # Copying to a list index inserts rather than replacing the item
+        return dict(op='replace', path=path_from_list(dst_matched_path), value=value)
+    src_processed_path = path_from_list(src_matched_path)
+    dst_processed_path = path_from_list(dst_matched_path)
+    return {'op': 'copy', 'path': dst_processed_path, 'from': src_processed_path}
+
+def _path_after_remove(path, removed_path):
+    """ Return path, given as a list of keys, as it is after the list item at removed_path is removed """
+    depth = len(removed_path) - 1
+    if len(path) > depth and path[:depth] == removed_path[:depth] and int(path[depth]) > int(removed_path[depth]):
+        return path[:depth] + [str(int(path[depth]) - 1)] + path[depth + 1:]
+    return path
+
+def process_patch_move(patch_operation, patched_obj, index=None, cow=None):
+    """
+    Process move, with the source removed first as specified by RFC 6902,
+    so that the processed destination path allows for list items shifted by
+    removing the source.
+    """
+    if index is None:
+        index = ListIndex()
+    src_path = compile_path(patch_operation['from'])
+    dst_path = compile_path(patch_operation['path'])
+    src_value, src_context, src_key, src_matched_path, src_unmatched = resolve_tokens(patched_obj, src_path, index, cow)
+    if cow is not None and not src_unmatched:
+        # Value may be changed in place when added by list query
+        src_value = cow.own_item(src_context, src_key, index)
+    dst_value, dst_context, dst_key, dst_matched_path, dst_unmatched = resolve_tokens(patched_obj, dst_path, index, cow)
+    if src_unmatched:
         raise JsonPatchFailException('Unable to move, from path not found {0}'.format(patch_operation))
-    elif dst_unmatched_path:
+    elif not dst_unmatched and dst_matched_path == src_matched_path:
+        # Moved to itself, nothing to do
+        return None
+    elif is_within(dst_matched_path, src_matched_path):
+        raise JsonPatchFailException('Unable to move, path is within from path {0}'.format(patch_operation))
+
+    remove_operation = dict(op='remove', path=path_from_list(src_matched_path))
+    processed_dst_path = dst_matched_path
+    if isinstance(src_context, list):
+        processed_dst_path = _path_after_remove(dst_matched_path, src_matched_path)
+    if dst_unmatched:
         # Handle as remove then add resolve any queries in the destination
-        src_processed_path = path_from_list(src_matched_path)
-        del src_context[src_key]
+        add_operation = _process_patch_add(
+            patch_operation, patched_obj, src_value, dst_context, processed_dst_path, dst_unmatched, index
+        )
+        index.delete_item(src_context, src_key)
+        return [remove_operation, add_operation]
+    elif src_value == dst_value:
+        # Already present at destination, only remove the source
+        index.delete_item(src_context, src_key)
+        return remove_operation
+
+    # The destination may be in the same list as the source, so is set first
+    index.set_item(dst_context, dst_key, src_value)
+    if not is_within(src_matched_path, dst_matched_path):
+        index.delete_item(src_context, src_key)
+    if isinstance(dst_context, list):
+        # Moving to a list index inserts rather than replacing the item
         return [
-            dict(op='remove', path=src_processed_path),
-            _process_patch_add(patch_operation, patched_obj, src_value, dst_context, dst_matched_path, dst_unmatched_path)
+            remove_operation,
+            dict(op='replace', path=path_from_list(processed_dst_path), value=copy.deepcopy(src_value)),
         ]
-    else:
-        dst_context[dst_key] = src_value
-        del src_context[src_key]
-        src_processed_path = path_from_list(src_matched_path)
-        dst_processed_path = path_from_list(dst_matched_path)
-        return {'op': 'copy', 'path': dst_processed_path, 'from': src_processed_path}
-
-def process_patch_remove(patch_operation, patched_obj):
-    path = path_to_list(patch_operation['path'])
-    obj_value, context, key, matched_path, unmatched_path = resolve_path(patched_obj, path)
-    if unmatched_path:
+    elif is_within(processed_dst_path, src_matched_path):
+        # Not a valid move once shifted into the source path, so copy then remove
+        return [
+            {'op': 'copy', 'path': path_from_list(dst_matched_path), 'from': remove_operation['path']},
+            remove_operation,
+        ]
+    return {'op': 'move', 'path': path_from_list(processed_dst_path), 'from': remove_operation['path']}
+
+def process_patch_remove(patch_operation, patched_obj, index=None, cow=None):
+    if index is None:
+        index = ListIndex()
+    path = compile_path(patch_operation['path'])
+    obj_value, context, key, matched_path, unmatched = resolve_tokens(patched_obj, path, index, cow)
+    if unmatched:
         return None
     else:
-        del context[key]
+        index.delete_item(context, key)
         processed_path = path_from_list(matched_path)
         return dict(op='remove', path=processed_path)
 
-def process_patch_replace(patch_operation, patched_obj):
-    path = path_to_list(patch_operation['path'])
+def process_patch_replace(patch_operation, patched_obj, index=None, cow=None):
+    if index is None:
+        index = ListIndex()
+    path = compile_path(patch_operation['path'])
     value = copy.deepcopy(patch_operation.get('value'))
-    obj_value, context, key, matched_path, unmatched_path = resolve_path(patched_obj, path)
-    if unmatched_path:
+    obj_value, context, key, matched_path, unmatched = resolve_tokens(patched_obj, path, index, cow)
+    if unmatched:
         raise JsonPatchFailException('Unable to replace, path not found {0}'.format(patch_operation))
     elif value == obj_value:
         # Already present with desired value, nothing to do
         return None
     else:
-        context[key] = value
+        # Value is not owned, so it is copied before being changed by later operations
+        index.set_item(context, key, value)
         processed_path = path_from_list(matched_path)
         return dict(op='replace', path=processed_path, value=value)
 
-def process_patch_test(patch_operation, patched_obj):
-    path = path_to_list(patch_operation['path'])
+def process_patch_test(patch_operation, patched_obj, index=None):
+    path = compile_path(patch_operation['path'])
     value = patch_operation.get('value')
     allowed_states = patch_operation.get('state', ['equal'])
     if not isinstance(allowed_states, list):
         allowed_states = [allowed_states]
-    obj_value, context, key, matched_path, unmatched_path = resolve_path(patched_obj, path)
-    if unmatched_path:
+    obj_value, context, key, matched_path, unmatched = resolve_tokens(patched_obj, path, index)
+    if unmatched:
         if 'absent' in allowed_states:
             return None
         else:
@@ -313,37 +701,43 @@ def process_patch_test(patch_operation, patched_obj):
         raise JsonPatchFailException('Test failed {0}'.format(patch_operation))
 
 def process_patch(json_patch, existing):
+    """
+    Process patch against existing object, returning processed patch and
+    patched object. The patched object shares unchanged values with existing.
+    """
     processed_patch = []
-    patched_obj = copy.deepcopy(existing)
-    patch_operations = copy.deepcopy(json_patch)
+    # Containers are copied from existing as they are changed
+    cow = CopyOnWrite()
+    patched_obj = cow.copy(existing)
+    patch_operations = list(json_patch)
+    # List query index shared by operations
+    index = ListIndex()
 
     while patch_operations:
         patch_operation = patch_operations.pop(0)
 
         op = patch_operation.get('op')
         if op == 'add':
-            patch_operation = process_patch_add(patch_operation, patched_obj)
+            patch_operation = process_patch_add(patch_operation, patched_obj, index, cow)
         elif op == 'copy':
-            patch_operation = process_patch_copy(patch_operation, patched_obj)
+            patch_operation = process_patch_copy(patch_operation, patched_obj, index, cow)
         elif op == 'move':
-            patch_operation = process_patch_move(patch_operation, patched_obj)
+            patch_operation = process_patch_move(patch_operation, patched_obj, index, cow)
         elif op == 'remove':
-            patch_operation = process_patch_remove(patch_operation, patched_obj)
+            patch_operation = process_patch_remove(patch_operation, patched_obj, index, cow)
         elif op == 'replace':
-            patch_operation = process_patch_replace(patch_operation, patched_obj)
+            patch_operation = process_patch_replace(patch_operation, patched_obj, index, cow)
         elif op == 'test':
             test_operations = patch_operation.get('operations')
             test_path = patch_operation.get('path')
             try:
-                patch_operation = process_patch_test(patch_operation, patched_obj)
+                patch_operation = process_patch_test(patch_operation, patched_obj, index)
                 if test_operations:
-                    # Set path for operations if unset
-                    for operation in test_operations:
-                        if 'path' not in operation:
-                            operation['path'] = test_path
-                    # Add test operations to the beginning of patch operations list
-                    test_operations.extend(patch_operations)
-                    patch_operations = test_operations
+                    # Add test operations to the beginning of patch operations list, setting path if unset
+                    patch_operations = [
+                        operation if 'path' in operation else dict(operation, path=test_path)
+                        for operation in test_operations
+                    ] + patch_operations
             except JsonPatchFailException:
                 if test_operations == None:
                     raise
@@ -360,7 +754,275 @@ def process_patch(json_patch, existing):
 
     return processed_patch, patched_obj
 
-class KubernetesJsonPatchModule(K8sAnsibleMixin):
+def _list_index(key):
+    """ Return list index given by key, without leading zeros, or None """
+    if match_num.match(key) and (key == '0' or key[0] != '0'):
+        return int(key)
+    return None
+
+def _get_value(doc, path, operation):
+    value = doc
+    for key in path:
+        if isinstance(value, dict) and key in value:
+            value = value[key]
+        elif isinstance(value, list) and _list_index(key) is not None and _list_index(key) < len(value):
+            value = value[int(key)]
+        else:
+            raise JsonPatchFailException('Path not found {0}'.format(operation))
+    return value
+
+def _add_value(doc, path, value, operation):
+    if not path:
+        return value
+    context = _get_value(doc, path[:-1], operation)
+    key = path[-1]
+    if isinstance(context, dict):
+        context[key] = value
+    elif isinstance(context, list) and key == '-':
+        context.append(value)
+    elif isinstance(context, list) and _list_index(key) is not None and _list_index(key) <= len(context):
+        context.insert(int(key), value)
+    else:
+        raise JsonPatchFailException('Unable to add, invalid path {0}'.format(operation))
+    return doc
+
+def _remove_value(doc, path, operation):
+    if not path:
+        raise JsonPatchFailException('Unable to remove root {0}'.format(operation))
+    _get_value(doc, path, operation)
+    context = _get_value(doc, path[:-1], operation)
+    if isinstance(context, dict):
+        del context[path[-1]]
+    else:
+        del context[int(path[-1])]
+    return doc
+
+def apply_operation(doc, operation):
+    """
+    Apply JSON patch operation to doc as specified by RFC 6902, without the
+    idempotent adjustments of process_patch. Containers of doc are changed
+    in place and doc is returned, replaced by operations on the root path.
+    Raises JsonPatchFailException if the operation fails.
+    """
+    op = operation.get('op')
+    path = path_to_list(operation['path'])
+    if op == 'test':
+        if _get_value(doc, path, operation) != operation.get('value'):
+            raise JsonPatchFailException('Test failed {0}'.format(operation))
+        return doc
+    elif op == 'add':
+        return _add_value(doc, path, copy.deepcopy(operation.get('value')), operation)
+    elif op == 'remove':
+        return _remove_value(doc, path, operation)
+    elif op == 'replace':
+        _get_value(doc, path, operation)
+        if path:
+            doc = _remove_value(doc, path, operation)
+        return _add_value(doc, path, copy.deepcopy(operation.get('value')), operation)
+    elif op in ('copy', 'move'):
+        from_path = path_to_list(operation['from'])
+        value = _get_value(doc, from_path, operation)
+        if op == 'copy':
+            return _add_value(doc, path, copy.deepcopy(value), operation)
+        if path[:len(from_path)] == from_path and path != from_path:
+            raise JsonPatchFailException('Unable to move, path is within from path {0}'.format(operation))
+        doc = _remove_value(doc, from_path, operation)
+        return _add_value(doc, path, value, operation)
+    raise JsonPatchFailException('No op in {0}'.format(operation))
+
+def apply_patch(json_patch, obj):
+    """ Return copy of obj with JSON patch applied as specified by RFC 6902 """
+    doc = copy.deepcopy(obj)
+    for operation in json_patch:
+        doc = apply_operation(doc, operation)
+    return doc
+
+def is_list_position(key):
+    """ Whether key may be an index or end of a list, so that adding or removing shifts list items """
+    return key == '-' or match_num.match(key) is not None
+
+def is_within(path, ancestor):
+    """ Whether path, given as a list or tuple of keys, is ancestor or a path within it """
+    return tuple(path[:len(ancestor)]) == tuple(ancestor)
+
+class PathMap(object):
+    """
+    Map of paths, given as tuples of keys, to values with lookup of paths
+    by the paths which contain them.
+    """
+
+    def __init__(self):
+        self.values = {}
+        # Set of paths by each path which contains them
+        self.within = {}
+
+    def get(self, path):
+        return self.values.get(path)
+
+    def set(self, path, value=None):
+        if path not in self.values:
+            for length in range(len(path) + 1):
+                self.within.setdefault(path[:length], set()).add(path)
+        self.values[path] = value
+
+    def discard(self, path):
+        if path not in self.values:
+            return
+        del self.values[path]
+        for length in range(len(path) + 1):
+            paths = self.within[path[:length]]
+            paths.discard(path)
+            if not paths:
+                del self.within[path[:length]]
+
+    def contains(self, path, strict=False):
+        """ Whether a path in the map contains path, or is path unless strict """
+        return any(path[:length] in self.values for length in range(len(path) + (0 if strict else 1)))
+
+    def discard_within(self, path, strict=False):
+        """ Discard paths within path, and path itself unless strict """
+        for within_path in list(self.within.get(path, ())):
+            if not strict or within_path != path:
+                self.discard(within_path)
+
+    def discard_containing(self, path):
+        """ Discard paths which contain path, and path itself """
+        for length in range(len(path) + 1):
+            self.discard(path[:length])
+
+    def discard_changed(self, path):
+        """ Discard paths which may refer to other values after a change at path """
+        if path and is_list_position(path[-1]):
+            # Items in the list may be shifted
+            self.discard_within(path[:-1], strict=True)
+        else:
+            self.discard_within(path)
+
+def _drop_known_tests(json_patch):
+    """
+    Drop tests of values known from earlier tests or from values set by
+    earlier operations. These tests were true when processed and so are true
+    when the patch is applied if the earlier tests are.
+    """
+    known = PathMap()
+    minimized = []
+    for operation in json_patch:
+        op = operation['op']
+        path = tuple(path_to_list(operation['path']))
+        if op == 'test':
+            if known.contains(path):
+                continue
+            known.set(path)
+            minimized.append(operation)
+            continue
+
+        value_known = op in ('add', 'remove', 'replace')
+        known.discard_changed(path)
+        if op in ('copy', 'move'):
+            from_path = tuple(path_to_list(operation['from']))
+            value_known = known.contains(from_path)
+            if op == 'move':
+                known.discard_changed(from_path)
+        if not value_known:
+            known.discard_containing(path)
+        elif op != 'remove' and path[-1:] != ('-',):
+            known.set(path)
+        minimized.append(operation)
+    return minimized
+
+def _drop_superseded(json_patch):
+    """
+    Drop operations which set or remove values that are later replaced or
+    removed, scanning from the last operation. Values which are read by
+    tests, copies or moves in between, or which may be shifted in a list,
+    are kept.
+    """
+    # Index of later operation in kept by path replaced or removed
+    superseding = PathMap()
+    kept = []
+    for operation in reversed(json_patch):
+        op = operation['op']
+        path = tuple(path_to_list(operation['path']))
+        if op == 'move' and superseding.contains(path, strict=True):
+            # Moved within a value which is later replaced or removed, only removing the source is seen
+            operation = dict(op='remove', path=operation['from'])
+            op = 'remove'
+            path = tuple(path_to_list(operation['path']))
+        if op in ('add', 'copy', 'remove', 'replace') and superseding.contains(path, strict=True):
+            # Within a value which is later replaced or removed
+            continue
+        later = superseding.get(path)
+        if later is not None and op in ('add', 'remove', 'replace'):
+            later_operation = kept[later]
+            if op == 'remove':
+                if later_operation['op'] == 'add':
+                    # Adding sets the value whether or not it was removed
+                    continue
+            elif later_operation['op'] != 'remove':
+                if op == 'add' and later_operation['op'] == 'replace':
+                    # The path may not exist without this add
+                    kept[later] = dict(later_operation, op='add')
+                continue
+            elif op == 'replace':
+                continue
+        kept.append(operation)
+
+        if op == 'test':
+            superseding.discard_within(path)
+            superseding.discard_containing(path)
+        elif op in ('add', 'copy', 'move', 'remove'):
+            superseding.discard_changed(path)
+        if op in ('copy', 'move'):
+            from_path = tuple(path_to_list(operation['from']))
+            superseding.discard_within(from_path)
+            superseding.discard_containing(from_path)
+            if op == 'move':
+                superseding.discard_changed(from_path)
+        if op in ('remove', 'replace') or (op == 'add' and path and not is_list_position(path[-1])):
+            superseding.set(path, len(kept) - 1)
+    kept.reverse()
+    return kept
+
+def _merge_adds(json_patch):
+    """
+    Merge operations within a value added by the previous operation into
+    the added value.
+    """
+    minimized = []
+    merged = None
+    for operation in json_patch:
+        previous = minimized[-1] if minimized else None
+        if previous is not None and previous['op'] == 'add' and operation['op'] in ('add', 'remove', 'replace'):
+            previous_path = path_to_list(previous['path'])
+            path = path_to_list(operation['path'])
+            if len(path) > len(previous_path) and is_within(path, previous_path) and previous_path[-1] != '-':
+                if previous is not merged:
+                    # Added values may be shared with the patched object
+                    previous = dict(previous, value=copy.deepcopy(previous.get('value')))
+                try:
+                    apply_operation(previous['value'], dict(operation, path=path_from_list(path[len(previous_path):])))
+                except JsonPatchFailException:
+                    pass
+                else:
+                    minimized[-1] = merged = previous
+                    continue
+        minimized.append(operation)
+    return minimized
+
+def minimize_patch(json_patch):
+    """
+    Return processed patch with the same effect in fewer operations.
+    Operations superseded by later operations on the same or a parent path
+    are dropped, operations within a value just added are merged into the
+    added value and tests of values which are already known are dropped.
+    A patch of only tests is minimized to an empty patch.
+    """
+    minimized = _merge_adds(_drop_superseded(_drop_known_tests(json_patch)))
+    if all(operation['op'] == 'test' for operation in minimized):
+        return []
+    return minimized
+
+class KubernetesJsonPatchModule(K8sConfigSchedulerMixin, K8sConfigDiscoveryMixin, K8sConfigAgentMixin, K8sAnsibleMixin):
 
     @property
     def validate_spec(self):
@@ -375,10 +1037,43 @@ class KubernetesJsonPatchModule(K8sAnsibleMixin):
         argument_spec = copy.deepcopy(COMMON_ARG_SPEC)
         argument_spec.update(copy.deepcopy(NAME_ARG_SPEC))
         argument_spec.update(copy.deepcopy(AUTH_ARG_SPEC))
+        argument_spec.update(copy.deepcopy(DISCOVERY_ARG_SPEC))
+        argument_spec.update(copy.deepcopy(AGENT_ARG_SPEC))
+        argument_spec.update(copy.deepcopy(SCHEDULER_ARG_SPEC))
         argument_spec['patch'] = dict(
             type='list',
             default=[],
         )
+        argument_spec['label_selectors'] = dict(
+            type='list',
+            elements='str',
+            default=[],
+        )
+        argument_spec['field_selectors'] = dict(
+            type='list',
+            elements='str',
+            default=[],
+        )
+        argument_spec['names'] = dict(
+            type='list',
+            elements='str',
+        )
+        argument_spec['all_namespaces'] = dict(
+            type='bool',
+            default=False,
+        )
+        argument_spec['parallelism'] = dict(
+            type='int',
+            default=10,
+        )
+        argument_spec['optimistic_concurrency'] = dict(
+            type='bool',
+            default=False,
+        )
+        argument_spec['conflict_retries'] = dict(
+            type='int',
+            default=5,
+        )
         return argument_spec
 
     def __init__(self, k8s_kind=None, *args, **kwargs):
@@ -405,23 +1100,27 @@ class KubernetesJsonPatchModule(K8sAnsibleMixin):
         self.name = self.params.get('name')
         self.namespace = self.params.get('namespace')
         self.patch = self.params.get('patch')
+        self.names = self.params.get('names')
+        self.parallelism = max(1, self.params.get('parallelism') or 1)
 
     def execute_module(self):
         self.client = self.get_api_client()
         resource = self.find_resource(self.kind, self.api_version, fail=True)
+        if self.names is not None or self.params.get('label_selectors') or self.params.get('field_selectors'):
+            self.exit_json(**self.patch_selected(resource))
         params = dict(name = self.name)
         if self.namespace:
             params['namespace'] = self.namespace
         try:
             existing = resource.get(**params).to_dict()
-        except (DynamicApiError, ForbiddenError, NotFoundError):
+        except DynamicApiError as exc:
             self.fail_json(
                 msg='Failed to retrieve requested object: {0}'.format(exc.body),
                 error=exc.status, status=exc.status, reason=exc.reason
             )
 
         try:
-            processed_patch, patched_obj = process_patch(self.patch, existing)
+            processed_patch, patched_obj = self.process(existing)
         except JsonPatchFailException as e:
             self.fail_json(
                 msg='Failed processing json_patch: {0}'.format(e)
@@ -429,18 +1128,216 @@ class KubernetesJsonPatchModule(K8sAnsibleMixin):
 
         # If no changes in the processed patch, then just apply
         if not processed_patch:
-            self.exit_json(changed=False, resource=existing)
+            self.exit_json(changed=False, resource=existing, request_stats=self.request_stats())
         # For check mode, just return locally patched object
         if self.check_mode:
-            self.exit_json(changed=True, resource=patched_obj, json_patch=processed_patch)
+            self.exit_json(
+                changed=True, resource=patched_obj, json_patch=processed_patch, request_stats=self.request_stats()
+            )
         try:
-            k8s_obj = resource.patch(processed_patch, content_type='application/json-patch+json', **params).to_dict()
-            self.exit_json(changed=True, resource=k8s_obj, json_patch=processed_patch)
+            k8s_obj, processed_patch, attempts = self.send_patch(
+                resource, self.name, self.namespace, existing['metadata'].get('resourceVersion'), processed_patch
+            )
+        except JsonPatchFailException as e:
+            self.fail_json(
+                msg='Failed processing json_patch: {0}'.format(e)
+            )
         except DynamicApiError as exc:
             self.fail_json(
                 msg="Failed to patch object: {0}".format(exc.body),
                 error=exc.status, status=exc.status, reason=exc.reason
             )
+        if not processed_patch:
+            # Changed by another client to the patched state
+            self.exit_json(changed=False, resource=k8s_obj, attempts=attempts, request_stats=self.request_stats())
+        self.exit_json(
+            changed=True, resource=k8s_obj, json_patch=processed_patch, attempts=attempts,
+            request_stats=self.request_stats()
+        )
+
+    def process(self, existing):
+        """ Process patch against existing object, returning minimized processed patch and patched object """
+        processed_patch, patched_obj = process_patch(self.patch, existing)
+        return minimize_patch(processed_patch), patched_obj
+
+    def send_patch(self, resource, name, namespace, resource_version, processed_patch):
+        """
+        Send processed patch for object, returning the patched object, the
+        processed patch sent and the number of attempts. With
+        optimistic_concurrency the patch is guarded by a test of the
+        resource_version. If rejected, the patch is processed against the
+        object retrieved again and resent, unless now empty in which case
+        the retrieved object is returned with the empty patch.
+        """
+        params = dict(name=name)
+        if namespace:
+            params['namespace'] = namespace
+        guard = self.params.get('optimistic_concurrency') and resource_version
+        attempts = 0
+        while True:
+            attempts += 1
+            json_patch = processed_patch
+            if guard:
+                json_patch = [dict(op='test', path='/metadata/resourceVersion', value=resource_version)] + json_patch
+            try:
+                k8s_obj = resource.patch(json_patch, content_type='application/json-patch+json', **params).to_dict()
+                return k8s_obj, processed_patch, attempts
+            except DynamicApiError as exc:
+                # A failed test is rejected as unprocessable, a concurrent update as a conflict
+                if not guard or exc.status not in (409, 422) or attempts > self.params.get('conflict_retries'):
+                    raise
+                existing = resource.get(**params).to_dict()
+                if exc.status == 422 and existing['metadata'].get('resourceVersion') == resource_version:
+                    # Rejected for some reason other than the test
+                    raise exc
+                delay = self.request_scheduler.retry_delay(exc, attempts - 1)
+            resource_version = existing['metadata'].get('resourceVersion')
+            processed_patch = self.process(existing)[0]
+            if not processed_patch:
+                return existing, processed_patch, attempts
+            time.sleep(delay)
+
+    def list_targets(self, resource, limit=500):
+        """
+        Generate objects selected by label_selectors, field_selectors and
+        names, listed in pages of limit.
+        """
+        params = dict(limit=limit)
+        if resource.namespaced and not self.params.get('all_namespaces'):
+            params['namespace'] = self.namespace
+        field_selectors = list(self.params.get('field_selectors') or [])
+        if self.names is not None and len(self.names) == 1:
+            # Select a single name on the server
+            field_selectors.append('metadata.name={0}'.format(self.names[0]))
+        if self.params.get('label_selectors'):
+            params['label_selector'] = ','.join(self.params.get('label_selectors'))
+        if field_selectors:
+            params['field_selector'] = ','.join(field_selectors)
+        while True:
+            result = resource.get(**params).to_dict()
+            for item in result.get('items', []):
+                if self.names is not None and item['metadata']['name'] not in self.names:
+                    continue
+                # List items do not include kind and apiVersion
+                item['apiVersion'] = resource.group_version
+                item['kind'] = resource.kind
+                yield item
+            token = result.get('metadata', {}).get('continue')
+            if not token:
+                return
+            params['_continue'] = token
+
+    def patch_selected(self, resource):
+        """
+        Patch objects selected by label_selectors, field_selectors and names,
+        returning the module result. The patch is processed against each
+        object as listed and objects with changes are then patched
+        concurrently. Errors are reported per object.
+        """
+        if resource.namespaced and not self.namespace and not self.params.get('all_namespaces'):
+            self.fail_json(
+                msg='namespace or all_namespaces is required to select {0} objects'.format(resource.kind)
+            )
+        results = []
+        pending = []
+        try:
+            for existing in self.list_targets(resource):
+                metadata = existing['metadata']
+                result = dict(
+                    apiVersion=existing['apiVersion'],
+                    kind=existing['kind'],
+                    name=metadata['name'],
+                    namespace=metadata.get('namespace'),
+                    changed=False,
+                )
+                results.append(result)
+                try:
+                    processed_patch, patched_obj = self.process(existing)
+                except JsonPatchFailException as e:
+                    result['error'] = dict(msg='Failed processing json_patch: {0}'.format(e))
+                    continue
+                if not processed_patch:
+                    continue
+                result['changed'] = True
+                result['json_patch'] = processed_patch
+                if self.check_mode:
+                    # For check mode, just return locally patched object
+                    result['resource'] = patched_obj
+                else:
+                    pending.append((result, metadata.get('resourceVersion')))
+        except DynamicApiError as exc:
+            self.fail_json(
+                msg='Failed to list objects: {0}'.format(exc.body),
+                error=exc.status, status=exc.status, reason=exc.reason
+            )
+        matched = len(results)
+
+        found = set(result['name'] for result in results)
+        params_namespace = None
+        if resource.namespaced and not self.params.get('all_namespaces'):
+            params_namespace = self.namespace
+        for name in self.names or []:
+            if name not in found:
+                found.add(name)
+                results.append(dict(
+                    apiVersion=resource.group_version,
+                    kind=resource.kind,
+                    name=name,
+                    namespace=params_namespace,
+                    changed=False,
+                    error=dict(msg='Object not found', status=404),
+                ))
+
+        def _patch(item):
+            result, resource_version = item
+            try:
+                result['resource'], result['json_patch'], result['attempts'] = self.send_patch(
+                    resource, result['name'], result['namespace'], resource_version, result['json_patch']
+                )
+                if not result['json_patch']:
+                    # Changed by another client to the patched state
+                    result['changed'] = False
+                    del result['json_patch']
+            except JsonPatchFailException as e:
+                result['changed'] = False
+                result['error'] = dict(msg='Failed processing json_patch: {0}'.format(e))
+            except DynamicApiError as exc:
+                result['changed'] = False
+                result['error'] = dict(
+                    msg='Failed to patch object: {0}'.format(exc.body), status=exc.status, reason=exc.reason
+                )
+
+        if pending:
+            workers = min(self.parallelism, len(pending))
+            self.set_connection_pool_size(workers)
+            pool = ThreadPool(workers)
+            try:
+                pool.map(_patch, pending)
+            finally:
+                pool.close()
+                pool.join()
+
+        errors = [
+            '{0}: {1}'.format(result['name'], result['error']['msg']) for result in results if 'error' in result
+        ]
+        changed = sum(1 for result in results if result['changed'])
+        module_result = dict(
+            changed=changed > 0,
+            results=results,
+            summary=dict(
+                matched=matched,
+                changed=changed,
+                unchanged=len(results) - changed - len(errors),
+                failed=len(errors),
+            ),
+            request_stats=self.request_stats(),
+        )
+        if errors:
+            self.fail_json(
+                msg='Failed patching {0} of {1} objects: {2}'.format(len(errors), len(results), '; '.join(errors)),
+                **module_result
+            )
+        return module_result
 
 
 def main():
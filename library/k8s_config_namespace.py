@@ -45,6 +45,50 @@ options:
   name:
     description:
     - Namespace name to create
+  discovery_cache_dir:
+    description:
+    - Directory for the persistent API discovery cache shared by k8s_config modules.
+    - Defaults to C(~/.kube/cache/k8s_config).
+    type: path
+  discovery_cache_ttl:
+    description:
+    - Seconds before the API discovery cache is refreshed.
+    - The cache is also refreshed if the cluster server version changes.
+    type: int
+    default: 600
+  discovery_cache_invalidate:
+    description:
+    - Discard the API discovery cache before running.
+    type: bool
+    default: false
+  agent_socket:
+    description:
+    - Unix socket of the k8s_config agent which holds API connections open between module runs.
+    - Set by the k8s_config action plugins when called with C(agent) on a local connection.
+    - Requests are made directly if the agent is not running.
+    type: path
+  request_qps:
+    description:
+    - Average number of API requests per second, with bursts up to C(request_burst).
+    - The default of C(0) does not limit the request rate.
+    type: float
+    default: 0
+  request_burst:
+    description:
+    - Number of API requests which may be made at once before C(request_qps) applies.
+    type: int
+    default: 10
+  request_retries:
+    description:
+    - Number of times to retry API requests which fail with status 429, 500, 503 or 504, waiting for
+      C(Retry-After) if given or else backing off exponentially.
+    - Create requests, and JSON patches appending to lists which do not start with a C(test) operation, are only
+      retried on status 429, as they may have been processed despite a server error.
+    - Patch and replace requests are also retried on conflict, other than for server-side apply and
+      updates conditional on C(resourceVersion).
+    - A retried delete which is then not found succeeds, as the object was deleted by an earlier attempt.
+    type: int
+    default: 5
 
 requirements:
 - "python >= 3.7"
@@ -84,6 +128,9 @@ import traceback
 
 from ansible.module_utils.k8s.common import AUTH_ARG_SPEC
 from ansible.module_utils.k8s.raw import KubernetesRawModule
+from ansible.module_utils.k8s_config_agent import AGENT_ARG_SPEC, K8sConfigAgentMixin
+from ansible.module_utils.k8s_config_discovery import DISCOVERY_ARG_SPEC, K8sConfigDiscoveryMixin
+from ansible.module_utils.k8s_config_scheduler import SCHEDULER_ARG_SPEC, K8sConfigSchedulerMixin
 
 NAMESPACE_ARG_SPEC = {
     'name': {
@@ -97,7 +144,7 @@ NAMESPACE_ARG_SPEC = {
     },
 }
 
-class KubernetesNamespace(KubernetesRawModule):
+class KubernetesNamespace(K8sConfigSchedulerMixin, K8sConfigDiscoveryMixin, K8sConfigAgentMixin, KubernetesRawModule):
     def __init__(self, *args, **kwargs):
         super(KubernetesNamespace, self).__init__(*args, k8s_kind='Namespace', **kwargs)
 
@@ -106,6 +153,9 @@ class KubernetesNamespace(KubernetesRawModule):
         """ argspec property builder """
         argument_spec = copy.deepcopy(AUTH_ARG_SPEC)
         argument_spec.update(NAMESPACE_ARG_SPEC)
+        argument_spec.update(DISCOVERY_ARG_SPEC)
+        argument_spec.update(AGENT_ARG_SPEC)
+        argument_spec.update(SCHEDULER_ARG_SPEC)
         return argument_spec
 
     def execute_module(self):
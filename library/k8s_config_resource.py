@@ -13,6 +13,8 @@ import sys
 try:
     from openshift.dynamic.exceptions import \
         DynamicApiError, NotFoundError, ConflictError, ForbiddenError, KubernetesValidateMissing
+    from openshift.dynamic.apply import annotate, apply_patch, dict_merge
+    from openshift.dynamic.resource import ResourceInstance
 except ImportError:
     pass
 
@@ -59,15 +61,206 @@ options:
     - C(replace) will create resources if they do not exist or replace them if they do
     - C(merge) and C(strategic-merge) will attempt to create resources if they do not exist and patch them if they do.
     - C(strategic-merge) falls back to attempting merge patch if resource does not support strategic-merge patch.
+    - C(server-side-apply) will use Kubernetes server-side apply with a single apply request per resource.
+      Existing objects are not retrieved individually, they are listed for each kind and namespace unless
+      C(prefetch_threshold) is C(0), to report whether the apply changed them. Objects which are not listed, as
+      when listing is not permitted, are reported as changed.
     choices:
     - apply
     - create
     - delete
     - merge
     - replace
+    - server-side-apply
     - strategic-merge
     type: str
     version_added: "2.9"
+  field_manager:
+    description:
+    - Field manager name used with the C(server-side-apply) action.
+    type: str
+    default: k8s_config
+  force_conflicts:
+    description:
+    - Force field ownership conflicts with other field managers with the C(server-side-apply) action.
+    type: bool
+    default: false
+  parallelism:
+    description:
+    - Number of resource definitions to process concurrently.
+    - With the default of C(1) definitions are processed one at a time in the order given.
+    - With a value greater than C(1) definitions are treated as independent and processed on a pool of
+      worker threads. Results are still returned in the order given.
+    - Errors are reported per object and do not stop processing of other definitions in the same
+      dependency wave.
+    type: int
+    default: 1
+  ordering:
+    description:
+    - Order in which resource definitions are processed.
+    - C(file) processes definitions in the order given.
+    - C(dependency) groups definitions into waves processed in order, namespaces, custom resource definitions,
+      service accounts and RBAC, other resources and then custom resources for definitions in the same run.
+      Definitions within a wave are processed concurrently according to C(parallelism).
+    - With C(dependency) custom resource definitions are waited on to be established before later waves.
+    - With C(dependency) and the C(delete) action the waves are processed in reverse order.
+    - With C(dependency) in check mode, custom resources of custom resource definitions which are not yet
+      created are reported as changed with C(method=create), or as unchanged with the C(delete) action.
+    choices:
+    - dependency
+    - file
+    type: str
+    default: file
+  established_timeout:
+    description:
+    - Seconds to wait for custom resource definitions to be established with C(ordering=dependency).
+    type: int
+    default: 60
+  wait:
+    description:
+    - Wait for processed objects to be ready, or to be removed with the C(delete) action.
+    - Each object is watched from the returned resource version rather than polled.
+    - Without C(wait_condition) or C(wait_jsonpath), Deployments wait for rollout to complete, Jobs wait to
+      complete and custom resource definitions wait to be established. Other objects are ready once they exist.
+    - Not used in check mode.
+    type: bool
+    default: false
+  wait_timeout:
+    description:
+    - Seconds to wait for all objects to be ready with C(wait).
+    type: int
+    default: 120
+  wait_condition:
+    description:
+    - Status condition for objects to be ready with C(wait), given as C(type) and optional C(status), which
+      defaults to C(True), and C(reason).
+    type: dict
+  wait_jsonpath:
+    description:
+    - JSONPath expression, such as C({.status.phase}), which must be present for objects to be ready with C(wait),
+      with any value including empty or false unless C(wait_jsonpath_value) is given.
+    type: str
+  wait_jsonpath_value:
+    description:
+    - Value which the C(wait_jsonpath) expression must match.
+    type: str
+  content_hash:
+    description:
+    - Store a hash of each resource definition in the C(k8s-config.redhat-cop.github.io/content-hash)
+      annotation of the object.
+    - When the annotation of the existing object matches the definition the object is reported as unchanged
+      and no write request is made.
+    - Changes made by others to an object with a matching annotation are not reverted.
+    - Does not apply to the C(delete) and C(server-side-apply) actions.
+    type: bool
+    default: false
+  diff_ignore:
+    description:
+    - Fields ignored when comparing objects to determine if they changed, given as dotted paths.
+    - Fields set by the API server are ignored by default.
+    type: list
+    elements: str
+    default:
+    - metadata.generation
+    - metadata.managedFields
+    - metadata.resourceVersion
+    - status
+  server_dry_run:
+    description:
+    - In check mode, send write requests with server-side dry run so results include defaulting and admission.
+    - Dry run requests require the same permissions as the actual write.
+    - When C(false) check mode results are computed locally from the existing objects.
+    type: bool
+    default: true
+  check_mode_parallelism:
+    description:
+    - Number of resource definitions to process concurrently in check mode, if greater than C(parallelism).
+    - Errors in check mode are reported per object.
+    type: int
+    default: 10
+  prune_selector:
+    description:
+    - Label selector for objects owned by this configuration.
+    - Objects matching the selector which are not in the resource definitions are deleted after all definitions
+      are processed successfully.
+    - Objects are listed for each kind and namespace of the resource definitions and of C(prune_kinds).
+    - Orphaned objects are deleted concurrently, each with a request having a C(uid) precondition so that objects
+      recreated since being listed are kept. Delete collection requests are not used, as they cannot be
+      limited to the listed objects.
+    - Resource definitions should include labels matching the selector.
+    - Not used with the C(delete) action.
+    type: str
+  prune_kinds:
+    description:
+    - Additional kinds to prune, given as C(apiVersion) and C(kind), for kinds that may have no remaining
+      resource definitions.
+    - Namespaced kinds are pruned in C(namespace) and the namespaces of the resource definitions.
+    type: list
+    elements: dict
+  prefetch_threshold:
+    description:
+    - Minimum number of definitions of the same kind in the same namespace for which existing objects are
+      retrieved with a single paginated list request rather than a request per object.
+    - If listing is not permitted, existing objects are retrieved individually.
+    - Set to C(0) to always retrieve existing objects individually.
+    - With the C(server-side-apply) action existing objects are listed for any number of definitions, and
+      with C(0) are not retrieved.
+    type: int
+    default: 10
+  result_format:
+    description:
+    - Format of objects returned in C(resources).
+    - C(full) returns complete objects as returned by the API server.
+    - C(summary) returns the C(apiVersion), C(kind), C(name), C(namespace), C(uid), C(resourceVersion)
+      and C(changed) status of each object.
+    - A list of JSONPath expressions, such as C({.status.phase}), returns a dict of each expression to
+      its value for each object. Expressions with C([*]) give a list of values.
+    type: raw
+    default: full
+  discovery_cache_dir:
+    description:
+    - Directory for the persistent API discovery cache shared by k8s_config modules.
+    - Defaults to C(~/.kube/cache/k8s_config).
+    type: path
+  discovery_cache_ttl:
+    description:
+    - Seconds before the API discovery cache is refreshed.
+    - The cache is also refreshed if the cluster server version changes.
+    type: int
+    default: 600
+  discovery_cache_invalidate:
+    description:
+    - Discard the API discovery cache before running.
+    type: bool
+    default: false
+  agent_socket:
+    description:
+    - Unix socket of the k8s_config agent which holds API connections open between module runs.
+    - Set by the k8s_config action plugins when called with C(agent) on a local connection.
+    - Requests are made directly if the agent is not running.
+    type: path
+  request_qps:
+    description:
+    - Average number of API requests per second, with bursts up to C(request_burst).
+    - The default of C(0) does not limit the request rate.
+    type: float
+    default: 0
+  request_burst:
+    description:
+    - Number of API requests which may be made at once before C(request_qps) applies.
+    type: int
+    default: 10
+  request_retries:
+    description:
+    - Number of times to retry API requests which fail with status 429, 500, 503 or 504, waiting for
+      C(Retry-After) if given or else backing off exponentially.
+    - Create requests, and JSON patches appending to lists which do not start with a C(test) operation, are only
+      retried on status 429, as they may have been processed despite a server error.
+    - Patch and replace requests are also retried on conflict, other than for server-side apply and
+      updates conditional on C(resourceVersion).
+    - A retried delete which is then not found succeeds, as the object was deleted by an earlier attempt.
+    type: int
+    default: 5
 
 requirements:
   - "python >= 2.7"
@@ -83,44 +276,213 @@ result:
   type: complex
   contains:
     resources:
-      description: List of resources created, deleted, patched, or found.
+      description: List of resources created, deleted, patched, or found, formatted as given by C(result_format).
+      returned: success
+      type: list
+    results:
+      description:
+      - Per-object results in the order definitions were processed.
+      - Each item gives the C(apiVersion), C(kind), C(name), C(namespace) and C(changed) status of one object.
+      - When processing fails with C(parallelism) greater than C(1) or in check mode, failed objects include an C(error) with
+        the failure C(msg), C(status) and C(reason).
+      - With C(ordering=dependency) each item includes the C(wave) in which it was processed.
+      - Custom resources which would be created in check mode with C(ordering=dependency) include C(method=create).
+      - Objects of later waves which are not processed after a failure with C(ordering=dependency) include
+        C(skipped=true) and a C(msg) naming the failed objects.
+      returned: always
+      type: list
+    diff:
+      description:
+      - In diff mode, the changed paths of each changed object with values before and after.
+      returned: changed
+      type: list
+    pruned:
+      description:
+      - With C(prune_selector), the C(apiVersion), C(kind), C(name) and C(namespace) of each object pruned.
+      returned: success
+      type: list
+    waves:
+      description:
+      - With C(ordering=dependency), the C(name) and object C(count) of each wave in the order processed.
       returned: success
       type: list
+    request_stats:
+      description:
+      - Counts of API C(requests), C(retries), C(conflict_retries) and C(throttled) requests, and
+        C(throttled_seconds) spent waiting on C(request_qps).
+      returned: success
+      type: dict
 '''
 
 import copy
+import hashlib
+import json
+import os
+import time
+
+from multiprocessing.pool import ThreadPool
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible_collections.kubernetes.core.plugins.module_utils.common import (
     K8sAnsibleMixin, COMMON_ARG_SPEC, NAME_ARG_SPEC, RESOURCE_ARG_SPEC, AUTH_ARG_SPEC,
-    WAIT_ARG_SPEC, DELETE_OPTS_ARG_SPEC)
+    DELETE_OPTS_ARG_SPEC)
+from ansible.module_utils.k8s_config_diff import (
+    DEFAULT_DIFF_IGNORE, compile_ignore, diff_paths, format_diff, objects_differ)
+from ansible.module_utils.k8s_config_agent import AGENT_ARG_SPEC, K8sConfigAgentMixin
+from ansible.module_utils.k8s_config_discovery import DISCOVERY_ARG_SPEC, K8sConfigDiscoveryMixin
+from ansible.module_utils.k8s_config_result import RESULT_FORMAT_ARG_SPEC, result_formatter
+from ansible.module_utils.k8s_config_scheduler import SCHEDULER_ARG_SPEC, K8sConfigSchedulerMixin
+from ansible.module_utils.k8s_config_wait import (
+    WATCH_WAIT_ARG_SPEC, WaitFailedException, crd_ready, ready_check, wait_for_object)
+from ansible.module_utils.k8s_config_yaml import YAMLError, load_all
+
 
+class ResourceActionFailException(Exception):
+    def __init__(self, msg, **kwargs):
+        super(ResourceActionFailException, self).__init__(msg)
+        self.msg = msg
+        self.kwargs = kwargs
 
 def deep_merge(source, merge_patch):
-    def _dict_merge(result, patch):
-        for k, v in patch.items():
-            if isinstance(v, dict) and k in result and isinstance(result[k], dict):
-                _dict_merge(result[k], v)
-            elif isinstance(v, list) and k in result and isinstance(result[k], list):
-                _list_merge(result[k], v)
-            else:
-                result[k] = copy.deepcopy(v)
-
-    def _list_merge(result, patch):
-        for i, v in enumerate(patch):
-            if isinstance(v, dict) and i < len(result) and isinstance(result[i], dict):
-                _dict_merge(result[i], v)
-            elif isinstance(v, list) and i < len(result) and isinstance(result[i], list):
-                _list_merge(result[i], v)
-            else:
-                result[k] = copy.deepcopy(v)
+    """
+    Apply a JSON merge patch (RFC 7386) to source and return the result.
+
+    Source is not modified. Only dicts along patched paths are copied, untouched
+    values are shared with source and patch values are shared with the result.
+    """
+    if not isinstance(merge_patch, dict):
+        return merge_patch
+    if not isinstance(source, dict):
+        source = {}
+    result = None
+    for k, v in merge_patch.items():
+        if v is None:
+            if k in source:
+                if result is None:
+                    result = dict(source)
+                del result[k]
+        else:
+            merged = deep_merge(source.get(k), v)
+            if k not in source or merged is not source[k]:
+                if result is None:
+                    result = dict(source)
+                result[k] = merged
+    return source if result is None else result
+
+
+CONTENT_HASH_ANNOTATION = 'k8s-config.redhat-cop.github.io/content-hash'
+
+
+def content_hash(definition):
+    """
+    Canonical hash of a resource definition, excluding any content hash
+    annotation already present in the definition.
+    """
+    metadata = definition.get('metadata', {})
+    annotations = metadata.get('annotations') or {}
+    if CONTENT_HASH_ANNOTATION in annotations:
+        metadata = dict(metadata)
+        metadata['annotations'] = dict(annotations)
+        del metadata['annotations'][CONTENT_HASH_ANNOTATION]
+        if not metadata['annotations']:
+            del metadata['annotations']
+        definition = dict(definition, metadata=metadata)
+    canonical = json.dumps(definition, sort_keys=True, separators=(',', ':'))
+    return 'sha256:' + hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def set_content_hash(definition, digest):
+    """ Return copy of definition with content hash annotation set """
+    metadata = definition.get('metadata', {})
+    annotations = dict(metadata.get('annotations') or {})
+    annotations[CONTENT_HASH_ANNOTATION] = digest
+    return dict(definition, metadata=dict(metadata, annotations=annotations))
+
+# Minimum number of concurrent requests for independent operations, such as
+# deleting objects when pruning and waiting for objects to be ready
+BULK_PARALLELISM = 10
+
+
+def prune_result(resource, namespace, name):
+    return dict(
+        apiVersion=resource.group_version,
+        kind=resource.kind,
+        name=name,
+        namespace=namespace,
+    )
+
+# Dependency waves in the order applied, reversed for delete
+DEPENDENCY_WAVES = ('namespaces', 'crds', 'rbac', 'workloads', 'custom-resources')
 
-    res = copy.deepcopy(source)
-    _dict_merge(res, merge_patch)
-    return res
-    
+NAMESPACE_KINDS = frozenset([
+    ('', 'Namespace'),
+    ('project.openshift.io', 'Project'),
+    ('project.openshift.io', 'ProjectRequest'),
+])
 
-class KubernetesResourceModule(K8sAnsibleMixin):
+CRD_KINDS = frozenset([
+    ('apiextensions.k8s.io', 'CustomResourceDefinition'),
+])
+
+RBAC_KINDS = frozenset([
+    ('', 'ServiceAccount'),
+    ('rbac.authorization.k8s.io', 'ClusterRole'),
+    ('rbac.authorization.k8s.io', 'ClusterRoleBinding'),
+    ('rbac.authorization.k8s.io', 'Role'),
+    ('rbac.authorization.k8s.io', 'RoleBinding'),
+])
+
+def api_group(api_version):
+    if api_version and '/' in api_version:
+        return api_version.split('/')[0]
+    return ''
+
+def iter_definitions(definitions):
+    for definition in definitions:
+        if definition.get('kind', '').endswith('List') and 'items' in definition:
+            for item in iter_definitions(definition['items']):
+                yield item
+        else:
+            yield definition
+
+def custom_resource_kinds(definitions):
+    """ Return set of (group, kind) defined by CustomResourceDefinitions in definitions """
+    kinds = set()
+    for definition in iter_definitions(definitions):
+        if (api_group(definition.get('apiVersion')), definition.get('kind')) in CRD_KINDS:
+            spec = definition.get('spec', {})
+            kind = spec.get('names', {}).get('kind')
+            if spec.get('group') and kind:
+                kinds.add((spec['group'], kind))
+    return kinds
+
+def dependency_wave(definition, custom_kinds):
+    key = (api_group(definition.get('apiVersion')), definition.get('kind'))
+    if key in NAMESPACE_KINDS:
+        return 'namespaces'
+    elif key in CRD_KINDS:
+        return 'crds'
+    elif key in RBAC_KINDS:
+        return 'rbac'
+    elif key in custom_kinds:
+        return 'custom-resources'
+    else:
+        return 'workloads'
+
+def dependency_waves(definitions, custom_kinds, reverse=False):
+    """
+    Group definitions into dependency waves, returning a list of
+    (wave, indexes) with indexes into definitions in their original order.
+    Empty waves are omitted.
+    """
+    wave_indexes = dict((wave, []) for wave in DEPENDENCY_WAVES)
+    for i, definition in enumerate(definitions):
+        wave_indexes[dependency_wave(definition, custom_kinds)].append(i)
+    waves = reversed(DEPENDENCY_WAVES) if reverse else DEPENDENCY_WAVES
+    return [(wave, wave_indexes[wave]) for wave in waves if wave_indexes[wave]]
+
+
+class KubernetesResourceModule(K8sConfigSchedulerMixin, K8sConfigDiscoveryMixin, K8sConfigAgentMixin, K8sAnsibleMixin):
 
     @property
     def validate_spec(self):
@@ -136,11 +498,65 @@ class KubernetesResourceModule(K8sAnsibleMixin):
         argument_spec.update(copy.deepcopy(NAME_ARG_SPEC))
         argument_spec.update(copy.deepcopy(RESOURCE_ARG_SPEC))
         argument_spec.update(copy.deepcopy(AUTH_ARG_SPEC))
+        argument_spec.update(copy.deepcopy(DISCOVERY_ARG_SPEC))
+        argument_spec.update(copy.deepcopy(AGENT_ARG_SPEC))
+        argument_spec.update(copy.deepcopy(SCHEDULER_ARG_SPEC))
+        argument_spec.update(copy.deepcopy(WATCH_WAIT_ARG_SPEC))
+        argument_spec.update(copy.deepcopy(RESULT_FORMAT_ARG_SPEC))
         argument_spec['action'] = dict(
             type='str',
-            choices=['apply', 'create', 'delete', 'merge', 'replace', 'strategic-merge'],
+            choices=['apply', 'create', 'delete', 'merge', 'replace', 'server-side-apply', 'strategic-merge'],
             default='apply',
         )
+        argument_spec['field_manager'] = dict(
+            type='str',
+            default='k8s_config',
+        )
+        argument_spec['force_conflicts'] = dict(
+            type='bool',
+            default=False,
+        )
+        argument_spec['parallelism'] = dict(
+            type='int',
+            default=1,
+        )
+        argument_spec['ordering'] = dict(
+            type='str',
+            choices=['dependency', 'file'],
+            default='file',
+        )
+        argument_spec['established_timeout'] = dict(
+            type='int',
+            default=60,
+        )
+        argument_spec['content_hash'] = dict(
+            type='bool',
+            default=False,
+        )
+        argument_spec['diff_ignore'] = dict(
+            type='list',
+            elements='str',
+            default=DEFAULT_DIFF_IGNORE,
+        )
+        argument_spec['server_dry_run'] = dict(
+            type='bool',
+            default=True,
+        )
+        argument_spec['check_mode_parallelism'] = dict(
+            type='int',
+            default=10,
+        )
+        argument_spec['prune_selector'] = dict(
+            type='str',
+        )
+        argument_spec['prune_kinds'] = dict(
+            type='list',
+            elements='dict',
+        )
+        argument_spec['prefetch_threshold'] = dict(
+            type='int',
+            default=10,
+        )
         return argument_spec
 
     def __init__(self, k8s_kind=None, *args, **kwargs):
@@ -155,57 +571,103 @@ class KubernetesResourceModule(K8sAnsibleMixin):
         self.fail_json = self.module.fail_json
         self.fail = self.module.fail_json
         self.exit_json = self.module.exit_json
+        self.warn = self.module.warn
 
         super(KubernetesResourceModule, self).__init__(*args, **kwargs)
 
         self.client = None
         self.warnings = []
+        self.resource_cache = {}
 
         self.kind = k8s_kind or self.params.get('kind')
         self.api_version = self.params.get('api_version')
         self.name = self.params.get('name')
         self.namespace = self.params.get('namespace')
         self.action = self.params.get('action')
+        self.parallelism = max(1, self.params.get('parallelism') or 1)
+        self.ordering = self.params.get('ordering')
+        self.custom_resource_kinds = set()
+        self.prefetch_threshold = self.params.get('prefetch_threshold')
+        self.prefetched = {}
+        self.diff_ignore = compile_ignore(self.params.get('diff_ignore'))
+        self.diffs = {}
+        self.local_check_mode = self.check_mode and not self.params.get('server_dry_run')
+        try:
+            self.format_result = result_formatter(self.params.get('result_format'))
+        except ValueError as e:
+            self.fail_json(msg=str(e))
         self.set_resource_definitions()
 
     def set_resource_definitions(self):
         resource_definition = self.params.get('resource_definition')
-        resource_definitions = []
+        src = self.params.get('src')
 
         if resource_definition:
             if isinstance(resource_definition, string_types):
-                try:
-                    resource_definitions = yaml.safe_load_all(resource_definition)
-                except (IOError, yaml.YAMLError) as exc:
-                    self.fail(msg="Error loading resource_definition: {0}".format(exc))
+                self.resource_definitions = self.load_definitions(resource_definition)
             elif isinstance(resource_definition, list):
-                resource_definitions = resource_definition
+                self.resource_definitions = [item for item in resource_definition if item]
             else:
-                resource_definitions = [resource_definition]
+                self.resource_definitions = [resource_definition]
         elif src:
-            resource_definitions = self.load_resource_definitions(src)
+            self.resource_definitions = self.load_resource_definitions(src)
         else:
-            resource_definitions = [dict(
+            self.resource_definitions = [dict(
                 kind=self.kind,
                 apiVersion=self.api_version,
                 metadata=dict(name=self.name)
             )]
 
-        self.resource_definitions = [item for item in resource_definitions if item]
+    def load_definitions(self, stream):
+        """ Return non-empty documents of YAML string or file """
+        try:
+            return [item for item in load_all(stream) if item]
+        except (IOError, YAMLError) as exc:
+            self.fail(msg="Error loading resource_definition: {0}".format(exc))
+
+    def load_resource_definitions(self, src):
+        """ Load definitions from src path """
+        path = os.path.normpath(src)
+        if not os.path.exists(path):
+            self.fail(msg="Error accessing {0}. Does the file exist?".format(path))
+        with open(path, 'r') as f:
+            return self.load_definitions(f)
+
+    def find_resource(self, kind, api_version, fail=False):
+        # Resource lookups are repeated for every definition of the same kind,
+        # so remember them for the life of the module run.
+        key = (kind, api_version)
+        resource = self.resource_cache.get(key)
+        if not resource:
+            resource = super(KubernetesResourceModule, self).find_resource(kind, api_version, fail=fail)
+            if resource:
+                self.resource_cache[key] = resource
+        return resource
+
+    def find_definition_resource(self, kind, api_version):
+        # Custom resources for CustomResourceDefinitions in this run are not yet
+        # known to the cluster, these are resolved after the CRDs are applied.
+        if self.ordering == 'dependency' \
+        and (api_group(api_version), kind) in self.custom_resource_kinds:
+            return self.find_resource(kind, api_version, fail=False)
+        return self.find_resource(kind, api_version, fail=True)
 
     def flatten_list_kind(self, list_resource, definitions):
-        flattened = []
+        """ Generate (resource, definition) for items of a List definition """
         parent_api_version = list_resource.group_version if list_resource else None
         parent_kind = list_resource.kind[:-4] if list_resource else None
         for definition in definitions.get('items', []):
-            resource = self.find_resource(definition.get('kind', parent_kind), definition.get('apiVersion', parent_api_version), fail=True)
-            flattened.append((resource, self.set_defaults(resource, definition)))
-        return flattened
+            kind = definition.get('kind', parent_kind)
+            api_version = definition.get('apiVersion', parent_api_version)
+            resource = self.find_definition_resource(kind, api_version)
+            if resource:
+                yield resource, self.set_defaults(resource, definition)
+            else:
+                yield None, dict(definition, kind=kind, apiVersion=api_version)
 
     def execute_module(self):
-        changed = False
-        resources = []
         self.client = self.get_api_client()
+        self.custom_resource_kinds = custom_resource_kinds(self.resource_definitions)
 
         flattened_definitions = []
         for definition in self.resource_definitions:
@@ -215,37 +677,442 @@ class KubernetesResourceModule(K8sAnsibleMixin):
                 resource = self.find_resource(kind, api_version, fail=False)
                 flattened_definitions.extend(self.flatten_list_kind(resource, definition))
             else:
-                resource = self.find_resource(kind, api_version, fail=True)
+                resource = self.find_definition_resource(kind, api_version)
+                if resource:
+                    definition = self.set_defaults(resource, definition)
                 flattened_definitions.append((resource, definition))
 
-        for (resource, definition) in flattened_definitions:
-            definition = self.set_defaults(resource, definition)
-            resource, resource_changed = self.perform_action(resource, definition)
+        if self.ordering == 'dependency':
+            waves = dependency_waves(
+                [definition for (resource, definition) in flattened_definitions],
+                self.custom_resource_kinds,
+                reverse=self.action == 'delete',
+            )
+        else:
+            waves = [(None, list(range(len(flattened_definitions))))]
+
+        outcomes = [None] * len(flattened_definitions)
+        # Result fields for objects which are not processed
+        unprocessed = {}
+        failed = False
+        failures = []
+        for wave, indexes in waves:
+            if failed:
+                # Later waves may depend on objects that failed
+                for i in indexes:
+                    outcomes[i] = (None, False, None)
+                    unprocessed[i] = dict(skipped=True, msg='Skipped after failure of {0}'.format(', '.join(failures)))
+                continue
+
+            for i in indexes:
+                resource, definition = flattened_definitions[i]
+                if not resource:
+                    # Kinds of CustomResourceDefinitions in this run are not known in check mode,
+                    # as the definitions are not created
+                    resource = self.find_resource(definition['kind'], definition['apiVersion'], fail=not self.check_mode)
+                    if not resource:
+                        if self.action == 'delete':
+                            outcomes[i] = (None, False, None)
+                        else:
+                            outcomes[i] = (definition, True, None)
+                            unprocessed[i] = dict(method='create')
+                        continue
+                    flattened_definitions[i] = (resource, self.set_defaults(resource, definition))
+            indexes = [i for i in indexes if outcomes[i] is None]
+
+            if self.prefetch_threshold > 0:
+                self.prefetch([flattened_definitions[i] for i in indexes])
+
+            wave_outcomes = self.perform_actions([flattened_definitions[i] for i in indexes])
+            for i, outcome in zip(indexes, wave_outcomes):
+                outcomes[i] = outcome
+                if outcome[2]:
+                    failed = True
+                    definition = flattened_definitions[i][1]
+                    failures.append('{0} {1} in wave {2}'.format(
+                        definition['kind'],
+                        '/'.join(part for part in (
+                            definition['metadata'].get('namespace'), definition['metadata'].get('name')
+                        ) if part),
+                        wave,
+                    ))
+            # Kinds are not shared between waves
+            self.prefetched.clear()
+
+            if wave == 'crds' and not failed and not self.check_mode and self.action != 'delete':
+                try:
+                    self.wait_for_crds_established(
+                        [flattened_definitions[i] + (outcomes[i][0],) for i in indexes]
+                    )
+                except ResourceActionFailException as e:
+                    self.fail_json(msg=e.msg, **e.kwargs)
+
+        pruned = []
+        prune_errors = []
+        if self.params.get('prune_selector') and self.action != 'delete' and not failed:
+            pruned, prune_errors = self.prune(flattened_definitions)
+
+        if self.params.get('wait') and not self.check_mode and not failed:
+            outcomes = self.wait_for_outcomes(flattened_definitions, outcomes)
+
+        wave_index = {}
+        for wave, indexes in waves:
+            for i in indexes:
+                wave_index[i] = wave
+
+        changed = False
+        resources = []
+        results = []
+        errors = []
+        diff_keys = []
+        for i, ((resource, definition), (k8s_obj, resource_changed, error)) in enumerate(zip(flattened_definitions, outcomes)):
             if resource_changed:
                 changed = True
-            resources.append(resource)
+            if self.params.get('wait'):
+                resources.append(self.format_result(k8s_obj, resource_changed))
+            else:
+                resources.append(k8s_obj)
+            result = dict(
+                apiVersion=definition['apiVersion'],
+                kind=definition['kind'],
+                name=definition['metadata'].get('name'),
+                namespace=definition['metadata'].get('namespace'),
+                changed=resource_changed,
+            )
+            diff_keys.append((result['kind'], result['namespace'], result['name']))
+            if wave_index[i]:
+                result['wave'] = wave_index[i]
+            result.update(unprocessed.get(i, {}))
+            if error:
+                result['error'] = error
+                errors.append(error['msg'])
+            results.append(result)
 
-        self.exit_json(
+        module_result = dict(
             changed=changed,
             resources=resources,
+            results=results,
+            request_stats=self.request_stats(),
         )
+        if self.params.get('prune_selector'):
+            module_result['pruned'] = pruned
+            if pruned:
+                module_result['changed'] = True
+        if self.diffs:
+            module_result['diff'] = [
+                format_diff(
+                    self.diffs[key],
+                    '{0} {1}'.format(key[0], '/'.join(part for part in key[1:] if part)),
+                )
+                for key in diff_keys if key in self.diffs
+            ]
+        if self.ordering == 'dependency':
+            module_result['waves'] = [dict(name=wave, count=len(indexes)) for wave, indexes in waves]
+
+        if errors and len(results) == 1:
+            # A single definition fails with its error, as when run per definition
+            module_result.update(results[0]['error'])
+            self.fail_json(**module_result)
+        if errors:
+            self.fail_json(
+                msg='Failed processing {0} of {1} resources: {2}'.format(
+                    len(errors), len(results), '; '.join(errors)
+                ),
+                **module_result
+            )
+        if prune_errors:
+            self.fail_json(msg='Failed pruning resources: {0}'.format('; '.join(prune_errors)), **module_result)
+
+        self.exit_json(**module_result)
+
+    def prefetch(self, flattened_definitions):
+        """
+        Retrieve existing objects with a list request for each kind and
+        namespace with at least prefetch_threshold definitions, or with any
+        definitions for server-side apply. Objects of kinds which are not
+        prefetched are retrieved individually, other than for server-side
+        apply.
+        """
+        threshold = 1 if self.action == 'server-side-apply' else self.prefetch_threshold
+        groups = {}
+        for resource, definition in flattened_definitions:
+            namespace = definition['metadata'].get('namespace')
+            if resource.namespaced and not namespace:
+                continue
+            key = (resource.group_version, resource.kind, namespace)
+            if key in self.prefetched:
+                continue
+            group = groups.setdefault(key, (resource, namespace, set()))
+            group[2].add(definition['metadata'].get('name'))
+
+        for key, (resource, namespace, names) in groups.items():
+            if len(names) < threshold or 'list' not in resource.verbs:
+                continue
+            try:
+                self.prefetched[key] = dict(
+                    (obj.metadata.name, obj) for obj in self.list_existing(resource, namespace, names=names)
+                )
+            except (DynamicApiError, ForbiddenError):
+                # Listing may not be permitted where get is, fall back to get per object
+                pass
+
+    def list_existing(self, resource, namespace, label_selector=None, names=None, limit=500):
+        """ Return list of existing objects, listed in pages of limit, optionally only those in names """
+        existing = []
+        params = dict(limit=limit)
+        if namespace:
+            params['namespace'] = namespace
+        if label_selector:
+            params['label_selector'] = label_selector
+        while True:
+            result = resource.get(**params).to_dict()
+            for item in result.get('items', []):
+                if names is not None and item['metadata']['name'] not in names:
+                    continue
+                # List items do not include kind and apiVersion
+                item['apiVersion'] = resource.group_version
+                item['kind'] = resource.kind
+                existing.append(ResourceInstance(self.client, item))
+            token = result.get('metadata', {}).get('continue')
+            if not token:
+                return existing
+            params['_continue'] = token
+
+    def prune(self, flattened_definitions):
+        """
+        Delete objects matching prune_selector which are not in the resource
+        definitions. Objects are listed for each kind and namespace of the
+        definitions and of prune_kinds. Each object is deleted with a uid
+        precondition, so that objects replaced since listing are kept. Returns
+        lists of pruned objects and of error messages.
+        """
+        selector = self.params.get('prune_selector')
+        desired = set()
+        targets = {}
+        namespaces = set([self.namespace]) if self.namespace else set()
+        for resource, definition in flattened_definitions:
+            if not resource:
+                # Kind defined in this run in check mode, which has no objects to prune
+                continue
+            namespace = definition['metadata'].get('namespace') if resource.namespaced else None
+            desired.add((resource.group, resource.kind, namespace, definition['metadata'].get('name')))
+            targets[(resource.group, resource.kind, namespace)] = resource
+            if namespace:
+                namespaces.add(namespace)
+
+        for prune_kind in self.params.get('prune_kinds') or []:
+            resource = self.find_resource(prune_kind.get('kind'), prune_kind.get('apiVersion'), fail=True)
+            if not resource.namespaced:
+                targets[(resource.group, resource.kind, None)] = resource
+            for namespace in namespaces if resource.namespaced else []:
+                targets[(resource.group, resource.kind, namespace)] = resource
+
+        pruned = []
+        errors = []
+        orphans = []
+        for (group, kind, namespace), resource in sorted(targets.items(), key=lambda t: (t[0][0], t[0][1], t[0][2] or '')):
+            try:
+                existing = self.list_existing(resource, namespace, label_selector=selector)
+            except DynamicApiError as exc:
+                errors.append('Failed to list {0} for prune: {1}'.format(kind, exc.body))
+                continue
+            # Namespaced kinds without a namespace are listed in all namespaces
+            orphans.extend(sorted(
+                (
+                    (resource, obj) for obj in existing
+                    if (group, kind, obj.metadata.namespace, obj.metadata.name) not in desired
+                ),
+                key=lambda orphan: (orphan[1].metadata.namespace or '', orphan[1].metadata.name)
+            ))
+
+        def _prune_delete(orphan):
+            resource, obj = orphan
+            result = prune_result(resource, obj.metadata.namespace, obj.metadata.name)
+            if self.local_check_mode:
+                return result, None
+            params = dict(
+                name=obj.metadata.name,
+                namespace=obj.metadata.namespace,
+                body=dict(apiVersion='v1', kind='DeleteOptions', preconditions=dict(uid=obj.metadata.uid)),
+            )
+            params.update(self.dry_run_params())
+            try:
+                resource.delete(**params)
+            except (NotFoundError, ConflictError):
+                # Deleted or replaced since listing
+                return None, None
+            except DynamicApiError as exc:
+                return None, 'Failed to delete {0} {1} for prune: {2}'.format(resource.kind, obj.metadata.name, exc.body)
+            return result, None
+
+        if orphans:
+            workers = min(len(orphans), max(self.parallelism, BULK_PARALLELISM))
+            self.set_connection_pool_size(workers)
+            pool = ThreadPool(workers)
+            try:
+                for result, error in pool.map(_prune_delete, orphans):
+                    if result:
+                        pruned.append(result)
+                    if error:
+                        errors.append(error)
+            finally:
+                pool.close()
+                pool.join()
+
+        return pruned, errors
+
+    def perform_actions(self, flattened_definitions):
+        """
+        Process definitions, returning a list of (k8s_obj, changed, error) in
+        the order of flattened_definitions. Objects are formatted for results
+        as they are processed unless needed for wait.
+
+        With parallelism definitions are processed on a pool of worker threads,
+        otherwise one at a time in order. Errors, including unexpected
+        exceptions, are returned per object and do not stop processing of
+        other definitions, as when the module is run per definition.
+        """
+        parallelism = self.parallelism
+        if self.check_mode:
+            # Check mode requests do not change state and so may run concurrently
+            parallelism = max(parallelism, self.params.get('check_mode_parallelism') or 1)
+        def _outcome(item):
+            resource, definition = item
+            k8s_obj, changed = self.perform_action(resource, definition)
+            if not self.params.get('wait'):
+                # Only keep the formatted result unless the object is needed for waiting
+                k8s_obj = self.format_result(k8s_obj, changed)
+            return k8s_obj, changed, None
+
+        def _perform_action(item):
+            try:
+                return _outcome(item)
+            except ResourceActionFailException as e:
+                error = dict(msg=e.msg)
+                error.update(e.kwargs)
+                return None, False, error
+            except Exception as e:
+                # Report unexpected errors per object rather than discarding other outcomes
+                return None, False, dict(msg='Failed to process object: {0}: {1}'.format(type(e).__name__, e))
+
+        if parallelism < 2 or len(flattened_definitions) < 2:
+            return [_perform_action(item) for item in flattened_definitions]
+
+        workers = min(parallelism, len(flattened_definitions))
+        self.set_connection_pool_size(workers)
+        pool = ThreadPool(workers)
+        try:
+            return pool.map(_perform_action, flattened_definitions)
+        finally:
+            pool.close()
+            pool.join()
+
+    def wait_for_crds_established(self, processed):
+        """
+        Watch CustomResourceDefinitions for the Established condition, given
+        as a list of (resource, definition, k8s_obj).
+        """
+        deadline = time.time() + self.params.get('established_timeout')
+        for resource, definition, k8s_obj in processed:
+            if definition['kind'] != 'CustomResourceDefinition':
+                continue
+            name = definition['metadata']['name']
+            try:
+                wait_for_object(resource, name, None, crd_ready, deadline - time.time(), k8s_obj=k8s_obj)
+            except WaitFailedException:
+                raise ResourceActionFailException(
+                    msg='Timed out waiting for CustomResourceDefinition {0} to be established'.format(name)
+                )
+            except DynamicApiError as exc:
+                raise ResourceActionFailException(
+                    msg='Failed to watch CustomResourceDefinition {0}: {1}'.format(name, exc.body),
+                    error=exc.status, status=exc.status, reason=exc.reason
+                )
+
+    def wait_for_outcomes(self, flattened_definitions, outcomes):
+        """
+        Wait for processed objects to be ready, or deleted for the delete
+        action, according to the wait parameters. Waits run concurrently and
+        failures are returned as errors of the outcomes.
+        """
+        deleted = self.action == 'delete'
+        deadline = time.time() + self.params.get('wait_timeout')
+
+        def _wait(item):
+            (resource, definition), (k8s_obj, changed, error) = item
+            if error or (k8s_obj is None and not deleted):
+                return k8s_obj, changed, error
+            try:
+                k8s_obj = wait_for_object(
+                    resource,
+                    definition['metadata']['name'],
+                    definition['metadata'].get('namespace') if resource.namespaced else None,
+                    ready_check(resource.group, resource.kind, self.params),
+                    deadline - time.time(),
+                    k8s_obj=None if deleted else k8s_obj,
+                    deleted=deleted,
+                )
+            except WaitFailedException as e:
+                return k8s_obj, changed, dict(msg=str(e))
+            except DynamicApiError as exc:
+                return k8s_obj, changed, dict(
+                    msg='Failed to watch object: {0}'.format(exc.body),
+                    error=exc.status, status=exc.status, reason=exc.reason
+                )
+            return (None if deleted else k8s_obj), changed, None
+
+        items = list(zip(flattened_definitions, outcomes))
+        workers = max(1, min(len(items), max(self.parallelism, BULK_PARALLELISM)))
+        self.set_connection_pool_size(workers)
+        pool = ThreadPool(workers)
+        try:
+            return pool.map(_wait, items)
+        finally:
+            pool.close()
+            pool.join()
 
     def set_defaults(self, resource, definition):
-        definition['kind'] = resource.kind
-        definition['apiVersion'] = resource.group_version
-        metadata = definition.get('metadata', {})
+        """
+        Return definition with kind, apiVersion, name and namespace set. The
+        definition given is not modified and other fields are shared.
+        """
+        metadata = dict(definition.get('metadata') or {})
         if self.name:
             metadata['name'] = self.name
         if resource.namespaced and self.namespace:
             metadata['namespace'] = self.namespace
-        definition['metadata'] = metadata
-        return definition
+        return dict(definition, kind=resource.kind, apiVersion=resource.group_version, metadata=metadata)
 
     def perform_action(self, resource, definition):
         name = definition['metadata'].get('name')
         namespace = definition['metadata'].get('namespace')
-        existing = None
+        prefetched = self.prefetched.get((resource.group_version, resource.kind, namespace))
+        if prefetched is None:
+            # Server-side apply does not need the existing object, only to report changes
+            existing = None if self.action == 'server-side-apply' else self.get_existing(resource, name, namespace)
+        else:
+            existing = prefetched.get(name)
+
+        if self.params.get('content_hash') and self.action not in ('delete', 'server-side-apply'):
+            digest = content_hash(definition)
+            if existing and existing.metadata.annotations \
+            and existing.metadata.annotations[CONTENT_HASH_ANNOTATION] == digest:
+                return existing.to_dict(), False
+            definition = set_content_hash(definition, digest)
+
+        k8s_obj, changed = self.perform_converge(resource, definition, existing)
+
+        if prefetched is not None and not self.check_mode:
+            # Keep prefetched objects current for later definitions of the same object
+            if k8s_obj and self.action != 'delete':
+                prefetched[name] = ResourceInstance(self.client, k8s_obj)
+            else:
+                prefetched.pop(name, None)
 
+        return k8s_obj, changed
+
+    def get_existing(self, resource, name, namespace):
+        existing = None
         try:
             params = dict(name=name)
             if namespace:
@@ -259,11 +1126,13 @@ class KubernetesResourceModule(K8sAnsibleMixin):
                 # no sys.exc_clear on python3
                 pass
         except (DynamicApiError, ForbiddenError) as exc:
-            self.fail_json(
+            raise ResourceActionFailException(
                 msg='Failed to retrieve requested object: {0}'.format(exc.body),
                 error=exc.status, status=exc.status, reason=exc.reason
             )
+        return existing
 
+    def perform_converge(self, resource, definition, existing):
         if self.action == 'apply':
             return self.perform_apply(resource, definition, existing)
         elif self.action == 'delete':
@@ -273,6 +1142,8 @@ class KubernetesResourceModule(K8sAnsibleMixin):
                 return None, False
         elif self.action == 'create':
             return self.perform_create(resource, definition, existing)
+        elif self.action == 'server-side-apply':
+            return self.perform_server_side_apply(resource, definition, existing)
         elif not existing:
             return self.perform_create(resource, definition, None, fail_on_conflict=True)
         elif self.action == 'merge':
@@ -282,37 +1153,106 @@ class KubernetesResourceModule(K8sAnsibleMixin):
         elif self.action == 'strategic-merge':
             return self.perform_patch(resource, definition, existing, strategic_merge=True)
 
+    def dry_run_params(self):
+        """ Request parameters for server-side dry run in check mode """
+        if self.check_mode:
+            return dict(dry_run='All')
+        return dict()
+
+    def object_changed(self, existing, k8s_obj):
+        """ Compare objects ignoring diff_ignore fields, recording diff in diff mode """
+        if not self.module._diff:
+            return objects_differ(existing, k8s_obj, self.diff_ignore)
+        changes = diff_paths(existing, k8s_obj, self.diff_ignore)
+        if changes:
+            metadata = k8s_obj.get('metadata', {})
+            key = (k8s_obj.get('kind'), metadata.get('namespace'), metadata.get('name'))
+            self.diffs[key] = changes
+        return bool(changes)
+
     def perform_apply(self, resource, definition, existing):
+        name = definition['metadata'].get('name')
+        namespace = definition['metadata'].get('namespace')
+        params = self.dry_run_params()
+        try:
+            if existing:
+                existing_obj, desired = apply_patch(existing.to_dict(), definition)
+                if desired is existing_obj:
+                    return existing_obj, False
+                if self.local_check_mode:
+                    k8s_obj = deep_merge(existing_obj, desired)
+                else:
+                    k8s_obj = resource.patch(
+                        body=desired, name=name, namespace=namespace,
+                        content_type='application/merge-patch+json', **params
+                    ).to_dict()
+            else:
+                existing_obj = {}
+                desired = dict_merge(definition, annotate(definition))
+                if self.local_check_mode:
+                    return desired, True
+                k8s_obj = resource.create(body=desired, namespace=namespace, **params).to_dict()
+        except DynamicApiError as exc:
+            if self.check_mode and isinstance(exc, NotFoundError):
+                # Namespace may be created by an earlier definition
+                return definition, True
+            raise ResourceActionFailException(
+                msg="Failed to apply object: {0}".format(exc.body),
+                error=exc.status, status=exc.status, reason=exc.reason
+            )
+        return k8s_obj, self.object_changed(existing_obj, k8s_obj)
+
+    def perform_server_side_apply(self, resource, definition, existing):
+        name = definition['metadata'].get('name')
         namespace = definition['metadata'].get('namespace')
+        if resource.namespaced and not namespace:
+            raise ResourceActionFailException(
+                msg="Namespace is required for {0}.{1} {2}".format(resource.group_version, resource.kind, name)
+            )
+        params = dict(
+            name=name,
+            content_type='application/apply-patch+yaml',
+            query_params=[('fieldManager', self.params.get('field_manager'))],
+        )
+        if namespace:
+            params['namespace'] = namespace
+        if self.params.get('force_conflicts'):
+            params['query_params'].append(('force', 'true'))
         if self.check_mode:
-            ignored, k8s_obj = apply_object(resource, definition)
-        else:
-            try:
-                k8s_obj = resource.apply(definition, namespace=namespace).to_dict()
-            except DynamicApiError as exc:
-                self.fail_json(
-                    msg="Failed to apply object: {0}".format(exc.body),
-                    error=exc.status, status=exc.status, reason=exc.reason
-                )
-        existing = existing.to_dict() if existing else {}
-        match, diffs = self.diff_objects(existing, k8s_obj)
-        return k8s_obj, not match
+            params['dry_run'] = 'All'
+
+        try:
+            # Apply patch content is YAML, of which JSON is a subset
+            k8s_obj = resource.patch(json.dumps(definition), **params).to_dict()
+        except DynamicApiError as exc:
+            raise ResourceActionFailException(
+                msg="Failed to apply object: {0}".format(exc.body),
+                error=exc.status, status=exc.status, reason=exc.reason
+            )
+
+        if not existing:
+            # Created, or not prefetched
+            return k8s_obj, True
+        if self.check_mode:
+            # Dry run does not update the resource version
+            return k8s_obj, self.object_changed(existing.to_dict(), k8s_obj)
+        return k8s_obj, k8s_obj['metadata'].get('resourceVersion') != existing.metadata.resourceVersion
 
     def perform_create(self, resource, definition, existing, fail_on_conflict=False):
         namespace = definition['metadata'].get('namespace')
         if existing:
             return existing.to_dict(), False
-        if self.check_mode:
+        if self.local_check_mode:
             return definition, True
         try:
-            k8s_obj = resource.create(definition, namespace=namespace).to_dict()
+            k8s_obj = resource.create(definition, namespace=namespace, **self.dry_run_params()).to_dict()
             return k8s_obj, True
-        except ConflictError:
+        except ConflictError as exc:
             # Some resources, like ProjectRequests, can't be created multiple times,
             # because the resources that they create don't match their kind
             # In this case we'll mark it as unchanged and warn the user
             if fail_on_conflict:
-                self.fail_json(
+                raise ResourceActionFailException(
                     msg="Failed to create object: {0}".format(exc.body),
                     error=exc.status, status=exc.status, reason=exc.reason
                 )
@@ -320,11 +1260,14 @@ class KubernetesResourceModule(K8sAnsibleMixin):
                 self.warn(
                     "{0} was not found, but creating it returned a 409 Conflict error. "
                     "This can happen if the resource you are creating does not directly "
-                    "create a resource of the same kind.".format(name)
+                    "create a resource of the same kind.".format(definition['metadata'].get('name'))
                 )
                 return None, False
         except DynamicApiError as exc:
-            self.fail_json(
+            if self.check_mode and isinstance(exc, NotFoundError):
+                # Namespace may be created by an earlier definition
+                return definition, True
+            raise ResourceActionFailException(
                 msg="Failed to create object: {0}".format(exc.body),
                 error=exc.status, status=exc.status, reason=exc.reason
             )
@@ -335,13 +1278,14 @@ class KubernetesResourceModule(K8sAnsibleMixin):
             params['namespace'] = existing.metadata.namespace
         if not existing:
             return None, False
-        if self.check_mode:
+        if self.local_check_mode:
             return existing.to_dict(), True
+        params.update(self.dry_run_params())
         try:
             k8s_obj = resource.delete(**params).to_dict()
             return k8s_obj, True
         except DynamicApiError as exc:
-            self.fail_json(
+            raise ResourceActionFailException(
                 msg="Failed to delete object: {0}".format(exc.body),
                 error=exc.status, status=exc.status, reason=exc.reason
             )
@@ -349,47 +1293,48 @@ class KubernetesResourceModule(K8sAnsibleMixin):
     def perform_patch(self, resource, definition, existing, strategic_merge=False):
         name = definition['metadata'].get('name')
         namespace = definition['metadata'].get('namespace')
-        merged_definition = deep_merge(existing.to_dict(), definition)
+        existing_obj = existing.to_dict()
+        if self.local_check_mode:
+            k8s_obj = deep_merge(existing_obj, definition)
+            return k8s_obj, self.object_changed(existing_obj, k8s_obj)
         k8s_obj = None
-        if self.check_mode:
-            k8s_obj = merged_definition
-        else:
-            params = dict(name=name)
-            if namespace:
-                params['namespace'] = namespace
-            if strategic_merge:
-                params['content_type'] = 'application/strategic-merge-patch+json'
-                try:
-                    k8s_obj = resource.patch(definition, **params).to_dict()
-                except DynamicApiError as exc:
-                    pass
-            if not k8s_obj:
-                params['content_type'] = 'application/merge-patch+json'
-                try:
-                    k8s_obj = resource.patch(definition, **params).to_dict()
-                except DynamicApiError as exc:
-                   self.fail_json(
-                       msg="Failed to patch object: {0}".format(exc.body),
-                       error=exc.status, status=exc.status, reason=exc.reason
-                   )
-        match, diffs = self.diff_objects(existing.to_dict(), k8s_obj)
-        return k8s_obj, not match
-
-    def perform_replace(self, resource, definition, existing):
-        name = definition['metadata'].get('name')
-        namespace = definition['metadata'].get('namespace')
-        if self.check_mode:
-            k8s_obj = definition
-        else:
+        params = dict(name=name)
+        if namespace:
+            params['namespace'] = namespace
+        params.update(self.dry_run_params())
+        if strategic_merge:
+            params['content_type'] = 'application/strategic-merge-patch+json'
             try:
-                k8s_obj = resource.replace(definition, name=name, namespace=namespace).to_dict()
+                k8s_obj = resource.patch(definition, **params).to_dict()
             except DynamicApiError as exc:
-                self.fail_json(
-                    msg="Failed to replace object: {0}".format(exc.body),
+                pass
+        if not k8s_obj:
+            params['content_type'] = 'application/merge-patch+json'
+            try:
+                k8s_obj = resource.patch(definition, **params).to_dict()
+            except DynamicApiError as exc:
+                raise ResourceActionFailException(
+                    msg="Failed to patch object: {0}".format(exc.body),
                     error=exc.status, status=exc.status, reason=exc.reason
                 )
-        match, diffs = self.diff_objects(existing.to_dict(), k8s_obj)
-        return k8s_obj, not match
+        return k8s_obj, self.object_changed(existing_obj, k8s_obj)
+
+    def perform_replace(self, resource, definition, existing):
+        existing_obj = existing.to_dict()
+        name = definition['metadata'].get('name')
+        namespace = definition['metadata'].get('namespace')
+        if self.local_check_mode:
+            return definition, self.object_changed(existing_obj, definition)
+        try:
+            k8s_obj = resource.replace(
+                definition, name=name, namespace=namespace, **self.dry_run_params()
+            ).to_dict()
+        except DynamicApiError as exc:
+            raise ResourceActionFailException(
+                msg="Failed to replace object: {0}".format(exc.body),
+                error=exc.status, status=exc.status, reason=exc.reason
+            )
+        return k8s_obj, self.object_changed(existing_obj, k8s_obj)
 
 
 def main():
@@ -29,14 +29,21 @@ import os
 import requests
 import subprocess
 import tempfile
-import yaml
 
+import ansible.module_utils
 from ansible.errors import AnsibleError, AnsibleParserError
 from ansible.module_utils._text import to_text
 from ansible.plugins.lookup import LookupBase
 from ansible.template import generate_ansible_template_vars
 from ansible.utils.display import Display
 
+# Role module_utils are shared by the lookup and action plugins
+ROLE_MODULE_UTILS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'module_utils')
+if ROLE_MODULE_UTILS not in ansible.module_utils.__path__:
+    ansible.module_utils.__path__.append(ROLE_MODULE_UTILS)
+
+from ansible.module_utils.k8s_config_yaml import load_all
+
 display = Display()
 
 def apply_env_to_container_templates(env, objects):
@@ -75,7 +82,7 @@ class LookupModule(LookupBase):
         b_contents, show_data = self._loader._get_file_contents(lookupfile)
         contents = to_text(b_contents, errors='surrogate_or_strict')
         ret = []
-        for yaml_document in yaml.safe_load_all(contents):
+        for yaml_document in load_all(contents):
             ret.extend(self.from_definition(yaml_document))
         return ret
 
@@ -105,7 +112,7 @@ class LookupModule(LookupBase):
             convert_data=True, escape_backslashes=False
         )
         ret = []
-        for yaml_document in yaml.safe_load_all(res):
+        for yaml_document in load_all(res):
             ret.extend(self.from_definition(yaml_document))
         return ret
 
@@ -115,7 +122,7 @@ class LookupModule(LookupBase):
         except Exception as err:
             raise AnsibleError('Failed to fetch {}: {}'.format(url, err))
         ret = []
-        for yaml_document in yaml.safe_load_all(resp.text):
+        for yaml_document in load_all(resp.text):
             ret.extend(self.from_definition(yaml_document))
         return ret
 
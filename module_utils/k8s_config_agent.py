@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2019, Johnathan Kupferer
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Local agent holding API connections open across k8s_config module runs.
+
+Each module run is a new process which would otherwise make a new TLS
+connection for every cluster it talks to. With the agent, modules send
+requests over a Unix socket to a long running process which keeps a pool of
+connections per cluster TLS configuration. Authentication headers are
+prepared by the module, so the agent only needs the TLS configuration.
+
+The agent is started by the k8s_config action plugins by running this file:
+
+    python k8s_config_agent.py SOCKET_PATH PARENT_PID
+
+Requests carry cluster credentials, so the socket is kept in a directory
+private to the user and modules only connect to a socket owned by the user.
+It exits when the parent process, ansible-playbook, exits or after being
+idle for AGENT_IDLE_TIMEOUT seconds.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import errno
+import json
+import os
+import re
+import shutil
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
+try:
+    import urllib3
+    from urllib3._collections import HTTPHeaderDict
+    from kubernetes.client import Configuration
+    from kubernetes.client.rest import ApiException, RESTClientObject
+except ImportError:
+    # Missing kubernetes library is reported by K8sAnsibleMixin
+    RESTClientObject = object
+
+try:
+    from ansible.module_utils.k8s_config_discovery import api_client_helper_module
+except ImportError:
+    # Role module_utils are not importable when run as the agent process
+    pass
+
+AGENT_ARG_SPEC = {
+    'agent_socket': {
+        'type': 'path',
+    },
+}
+
+AGENT_IDLE_TIMEOUT = 900
+
+# Private directory for agent sockets, relative to the user home directory
+AGENT_SOCKET_DIR = os.path.join('.ansible', 'k8s_config_agent')
+
+# Configuration attributes which determine the connection pool for a cluster
+AGENT_TLS_CONFIG = ('verify_ssl', 'ssl_ca_cert', 'cert_file', 'key_file', 'assert_hostname', 'proxy')
+
+# TLS configuration attributes given as file paths, which are sent by content
+AGENT_TLS_FILES = ('ssl_ca_cert', 'cert_file', 'key_file')
+
+
+def agent_socket_dir():
+    """
+    Return private directory for agent sockets of the current user, creating
+    it if needed. Raises OSError if it is not private to the user.
+    """
+    path = os.path.join(os.path.expanduser('~'), AGENT_SOCKET_DIR)
+    try:
+        os.makedirs(path, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    check_private_path(path, stat.S_ISDIR)
+    return path
+
+
+def check_private_path(path, is_type):
+    """ Raise OSError unless path is of type, owned by the current user and only accessible to them """
+    st = os.lstat(path)
+    if not is_type(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077:
+        raise OSError(errno.EPERM, 'k8s_config agent path is not private to user', path)
+
+
+def check_agent_socket(socket_path):
+    """ Raise OSError unless socket_path is a socket owned by the current user in a private directory """
+    check_private_path(os.path.dirname(os.path.abspath(socket_path)), stat.S_ISDIR)
+    check_private_path(socket_path, stat.S_ISSOCK)
+
+
+def send_message(sock, header, data=b''):
+    """ Send JSON header line followed by data of the length given in the header """
+    header = dict(header, length=len(data))
+    sock.sendall(json.dumps(header).encode('utf-8') + b'\n' + data)
+
+
+def recv_message(rfile):
+    """ Read JSON header line and data, returning None at end of stream """
+    line = rfile.readline()
+    if not line:
+        return None, None
+    header = json.loads(line.decode('utf-8'))
+    data = rfile.read(header['length']) if header['length'] else b''
+    return header, data
+
+
+class AgentResponse(object):
+    """ Response from agent with the interface of kubernetes RESTResponse """
+
+    def __init__(self, status, reason, headers, data):
+        self.status = status
+        self.reason = reason
+        self.headers = HTTPHeaderDict(headers)
+        self.data = data
+
+    def getheaders(self):
+        return self.headers
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+
+class AgentRESTClient(RESTClientObject):
+    """
+    REST client which sends requests through the agent, falling back to a
+    direct connection for watches, form posts, or if the agent cannot be
+    reached.
+    """
+
+    def __init__(self, socket_path, configuration):
+        super(AgentRESTClient, self).__init__(configuration)
+        self.socket_path = socket_path
+        self.agent_available = True
+        self.tls = {}
+        for key in AGENT_TLS_CONFIG:
+            value = getattr(configuration, key, None)
+            if key in AGENT_TLS_FILES and value:
+                # Kubeconfig credentials are in temporary files which only
+                # last as long as the module process.
+                with open(value, 'rb') as fh:
+                    value = fh.read().decode('utf-8')
+            self.tls[key] = value
+
+    def connect(self):
+        # Credentials are sent to the agent, so never connect to a socket
+        # which another user could have created.
+        check_agent_socket(self.socket_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+            if hasattr(socket, 'SO_PEERCRED'):
+                creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+                if struct.unpack('3i', creds)[1] != os.getuid():
+                    raise socket.error(errno.EPERM, 'k8s_config agent is not run by user')
+        except socket.error:
+            sock.close()
+            raise
+        return sock
+
+    def request(self, method, url, query_params=None, headers=None,
+                body=None, post_params=None, _preload_content=True,
+                _request_timeout=None):
+        if not self.agent_available or post_params \
+           or any(key == 'watch' and value for key, value in query_params or []):
+            return super(AgentRESTClient, self).request(
+                method, url, query_params=query_params, headers=headers, body=body, post_params=post_params,
+                _preload_content=_preload_content, _request_timeout=_request_timeout
+            )
+
+        try:
+            sock = self.connect()
+        except (OSError, socket.error):
+            # Agent has exited or is not trusted, continue with direct connections
+            self.agent_available = False
+            return self.request(
+                method, url, query_params=query_params, headers=headers, body=body,
+                _preload_content=_preload_content, _request_timeout=_request_timeout
+            )
+
+        method = method.upper()
+        headers = dict(headers or {})
+        if 'Content-Type' not in headers:
+            headers['Content-Type'] = 'application/json'
+        if query_params:
+            url += '?' + urlencode(query_params)
+
+        # Encode body as RESTClientObject does
+        data = b''
+        if method in ('POST', 'PUT', 'PATCH', 'OPTIONS', 'DELETE'):
+            if re.search('json', headers['Content-Type'], re.IGNORECASE):
+                if headers['Content-Type'] == 'application/json-patch+json' and not isinstance(body, list):
+                    headers['Content-Type'] = 'application/strategic-merge-patch+json'
+                if body is not None:
+                    data = json.dumps(body).encode('utf-8')
+            elif isinstance(body, bytes):
+                data = body
+            elif isinstance(body, str):
+                data = body.encode('utf-8')
+            elif body is not None:
+                raise ApiException(status=0, reason='Cannot prepare a request message for provided arguments.')
+
+        try:
+            send_message(sock, dict(
+                method=method,
+                url=url,
+                headers=headers,
+                timeout=_request_timeout,
+                tls=self.tls,
+            ), data)
+            rfile = sock.makefile('rb')
+            header, data = recv_message(rfile)
+            rfile.close()
+        except socket.error as e:
+            raise ApiException(status=0, reason='k8s_config agent request failed: {0}'.format(e))
+        finally:
+            sock.close()
+
+        if header is None:
+            raise ApiException(status=0, reason='k8s_config agent closed connection')
+        if 'error' in header:
+            raise ApiException(status=0, reason=header['error'])
+
+        r = AgentResponse(header['status'], header['reason'], header['headers'], data)
+        if _preload_content and sys.version_info[0] > 2:
+            r.data = r.data.decode('utf8')
+        if not 200 <= r.status <= 299:
+            raise ApiException(http_resp=r)
+        return r
+
+
+class K8sConfigAgentMixin(object):
+    """
+    Mixin for k8s_config modules to send API requests through the agent at
+    the agent_socket module parameter, if given and running.
+    """
+
+    def get_api_client(self, **auth_params):
+        get_api_client = super(K8sConfigAgentMixin, self).get_api_client
+        socket_path = self.params.get('agent_socket')
+        if not socket_path or not os.path.exists(socket_path):
+            return get_api_client(**auth_params)
+
+        helper_module = api_client_helper_module(self)
+        dynamic_client = helper_module.DynamicClient
+
+        # Replace the REST client before discovery makes any requests
+        def agent_dynamic_client(api_client, *args, **kwargs):
+            api_client.rest_client = AgentRESTClient(socket_path, api_client.configuration)
+            return dynamic_client(api_client, *args, **kwargs)
+
+        helper_module.DynamicClient = agent_dynamic_client
+        try:
+            return get_api_client(**auth_params)
+        finally:
+            helper_module.DynamicClient = dynamic_client
+
+
+class AgentRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            header, data = recv_message(self.rfile)
+            if header is None:
+                return
+            self.server.touch()
+            try:
+                r = self.server.send_request(header, data)
+            except Exception as e:
+                send_message(self.connection, dict(error='{0}\n{1}'.format(type(e).__name__, e)))
+            else:
+                send_message(self.connection, dict(
+                    status=r.status,
+                    reason=r.reason,
+                    headers=list(r.headers.items()),
+                ), r.data)
+
+
+class AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Agent server with a kubernetes REST client per TLS configuration. Serves
+    until parent_pid exits or no requests have been received for
+    idle_timeout seconds.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, parent_pid=None, idle_timeout=AGENT_IDLE_TIMEOUT):
+        self.socket_path = socket_path
+        self.parent_pid = parent_pid
+        self.idle_timeout = idle_timeout
+        self.last_request = time.time()
+        self.lock = threading.Lock()
+        self.rest_clients = {}
+        self.tls_dir = tempfile.mkdtemp(prefix='k8s_config_agent-')
+        # Bind to a temporary path and rename so that clients never see the
+        # socket before it is listening.
+        bind_path = '{0}.{1}'.format(socket_path, os.getpid())
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, bind_path, AgentRequestHandler)
+        finally:
+            os.umask(umask)
+        os.rename(bind_path, socket_path)
+
+    def touch(self):
+        self.last_request = time.time()
+
+    def rest_client(self, tls):
+        key = json.dumps(tls, sort_keys=True)
+        with self.lock:
+            if key not in self.rest_clients:
+                configuration = Configuration()
+                for attr, value in tls.items():
+                    if attr in AGENT_TLS_FILES and value:
+                        fd, path = tempfile.mkstemp(dir=self.tls_dir)
+                        with os.fdopen(fd, 'wb') as fh:
+                            fh.write(value.encode('utf-8'))
+                        value = path
+                    setattr(configuration, attr, value)
+                self.rest_clients[key] = RESTClientObject(configuration, maxsize=16)
+            return self.rest_clients[key]
+
+    def send_request(self, header, data):
+        timeout = header.get('timeout')
+        if isinstance(timeout, list) and len(timeout) == 2:
+            timeout = urllib3.Timeout(connect=timeout[0], read=timeout[1])
+        elif timeout:
+            timeout = urllib3.Timeout(total=timeout)
+        return self.rest_client(header['tls']).pool_manager.request(
+            header['method'], header['url'],
+            body=data or None,
+            headers=header['headers'],
+            preload_content=True,
+            timeout=timeout,
+        )
+
+    def parent_alive(self):
+        if not self.parent_pid:
+            return True
+        try:
+            os.kill(self.parent_pid, 0)
+        except OSError as e:
+            return e.errno == errno.EPERM
+        return True
+
+    def monitor(self, interval=1):
+        while self.parent_alive() and time.time() - self.last_request < self.idle_timeout:
+            time.sleep(interval)
+        self.shutdown()
+
+    def serve(self):
+        monitor = threading.Thread(target=self.monitor)
+        monitor.daemon = True
+        monitor.start()
+        try:
+            self.serve_forever()
+        finally:
+            self.server_close()
+            shutil.rmtree(self.tls_dir, ignore_errors=True)
+            try:
+                # Only remove the socket if another agent has not replaced it
+                if os.stat(self.socket_path).st_ino == self.socket_inode:
+                    os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+    def server_activate(self):
+        socketserver.UnixStreamServer.server_activate(self)
+        self.socket_inode = os.stat(self.server_address).st_ino
+
+
+def main(argv):
+    socket_path = argv[1]
+    parent_pid = int(argv[2]) if len(argv) > 2 else None
+    AgentServer(socket_path, parent_pid).serve()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
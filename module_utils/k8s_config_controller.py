@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2019, Johnathan Kupferer
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Module execution for the k8s_config action plugins, which run on the
+controller rather than being sent with modules.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import json
+import os
+import subprocess
+import sys
+import time
+import traceback
+
+from ansible.module_utils import basic
+from ansible.module_utils._text import to_bytes
+from ansible.module_utils.k8s_config_agent import agent_socket_dir
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.module_utils.six import StringIO
+from ansible.parsing.ajson import AnsibleJSONEncoder
+from ansible.utils.display import Display
+from ansible.vars.clean import remove_internal_keys
+from ansible.utils.unsafe_proxy import wrap_var
+
+try:
+    from ansible.module_utils.common import warnings as module_warnings
+except ImportError:
+    module_warnings = None
+
+try:
+    from importlib.util import module_from_spec, spec_from_file_location
+except ImportError:
+    import imp
+    spec_from_file_location = None
+
+display = Display()
+
+AGENT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'k8s_config_agent.py')
+
+
+def k8s_config_agent_socket():
+    """
+    Return socket of k8s_config agent for this ansible-playbook process,
+    starting agent if needed, or None if there is no private socket directory.
+    """
+    try:
+        socket_path = os.path.join(agent_socket_dir(), '{0}.sock'.format(os.getppid()))
+    except OSError as e:
+        display.warning('Not using k8s_config agent: {0}'.format(e))
+        return None
+    if not os.path.exists(socket_path):
+        with open(os.devnull, 'r+b') as devnull:
+            agent = subprocess.Popen(
+                [sys.executable, AGENT_SCRIPT, socket_path, str(os.getppid())],
+                stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True, preexec_fn=os.setsid,
+            )
+        deadline = time.time() + 10
+        while not os.path.exists(socket_path) and agent.poll() is None and time.time() < deadline:
+            time.sleep(0.05)
+    return socket_path
+
+
+def load_module(module_name, module_path):
+    """ Import module source, once per process. Raises ImportError if module imports fail. """
+    name = 'ansible_k8s_config_in_process_' + module_name
+    if name not in sys.modules:
+        if spec_from_file_location:
+            spec = spec_from_file_location(name, module_path)
+            module = module_from_spec(spec)
+            spec.loader.exec_module(module)
+            sys.modules[name] = module
+        else:
+            imp.load_source(name, module_path)
+    return sys.modules[name]
+
+
+def run_module_in_process(action, module, module_name, module_args, task_vars):
+    """
+    Run module main in this process with the module arguments which
+    _execute_module would send, returning the parsed module output.
+    Modules exit by printing their result and raising SystemExit.
+    """
+    module_args = dict(module_args)
+    action._update_module_args(module_name, module_args, task_vars)
+
+    output = StringIO()
+    stdout, sys.stdout = sys.stdout, output
+    basic._ANSIBLE_ARGS = to_bytes(json.dumps({'ANSIBLE_MODULE_ARGS': module_args}, cls=AnsibleJSONEncoder))
+    try:
+        module.main()
+    except SystemExit:
+        pass
+    except Exception as e:
+        output = StringIO(json.dumps(dict(
+            failed=True,
+            msg='Module failure in process: {0}'.format(e),
+            exception=traceback.format_exc(),
+        )))
+    finally:
+        sys.stdout = stdout
+        basic._ANSIBLE_ARGS = None
+        if module_warnings:
+            del module_warnings._global_warnings[:]
+            del module_warnings._global_deprecations[:]
+
+    data = action._parse_returned_data(dict(rc=0, stdout=output.getvalue(), stderr=''))
+    remove_internal_keys(data)
+    return wrap_var(data)
+
+
+def execute_module(action, module_name, module_args, task_vars):
+    """
+    Execute k8s_config module for an action plugin, using the agent and
+    running in process if requested by the agent and in_process arguments
+    when the connection is local.
+    """
+    local = action._connection.transport == 'local'
+    if boolean(module_args.pop('agent', False), strict=False) and local:
+        agent_socket = k8s_config_agent_socket()
+        if agent_socket:
+            module_args['agent_socket'] = agent_socket
+    if boolean(module_args.pop('in_process', False), strict=False) and local:
+        module_path = action._shared_loader_obj.module_loader.find_plugin(module_name, mod_type='.py')
+        try:
+            module = load_module(module_name, module_path)
+        except ImportError as e:
+            # Module dependencies may only be resolved when modules are packaged
+            display.vvv('Unable to run {0} in process: {1}'.format(module_name, e))
+        else:
+            return run_module_in_process(action, module, module_name, module_args, task_vars)
+    return action._execute_module(
+        module_name=module_name,
+        module_args=module_args,
+        task_vars=task_vars,
+    )
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2019, Johnathan Kupferer
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import json
+
+# Fields set by the API server which do not indicate a change to an object
+DEFAULT_DIFF_IGNORE = [
+    'metadata.generation',
+    'metadata.managedFields',
+    'metadata.resourceVersion',
+    'status',
+]
+
+
+class _Missing(object):
+    def __repr__(self):
+        return '<missing>'
+
+MISSING = _Missing()
+
+
+def compile_ignore(paths):
+    """
+    Compile dotted ignore paths, such as 'metadata.managedFields', into a
+    tree of dicts in which a value of True marks an ignored key.
+    """
+    tree = {}
+    for path in paths or []:
+        node = tree
+        keys = path.split('.')
+        for key in keys[:-1]:
+            child = node.get(key)
+            if child is True:
+                break
+            node = node.setdefault(key, {})
+        else:
+            node[keys[-1]] = True
+    return tree
+
+
+def objects_differ(before, after, ignore=None):
+    """
+    Return True at the first difference between before and after, skipping
+    keys in the compiled ignore tree.
+    """
+    if not ignore:
+        # Native comparison already stops at the first difference
+        return before != after
+    if not isinstance(before, dict) or not isinstance(after, dict):
+        return before != after
+    for key, value in before.items():
+        key_ignore = ignore.get(key)
+        if key_ignore is True:
+            continue
+        if key not in after:
+            return True
+        if objects_differ(value, after[key], key_ignore):
+            return True
+    for key in after:
+        if key not in before and ignore.get(key) is not True:
+            return True
+    return False
+
+
+def diff_paths(before, after, ignore=None, path=''):
+    """
+    Return list of (path, before, after) for every difference between before
+    and after, with JSON pointer paths. Values missing on one side are given
+    as MISSING.
+    """
+    if not ignore and before == after:
+        return []
+    if isinstance(before, dict) and isinstance(after, dict):
+        ignore = ignore or {}
+        changes = []
+        for key, value in before.items():
+            key_ignore = ignore.get(key)
+            if key_ignore is True:
+                continue
+            key_path = path + '/' + str(key).replace('~', '~0').replace('/', '~1')
+            if key in after:
+                changes.extend(diff_paths(value, after[key], key_ignore, key_path))
+            else:
+                changes.append((key_path, value, MISSING))
+        for key, value in after.items():
+            if key not in before and ignore.get(key) is not True:
+                key_path = path + '/' + str(key).replace('~', '~0').replace('/', '~1')
+                changes.append((key_path, MISSING, value))
+        return changes
+    if isinstance(before, list) and isinstance(after, list) and len(before) == len(after):
+        changes = []
+        for i, (before_item, after_item) in enumerate(zip(before, after)):
+            changes.extend(diff_paths(before_item, after_item, None, path + '/' + str(i)))
+        return changes
+    if before != after:
+        return [(path, before, after)]
+    return []
+
+
+def format_diff(changes, header=''):
+    """ Format diff_paths changes for Ansible diff output """
+    before = []
+    after = []
+    for path, before_value, after_value in changes:
+        if before_value is not MISSING:
+            before.append('{0}: {1}\n'.format(path, json.dumps(before_value, sort_keys=True)))
+        if after_value is not MISSING:
+            after.append('{0}: {1}\n'.format(path, json.dumps(after_value, sort_keys=True)))
+    return dict(
+        before_header=header,
+        after_header=header,
+        before=''.join(before),
+        after=''.join(after),
+    )
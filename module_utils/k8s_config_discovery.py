@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2019, Johnathan Kupferer
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import functools
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+try:
+    from os import replace as replace_file
+except ImportError:
+    # Rename replaces files atomically on POSIX with Python 2
+    from os import rename as replace_file
+
+try:
+    from openshift import __version__ as openshift_version
+    from openshift.dynamic.discovery import CacheDecoder, CacheEncoder, LazyDiscoverer
+except ImportError:
+    # Missing openshift library is reported by K8sAnsibleMixin
+    LazyDiscoverer = object
+
+DISCOVERY_ARG_SPEC = {
+    'discovery_cache_dir': {
+        'type': 'path',
+    },
+    'discovery_cache_ttl': {
+        'type': 'int',
+        'default': 600,
+    },
+    'discovery_cache_invalidate': {
+        'type': 'bool',
+        'default': False,
+    },
+}
+
+DEFAULT_DISCOVERY_CACHE_DIR = os.path.join('~', '.kube', 'cache', 'k8s_config')
+
+# Module parameters which determine the API client
+API_CLIENT_PARAMS = (
+    'api_key', 'ca_cert', 'client_cert', 'client_key', 'context', 'host', 'kubeconfig', 'password',
+    'persist_config', 'proxy', 'username', 'validate_certs',
+    'agent_socket', 'discovery_cache_dir', 'discovery_cache_ttl',
+)
+
+# API clients with discovery, reused when modules are run in process
+API_CLIENTS = {}
+
+
+def discovery_cache_file(host, cache_dir=None):
+    """ Return path of discovery cache file for cluster API host """
+    cache_dir = os.path.expanduser(cache_dir or DEFAULT_DISCOVERY_CACHE_DIR)
+    return os.path.join(
+        cache_dir, 'discovery-{0}.json'.format(hashlib.sha1(host.encode('utf-8')).hexdigest())
+    )
+
+
+def invalidate_discovery_cache(host, cache_dir=None):
+    """ Remove discovery cache for cluster API host """
+    try:
+        os.remove(discovery_cache_file(host, cache_dir))
+    except OSError:
+        pass
+
+
+class K8sConfigDiscoverer(LazyDiscoverer):
+    """
+    Lazy discoverer with a persistent cache shared by k8s_config modules.
+
+    The cache is stored per cluster API host, expires after ttl seconds and is
+    discarded if the cluster server version changes. Search misses do not
+    invalidate the whole cache, instead callers use refresh_group() to reload
+    discovery for a single API group version.
+    """
+
+    def __init__(self, client, cache_file=None, cache_dir=None, ttl=600, invalidate=False):
+        self.cache_file = cache_file or discovery_cache_file(client.configuration.host, cache_dir)
+        self.ttl = ttl
+        self._searching = False
+        self._refreshed_groups = set()
+        # The cache is loaded and checked once, before it is first used
+        self._cache_checked = False
+        self._invalidate = invalidate
+        try:
+            if not os.path.isdir(os.path.dirname(self.cache_file)):
+                os.makedirs(os.path.dirname(self.cache_file), 0o700)
+        except OSError:
+            # Failing to create the cache directory only disables persistence
+            pass
+        super(K8sConfigDiscoverer, self).__init__(client, self.cache_file)
+
+    def load_cache(self):
+        """ Load discovery cache, returns False if the cache is missing or for another library version """
+        try:
+            with open(self.cache_file, 'r') as f:
+                cache = json.load(f, cls=functools.partial(CacheDecoder, self.client))
+        except Exception:
+            return False
+        if cache.get('library_version') != openshift_version:
+            return False
+        self._cache = cache
+        return True
+
+    def cache_stale(self):
+        """ Whether the loaded cache was invalidated, has expired or is for another server version """
+        return self._invalidate \
+            or time.time() - self._cache.get('timestamp', 0) > self.ttl \
+            or self._cache['version'].get('kubernetes') != self._get_server_version()
+
+    def _load_server_info(self):
+        # Called by Discoverer once the cache is loaded from file or created
+        if not self._cache_checked:
+            self._cache_checked = True
+            if self._cache.get('version') and self.cache_stale():
+                self._cache = {'library_version': self._cache.get('library_version')}
+        super(K8sConfigDiscoverer, self)._load_server_info()
+
+    def _get_server_version(self):
+        def just_json(_, serialized):
+            return serialized
+        return self.client.request('get', '/version', serializer=just_json)
+
+    def _write_cache(self):
+        """ Write cache to a temporary file which replaces the cache file, so readers never see a partial cache """
+        if 'timestamp' not in self._cache:
+            self._cache['timestamp'] = time.time()
+        try:
+            fd, path = tempfile.mkstemp(dir=os.path.dirname(self.cache_file), prefix='.discovery-')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self._cache, f, cls=CacheEncoder)
+                replace_file(path, self.cache_file)
+            except Exception:
+                os.remove(path)
+                raise
+        except Exception:
+            # Failing to write the cache only disables persistence
+            pass
+
+    def invalidate_cache(self):
+        # LazyDiscoverer invalidates the entire cache on any search miss,
+        # misses are instead handled by refresh_group()
+        if self._searching:
+            return
+        # Discoverer invalidates the cache when it fails to load it, the
+        # cache is then loaded here and checked by _load_server_info()
+        if not self._cache_checked and not self._invalidate and self.load_cache():
+            return
+        super(K8sConfigDiscoverer, self).invalidate_cache()
+
+    def search(self, **kwargs):
+        self._searching = True
+        try:
+            return LazyDiscoverer.search(self, **kwargs)
+        finally:
+            self._searching = False
+
+    def refresh_group(self, api_version):
+        """
+        Reload discovery for a single API group version, such as after a
+        CustomResourceDefinition was created. Returns True if the group version
+        was found and refreshed.
+        """
+        if not api_version:
+            return False
+        if '/' in api_version:
+            prefix = 'apis'
+            group, version = api_version.split('/', 1)
+        else:
+            prefix = 'api'
+            group, version = '', api_version
+
+        # Only refresh each group version once per module run
+        if (prefix, group, version) in self._refreshed_groups:
+            return False
+        self._refreshed_groups.add((prefix, group, version))
+
+        if prefix == 'apis':
+            resources = self.parse_api_groups(request_resources=False, update=True)
+        else:
+            resources = self._cache['resources']
+
+        resource_group = resources.get(prefix, {}).get(group, {}).get(version)
+        if resource_group is None:
+            return False
+        resource_group.resources = self.get_resources_for_api_version(
+            prefix, group, version, resource_group.preferred
+        )
+        self._write_cache()
+        return True
+
+
+def api_client_helper_module(obj):
+    """
+    Return module of the kubernetes module helper get_api_client method used
+    by obj, which constructs DynamicClient from its module globals.
+    """
+    for cls in type(obj).__mro__:
+        if 'get_api_client' in vars(cls):
+            module = sys.modules[cls.__module__]
+            if hasattr(module, 'DynamicClient'):
+                return module
+    raise AttributeError('get_api_client helper not found')
+
+
+class K8sConfigDiscoveryMixin(object):
+    """
+    Mixin for k8s_config modules to use K8sConfigDiscoverer with the API client
+    built by the kubernetes module helper.
+    """
+
+    def get_api_client(self, **auth_params):
+        key = json.dumps(
+            [auth_params] + [self.params.get(param) for param in API_CLIENT_PARAMS],
+            sort_keys=True, default=str
+        )
+        if key in API_CLIENTS and not self.params.get('discovery_cache_invalidate'):
+            return API_CLIENTS[key]
+        get_api_client = super(K8sConfigDiscoveryMixin, self).get_api_client
+        helper_module = api_client_helper_module(self)
+        dynamic_client = helper_module.DynamicClient
+        # The helper constructs DynamicClient directly, so provide the
+        # discoverer for the duration of the call.
+        helper_module.DynamicClient = functools.partial(
+            dynamic_client,
+            discoverer=functools.partial(
+                K8sConfigDiscoverer,
+                cache_dir=self.params.get('discovery_cache_dir'),
+                ttl=self.params.get('discovery_cache_ttl', 600),
+                invalidate=self.params.get('discovery_cache_invalidate', False),
+            )
+        )
+        try:
+            API_CLIENTS[key] = get_api_client(**auth_params)
+        finally:
+            helper_module.DynamicClient = dynamic_client
+        return API_CLIENTS[key]
+
+    def find_resource(self, kind, api_version, fail=False):
+        find_resource = super(K8sConfigDiscoveryMixin, self).find_resource
+        resource = find_resource(kind, api_version, fail=False)
+        if resource or not fail:
+            return resource
+        # Resource may be newly added to the cluster, refresh the API group and retry
+        if self.client.resources.refresh_group(api_version):
+            resource = find_resource(kind, api_version, fail=False)
+        return resource or find_resource(kind, api_version, fail=True)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2019, Johnathan Kupferer
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+from ansible.module_utils.six import string_types
+from ansible.module_utils.k8s_config_wait import jsonpath_values
+
+RESULT_FORMAT_ARG_SPEC = {
+    'result_format': {
+        'type': 'raw',
+        'default': 'full',
+    },
+}
+
+
+def summarize(k8s_obj, changed=None):
+    """ Return identifying fields of an object, with changed status if given """
+    metadata = k8s_obj.get('metadata') or {}
+    summary = dict(
+        apiVersion=k8s_obj.get('apiVersion'),
+        kind=k8s_obj.get('kind'),
+        name=metadata.get('name'),
+        namespace=metadata.get('namespace'),
+        uid=metadata.get('uid'),
+        resourceVersion=metadata.get('resourceVersion'),
+    )
+    if changed is not None:
+        summary['changed'] = changed
+    return summary
+
+
+def project(k8s_obj, paths):
+    """
+    Return dict of JSONPath expression to value in object. Expressions with
+    a wildcard give a list of values, others give the value or None.
+    """
+    projection = {}
+    for path in paths:
+        values = jsonpath_values(k8s_obj, path)
+        if '[*]' in path:
+            projection[path] = values
+        else:
+            projection[path] = values[0] if values else None
+    return projection
+
+
+def result_formatter(result_format):
+    """
+    Return function of object and changed status which formats the object
+    for module results as given by the result_format module parameter.
+    Raises ValueError for an invalid format.
+    """
+    if result_format in (None, 'full'):
+        return lambda k8s_obj, changed=None: k8s_obj
+    if result_format == 'summary':
+        return lambda k8s_obj, changed=None: None if k8s_obj is None else summarize(k8s_obj, changed)
+    if isinstance(result_format, list) and result_format \
+       and all(isinstance(path, string_types) for path in result_format):
+        return lambda k8s_obj, changed=None: None if k8s_obj is None else project(k8s_obj, result_format)
+    raise ValueError(
+        'result_format must be "full", "summary" or a list of JSONPath expressions, got {0!r}'.format(result_format)
+    )
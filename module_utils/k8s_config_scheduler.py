@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2019, Johnathan Kupferer
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import functools
+import random
+import threading
+import time
+
+try:
+    from kubernetes.client.rest import ApiException
+    from openshift.dynamic.resource import ResourceInstance
+except ImportError:
+    # Missing kubernetes library is reported by K8sAnsibleMixin
+    ApiException = Exception
+
+SCHEDULER_ARG_SPEC = {
+    'request_qps': {
+        'type': 'float',
+        'default': 0,
+    },
+    'request_burst': {
+        'type': 'int',
+        'default': 10,
+    },
+    'request_retries': {
+        'type': 'int',
+        'default': 5,
+    },
+}
+
+# Status codes for which requests are retried, other than conflicts
+RETRY_STATUS = frozenset([429, 500, 503, 504])
+
+# Methods for which a conflict is retried
+CONFLICT_RETRY_METHODS = frozenset(['patch', 'put'])
+
+# Response for a retried delete of an object already deleted by an earlier attempt
+DELETED_STATUS = {'kind': 'Status', 'apiVersion': 'v1', 'metadata': {}, 'status': 'Success', 'details': {}}
+
+
+def has_resource_version(body):
+    """ Whether a patch or put body sets metadata.resourceVersion, making the update conditional """
+    if isinstance(body, dict):
+        return bool((body.get('metadata') or {}).get('resourceVersion'))
+    if isinstance(body, list):
+        # JSON patch operations
+        return any(isinstance(op, dict) and op.get('path') == '/metadata/resourceVersion' for op in body)
+    return False
+
+
+def appends_to_list(body):
+    """
+    Whether a JSON patch body appends to the end of a list without starting
+    with a test, so that applying it again appends again.
+    """
+    if not isinstance(body, list) or not body or not isinstance(body[0], dict) or body[0].get('op') == 'test':
+        return False
+    return any(
+        isinstance(op, dict) and op.get('op') in ('add', 'copy', 'move') and str(op.get('path', '')).endswith('/-')
+        for op in body
+    )
+
+
+class TokenBucket(object):
+    """ Thread-safe token bucket allowing burst requests and qps on average """
+
+    def __init__(self, qps, burst):
+        self.qps = float(qps)
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ Take a token, sleeping until one is available. Returns seconds slept. """
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.qps)
+            self.updated = now
+            self.tokens -= 1
+            delay = -self.tokens / self.qps if self.tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class RequestScheduler(object):
+    """
+    Rate limit API requests and retry them with backoff on throttling, server
+    errors and, for patch and replace without a resourceVersion, on conflicts.
+    Server errors are not retried for requests which may have been processed
+    and are not idempotent, creates and JSON patches appending to lists.
+    A delete which is not found once retried was deleted by an earlier
+    attempt and succeeds. Counters of requests, retries and throttling are
+    returned by stats().
+    """
+
+    def __init__(self, qps=0, burst=10, retries=5, backoff=0.5, max_backoff=30):
+        self.bucket = TokenBucket(qps, burst) if qps and qps > 0 else None
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.counters = dict(
+            requests=0,
+            retries=0,
+            conflict_retries=0,
+            throttled=0,
+            throttled_seconds=0.0,
+        )
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['throttled_seconds'] = round(stats['throttled_seconds'], 3)
+        return stats
+
+    def retry_delay(self, exc, attempt):
+        """ Seconds to wait before retry, from Retry-After or exponential backoff with jitter """
+        headers = getattr(exc, 'headers', None) or {}
+        retry_after = headers.get('Retry-After') if hasattr(headers, 'get') else None
+        if retry_after:
+            try:
+                return min(self.max_backoff, max(0, int(retry_after)))
+            except ValueError:
+                pass
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def should_retry(self, method, exc, content_type=None, body=None):
+        status = getattr(exc, 'status', None)
+        if status == 409:
+            # Server-side apply conflicts are field ownership conflicts and updates conditional on
+            # resourceVersion conflict again, neither resolve on retry with the same body
+            return method.lower() in CONFLICT_RETRY_METHODS and content_type != 'application/apply-patch+yaml' \
+                and not has_resource_version(body)
+        if status == 429:
+            return True
+        # Create requests and patches appending to lists may have been processed despite server errors
+        return status in RETRY_STATUS and method.lower() != 'post' and not appends_to_list(body)
+
+    def wrap(self, request):
+        """ Wrap DynamicClient request method """
+        @functools.wraps(request)
+        def scheduled_request(method, path, *args, **kwargs):
+            attempt = 0
+            while True:
+                if self.bucket:
+                    delay = self.bucket.acquire()
+                    if delay > 0:
+                        self.count('throttled')
+                        self.count('throttled_seconds', delay)
+                self.count('requests')
+                try:
+                    return request(method, path, *args, **kwargs)
+                except ApiException as exc:
+                    if exc.status == 404 and attempt > 0 and method.lower() == 'delete':
+                        serializer = kwargs.get('serializer', ResourceInstance)
+                        return serializer(getattr(request, '__self__', None), dict(DELETED_STATUS))
+                    if attempt >= self.retries or not self.should_retry(
+                        method, exc, kwargs.get('content_type'), kwargs.get('body')
+                    ):
+                        raise
+                    self.count('conflict_retries' if exc.status == 409 else 'retries')
+                    time.sleep(self.retry_delay(exc, attempt))
+                    attempt += 1
+        return scheduled_request
+
+
+class K8sConfigSchedulerMixin(object):
+    """
+    Mixin for k8s_config modules to send API requests through a
+    RequestScheduler configured from module parameters.
+    """
+
+    request_scheduler = None
+
+    def get_api_client(self, **auth_params):
+        client = super(K8sConfigSchedulerMixin, self).get_api_client(**auth_params)
+        self.request_scheduler = RequestScheduler(
+            qps=self.params.get('request_qps', 0),
+            burst=self.params.get('request_burst', 10),
+            retries=self.params.get('request_retries', 5),
+        )
+        # Clients are reused by modules run in process
+        request = getattr(client, 'unscheduled_request', client.request)
+        client.unscheduled_request = request
+        client.request = self.request_scheduler.wrap(request)
+        return client
+
+    def request_stats(self):
+        """ Request counters for module results """
+        if self.request_scheduler:
+            return self.request_scheduler.stats()
+        return {}
+
+    def set_connection_pool_size(self, size):
+        # Avoid discarding connections when the worker pool is larger than the
+        # default urllib3 pool size
+        pool_manager = self.client.client.rest_client.pool_manager
+        if pool_manager.connection_pool_kw.get('maxsize', 1) < size:
+            pool_manager.connection_pool_kw['maxsize'] = size
+            pool_manager.clear()
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2019, Johnathan Kupferer
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import math
+import re
+import time
+
+try:
+    from kubernetes.client.rest import ApiException
+    from openshift.dynamic.exceptions import NotFoundError
+except ImportError:
+    # Missing kubernetes and openshift libraries are reported by K8sAnsibleMixin
+    pass
+
+WATCH_WAIT_ARG_SPEC = {
+    'wait': {
+        'type': 'bool',
+        'default': False,
+    },
+    'wait_timeout': {
+        'type': 'int',
+        'default': 120,
+    },
+    'wait_condition': {
+        'type': 'dict',
+    },
+    'wait_jsonpath': {
+        'type': 'str',
+    },
+    'wait_jsonpath_value': {
+        'type': 'str',
+    },
+}
+
+# Seconds to back off, doubling up to the maximum, before watching again after a watch without events
+WATCH_BACKOFF = 0.5
+WATCH_MAX_BACKOFF = 8
+
+
+class WaitFailedException(Exception):
+    pass
+
+
+def jsonpath_values(obj, path):
+    """
+    Return list of values at a simple JSONPath such as '{.status.phase}',
+    '.spec.containers[0].image' or 'status.conditions[*].type'.
+    """
+    path = path.strip()
+    if path.startswith('{') and path.endswith('}'):
+        path = path[1:-1]
+    values = [obj]
+    for field, index in re.findall(r'([^.\[\]]+)|\[([^\]]*)\]', path.lstrip('$')):
+        selected = []
+        for value in values:
+            if field:
+                if isinstance(value, dict) and field in value:
+                    selected.append(value[field])
+            elif isinstance(value, list):
+                if index == '*':
+                    selected.extend(value)
+                elif re.match(r'^-?\d+$', index) and -len(value) <= int(index) < len(value):
+                    selected.append(value[int(index)])
+        values = selected
+    return values
+
+
+def condition_status(obj, condition_type):
+    """ Return status condition of type, or None if not present """
+    for condition in (obj.get('status') or {}).get('conditions') or []:
+        if condition.get('type') == condition_type:
+            return condition
+    return None
+
+
+def condition_ready(condition):
+    """ Return readiness check for a condition given as type, status and reason """
+    def ready(obj):
+        status = condition_status(obj, condition['type'])
+        if not status:
+            return False
+        if status.get('status') != condition.get('status', 'True'):
+            return False
+        return not condition.get('reason') or status.get('reason') == condition['reason']
+    return ready
+
+
+def jsonpath_ready(path, value=None):
+    """ Return readiness check for a JSONPath being present, with any value, or having the given value """
+    def ready(obj):
+        values = jsonpath_values(obj, path)
+        if value is None:
+            # Empty, zero and false values are present
+            return len(values) > 0
+        return any(str(v) == value or (isinstance(v, bool) and str(v).lower() == value) for v in values)
+    return ready
+
+
+def crd_ready(obj):
+    status = condition_status(obj, 'Established')
+    return bool(status) and status.get('status') == 'True'
+
+
+def deployment_ready(obj):
+    """ Deployment rollout is complete, following kubectl rollout status """
+    metadata = obj.get('metadata', {})
+    spec = obj.get('spec', {})
+    status = obj.get('status') or {}
+    progressing = condition_status(obj, 'Progressing')
+    if progressing and progressing.get('reason') == 'ProgressDeadlineExceeded':
+        raise WaitFailedException('Deployment {0} exceeded its progress deadline'.format(metadata.get('name')))
+    if status.get('observedGeneration', 0) < metadata.get('generation', 0):
+        return False
+    replicas = spec.get('replicas', 1)
+    updated = status.get('updatedReplicas', 0)
+    return updated >= replicas \
+        and status.get('replicas', 0) <= updated \
+        and status.get('availableReplicas', 0) >= updated
+
+
+def job_ready(obj):
+    failed = condition_status(obj, 'Failed')
+    if failed and failed.get('status') == 'True':
+        raise WaitFailedException('Job {0} failed: {1}'.format(
+            obj.get('metadata', {}).get('name'), failed.get('message', failed.get('reason'))
+        ))
+    complete = condition_status(obj, 'Complete')
+    return bool(complete) and complete.get('status') == 'True'
+
+
+def exists_ready(obj):
+    return True
+
+KIND_READY = {
+    ('apiextensions.k8s.io', 'CustomResourceDefinition'): crd_ready,
+    ('apps', 'Deployment'): deployment_ready,
+    ('batch', 'Job'): job_ready,
+}
+
+
+def ready_check(group, kind, params):
+    """
+    Return readiness check for objects of kind from module wait parameters,
+    defaulting to a check for the kind or only existence.
+    """
+    if params.get('wait_condition'):
+        return condition_ready(params['wait_condition'])
+    if params.get('wait_jsonpath'):
+        return jsonpath_ready(params['wait_jsonpath'], params.get('wait_jsonpath_value'))
+    return KIND_READY.get((group, kind), exists_ready)
+
+
+def wait_for_object(resource, name, namespace, ready, timeout, k8s_obj=None, deleted=False):
+    """
+    Watch object until ready returns True, or until the object is deleted if
+    deleted is set. Starts from the resourceVersion of k8s_obj, if given, else
+    retrieves the object. A watch ending without events, as when its
+    resourceVersion has expired, is restarted after retrieving the object
+    again and backing off. Returns the last object seen, raises
+    WaitFailedException on failure or timeout.
+    """
+    deadline = time.time() + timeout
+    params = dict(field_selector='metadata.name=' + name)
+    if namespace:
+        params['namespace'] = namespace
+
+    def _is_done(obj):
+        if deleted:
+            return obj is None
+        return obj is not None and ready(obj)
+
+    backoff = WATCH_BACKOFF
+    while True:
+        if k8s_obj is None or 'metadata' not in k8s_obj:
+            try:
+                k8s_obj = resource.get(name=name, namespace=namespace).to_dict()
+            except NotFoundError:
+                k8s_obj = None
+        if _is_done(k8s_obj):
+            return k8s_obj
+        if k8s_obj:
+            resource_version = k8s_obj['metadata'].get('resourceVersion')
+        else:
+            # Resource version of the list determines where to watch from
+            resource_version = resource.get(limit=1, **params).metadata.resourceVersion
+
+        try:
+            while True:
+                # Watch timeout is whole seconds, rounded up so less than a second left still watches
+                remaining = int(math.ceil(deadline - time.time()))
+                if remaining <= 0:
+                    raise WaitFailedException('Timed out waiting for {0} {1}'.format(resource.kind, name))
+                events = 0
+                for event in resource.watch(resource_version=resource_version, timeout=remaining, **params):
+                    events += 1
+                    obj = event['raw_object']
+                    resource_version = obj.get('metadata', {}).get('resourceVersion', resource_version)
+                    k8s_obj = None if event['type'] == 'DELETED' else obj
+                    if _is_done(k8s_obj):
+                        return k8s_obj
+                if not events:
+                    # The kubernetes client drops the error event of an expired watch and ends the watch
+                    break
+                backoff = WATCH_BACKOFF
+        except ApiException as exc:
+            # Watch expired
+            if exc.status != 410:
+                raise
+        # Retrieve the object again and restart the watch
+        k8s_obj = None
+        time.sleep(max(0, min(backoff, deadline - time.time())))
+        backoff = min(WATCH_MAX_BACKOFF, backoff * 2)
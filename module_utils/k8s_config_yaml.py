@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2019, Johnathan Kupferer
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Parsing of resource definition manifests, shared by modules and the
+k8s_resource_definitions lookup.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import json
+
+import yaml
+
+from ansible.module_utils.six import string_types
+
+try:
+    # PyYAML built with libyaml
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+YAMLError = yaml.YAMLError
+
+
+def load_all(stream, loader=SafeLoader):
+    """
+    Generate documents from YAML stream, given as a string or file, using
+    the libyaml loader when available. Manifests are often rendered as a
+    single JSON document, so strings are first parsed as JSON when they
+    look like JSON, falling back to YAML for flow style YAML. Raises
+    YAMLError for invalid YAML.
+    """
+    if isinstance(stream, string_types) and stream.lstrip()[:1] in ('{', '['):
+        try:
+            document = json.loads(stream)
+        except ValueError:
+            pass
+        else:
+            yield document
+            return
+    for document in yaml.load_all(stream, Loader=loader):
+        yield document
+
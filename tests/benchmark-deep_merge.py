@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+"""
+Benchmark k8s_config_resource deep_merge on objects with thousands of keys,
+comparing with a merge that deep copies the source object.
+"""
+
+import copy
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../library'))
+
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
+from k8s_config_resource import deep_merge
+
+def deepcopy_merge(source, merge_patch):
+    """ Reference RFC 7386 merge which copies the entire source """
+    def _merge(target, patch):
+        if not isinstance(patch, dict):
+            return copy.deepcopy(patch)
+        if not isinstance(target, dict):
+            target = {}
+        for k, v in patch.items():
+            if v is None:
+                target.pop(k, None)
+            else:
+                target[k] = _merge(target.get(k), v)
+        return target
+    return _merge(copy.deepcopy(source), merge_patch)
+
+def large_object(keys):
+    return {
+        'apiVersion': 'v1',
+        'kind': 'ConfigMap',
+        'metadata': {
+            'name': 'large',
+            'namespace': 'benchmark',
+            'labels': dict(('label{0}'.format(i), 'value') for i in range(100)),
+        },
+        'data': dict(('key{0:05d}'.format(i), {'value': 'x' * 64, 'items': list(range(10))}) for i in range(keys)),
+    }
+
+def bench(name, statement, number):
+    seconds = timeit.timeit(statement, number=number) / number
+    print('{0:<40} {1:10.3f} ms'.format(name, seconds * 1000))
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for keys in (1000, 10000):
+        source = large_object(keys)
+        patches = (
+            ('label', {'metadata': {'labels': {'label0': 'changed'}}}),
+            ('delete key', {'data': {'key00001': None}}),
+            ('replace all', {'data': dict(('key{0:05d}'.format(i), {'value': 'y'}) for i in range(keys))}),
+        )
+        print('== {0} keys'.format(keys))
+        for label, patch in patches:
+            assert deep_merge(source, patch) == deepcopy_merge(source, patch)
+            bench('deepcopy ' + label, lambda: deepcopy_merge(source, patch), number)
+            bench('deep_merge ' + label, lambda: deep_merge(source, patch), number)
+
+if __name__ == '__main__':
+    main()
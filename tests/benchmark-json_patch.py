@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""
+Benchmark k8s_config_json_patch processing of patches of 10 to 10000
+operations on generated objects of growing size and depth, reporting
+operations per second and peak memory allocated while processing.
+"""
+
+import os
+import sys
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../library'))
+
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
+from k8s_config_json_patch import apply_patch, minimize_patch, process_patch
+
+def deployment(containers, env):
+    """ Deployment with containers each with a list of env vars """
+    return {
+        'apiVersion': 'apps/v1',
+        'kind': 'Deployment',
+        'metadata': {'name': 'benchmark', 'namespace': 'benchmark', 'labels': {'app': 'benchmark'}},
+        'spec': {
+            'replicas': 1,
+            'template': {
+                'spec': {
+                    'containers': [{
+                        'name': 'container{0}'.format(c),
+                        'image': 'example.com/benchmark:latest',
+                        'env': [{'name': 'VAR{0}'.format(i), 'value': str(i)} for i in range(env)],
+                    } for c in range(containers)],
+                },
+            },
+        },
+    }
+
+def nested(depth, width):
+    """ Object nested to depth with width keys at each level """
+    if depth == 0:
+        return 'leaf'
+    return dict(('key{0}'.format(i), nested(depth - 1, width)) for i in range(width))
+
+def env_query_patch(containers, env, count):
+    """ Set env var values by list query, adding one var in ten """
+    return [{
+        'op': 'add',
+        'path': "/spec/template/spec/containers/[?name='container{0}']/env/[?name='VAR{1}']/value".format(
+            i % containers, i % (env + env // 10 + 1)
+        ),
+        'value': 'changed{0}'.format(i),
+    } for i in range(count)]
+
+def deep_patch(depth, width, count):
+    """ Replace leaves of a nested object and add values beside them """
+    patch = []
+    for i in range(count):
+        path = '/' + '/'.join('key{0}'.format((i // width ** level) % width) for level in range(depth))
+        if i % 2:
+            patch.append({'op': 'replace', 'path': path, 'value': i})
+        else:
+            patch.append({'op': 'add', 'path': path.rsplit('/', 1)[0] + '/added', 'value': {'i': i}})
+    return patch
+
+def mixed_patch(containers, env, count):
+    """ Mixed operations on containers and their env vars """
+    patch = []
+    for i in range(count):
+        container = "/spec/template/spec/containers/[?name='container{0}']".format(i % containers)
+        var = "{0}/env/[?name='VAR{1}']".format(container, i % env)
+        kind = i % 5
+        if kind == 0:
+            patch.append({'op': 'test', 'path': container + '/image', 'value': 'example.com/benchmark:latest'})
+        elif kind == 1:
+            patch.append({'op': 'replace', 'path': var + '/value', 'value': 'replaced'})
+        elif kind == 2:
+            patch.append({'op': 'copy', 'from': var, 'path': container + '/env/-'})
+        elif kind == 3:
+            patch.append({'op': 'remove', 'path': var})
+        else:
+            patch.append({'op': 'add', 'path': container + '/env/-', 'value': {'name': 'NEW{0}'.format(i)}})
+    return patch
+
+def scenarios():
+    for count in (10, 100, 1000, 10000):
+        yield 'env query 1x100 {0} ops'.format(count), deployment(1, 100), env_query_patch(1, 100, count)
+        yield 'env query 10x1000 {0} ops'.format(count), deployment(10, 1000), env_query_patch(10, 1000, count)
+        yield 'deep 8x4 {0} ops'.format(count), nested(8, 4), deep_patch(8, 4, count)
+        yield 'mixed 10x1000 {0} ops'.format(count), deployment(10, 1000), mixed_patch(10, 1000, count)
+
+def peak_memory(statement):
+    """ Return peak memory allocated by statement in KiB, or None without tracemalloc """
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    try:
+        statement()
+        return tracemalloc.get_traced_memory()[1] / 1024.0
+    finally:
+        tracemalloc.stop()
+
+def bench(name, statement, number, operations):
+    seconds = timeit.timeit(statement, number=number) / number
+    peak = peak_memory(statement)
+    print('{0:<40} {1:10.3f} ms {2:12.0f} ops/s {3:>12} KiB peak'.format(
+        name, seconds * 1000, operations / seconds, 'n/a' if peak is None else '{0:.1f}'.format(peak)
+    ))
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    for label, obj, patch in scenarios():
+        print('== {0}'.format(label))
+        bench('process_patch', lambda: process_patch(patch, obj), number, len(patch))
+        processed_patch, patched_obj = process_patch(patch, obj)
+        bench('minimize_patch', lambda: minimize_patch(processed_patch), number, len(processed_patch))
+        if len(patch) <= 1000:
+            assert apply_patch(processed_patch, obj) == patched_obj
+            assert apply_patch(minimize_patch(processed_patch), obj) == patched_obj
+
+if __name__ == '__main__':
+    main()
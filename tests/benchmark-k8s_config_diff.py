@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""
+Benchmark change detection on large objects, comparing k8s_config_diff with
+the recursive_diff used by K8sAnsibleMixin.diff_objects.
+"""
+
+import copy
+import os
+import sys
+import timeit
+
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
+from ansible.module_utils.common.dict_transformations import recursive_diff
+from ansible.module_utils.k8s_config_diff import \
+    DEFAULT_DIFF_IGNORE, compile_ignore, diff_paths, objects_differ
+
+def server_fields(obj):
+    obj = copy.deepcopy(obj)
+    obj['metadata']['resourceVersion'] = '1001'
+    obj['metadata']['generation'] = 2
+    obj['metadata']['managedFields'] = [{
+        'manager': 'k8s_config',
+        'operation': 'Apply',
+        'fieldsV1': {'f:data': dict(('f:' + key, {}) for key in obj.get('data', {}))}
+    }]
+    return obj
+
+def configmap():
+    """ ConfigMap with about 1 MiB of data in 1024 keys """
+    return {
+        'apiVersion': 'v1',
+        'kind': 'ConfigMap',
+        'metadata': {'name': 'large', 'namespace': 'benchmark', 'resourceVersion': '1000'},
+        'data': dict(('key{0:04d}'.format(i), 'x' * 1024) for i in range(1024)),
+    }
+
+def crd():
+    """ CustomResourceDefinition with a deep OpenAPI schema """
+    def schema(depth):
+        if depth == 0:
+            return {'type': 'string', 'description': 'leaf'}
+        return {
+            'type': 'object',
+            'properties': dict(('field{0}'.format(i), schema(depth - 1)) for i in range(6)),
+        }
+    return {
+        'apiVersion': 'apiextensions.k8s.io/v1',
+        'kind': 'CustomResourceDefinition',
+        'metadata': {'name': 'widgets.example.com', 'resourceVersion': '1000'},
+        'spec': {
+            'group': 'example.com',
+            'names': {'kind': 'Widget', 'plural': 'widgets'},
+            'versions': [{
+                'name': 'v1',
+                'served': True,
+                'storage': True,
+                'schema': {'openAPIV3Schema': schema(5)},
+            }],
+        },
+        'status': {'conditions': [{'type': 'Established', 'status': 'True'}]},
+    }
+
+def bench(name, statement, number):
+    seconds = timeit.timeit(statement, number=number) / number
+    print('{0:<40} {1:10.3f} ms'.format(name, seconds * 1000))
+
+def main():
+    ignore = compile_ignore(DEFAULT_DIFF_IGNORE)
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for label, obj in (('configmap 1MiB', configmap()), ('crd', crd())):
+        existing = obj
+        unchanged = server_fields(obj)
+        print('== {0}'.format(label))
+        bench('recursive_diff unchanged', lambda: recursive_diff(existing, unchanged), number)
+        bench('objects_differ unchanged', lambda: objects_differ(existing, unchanged, ignore), number)
+        bench('diff_paths unchanged', lambda: diff_paths(existing, unchanged, ignore), number)
+        assert not objects_differ(existing, unchanged, ignore)
+        changed = copy.deepcopy(unchanged)
+        changed['metadata']['labels'] = {'changed': 'true'}
+        bench('recursive_diff changed', lambda: recursive_diff(existing, changed), number)
+        bench('objects_differ changed', lambda: objects_differ(existing, changed, ignore), number)
+        bench('diff_paths changed', lambda: diff_paths(existing, changed, ignore), number)
+        assert objects_differ(existing, changed, ignore)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+"""
+Benchmark parsing large multi-document manifests, comparing the pure Python
+SafeLoader with the libyaml CSafeLoader used by k8s_config_yaml.load_all.
+Manifests are built by repeating the test manifests in tests/*/files.
+"""
+
+import glob
+import json
+import os
+import sys
+import timeit
+
+import yaml
+
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
+from ansible.module_utils.k8s_config_yaml import SafeLoader, load_all
+
+def test_manifests():
+    documents = []
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(__file__), '*/files/*.yaml'))):
+        with open(path) as f:
+            documents.extend(document for document in yaml.safe_load_all(f) if document)
+    return documents
+
+def multi_document(documents, count):
+    """ Multi-document YAML stream of count copies of documents """
+    return yaml.safe_dump_all(documents * count, default_flow_style=False)
+
+def list_document(documents, count):
+    """ Single v1 List as rendered to JSON """
+    return json.dumps({'apiVersion': 'v1', 'kind': 'List', 'items': documents * count}, indent=2)
+
+def bench(name, statement, number):
+    seconds = timeit.timeit(statement, number=number) / number
+    print('{0:<40} {1:10.3f} ms'.format(name, seconds * 1000))
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    documents = test_manifests()
+    print('load_all loader: {0}'.format(SafeLoader.__name__))
+    for label, stream in (
+        ('multi-document yaml', multi_document(documents, count)),
+        ('v1 List json', list_document(documents, count)),
+    ):
+        print('== {0} {1} KiB'.format(label, len(stream) // 1024))
+        bench('yaml.SafeLoader', lambda: list(yaml.load_all(stream, Loader=yaml.SafeLoader)), number)
+        if hasattr(yaml, 'CSafeLoader'):
+            bench('yaml.CSafeLoader', lambda: list(yaml.load_all(stream, Loader=yaml.CSafeLoader)), number)
+        bench('k8s_config_yaml.load_all', lambda: list(load_all(stream)), number)
+        assert list(load_all(stream)) == list(yaml.load_all(stream, Loader=yaml.SafeLoader))
+
+if __name__ == '__main__':
+    main()
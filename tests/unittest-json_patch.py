@@ -7,8 +7,15 @@ import unittest
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../library'))
 
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
 import k8s_config_json_patch
 
+from ansible.module_utils.k8s_config_scheduler import RequestScheduler
+from openshift.dynamic.exceptions import DynamicApiError
+
 deployment = {
     'apiVersion': 'apps/v1',
     'kind': 'Deployment',
@@ -131,6 +138,31 @@ class TestJsonPatchResolvePath(unittest.TestCase):
         self.assertEqual(matched_path, ['spec','template','spec','containers','0','env'])
         self.assertEqual(unmatched_path,  ["[?name='NOSUCH']", 'value'])
 
+class TestJsonPatchCompilePath(unittest.TestCase):
+    def test_00_token_types(self):
+        tokens = k8s_config_json_patch.compile_path("/metadata/labels/a~1b~0c/0/-/[?name='app']")
+        self.assertEqual([(token.type, token.key) for token in tokens], [
+            ('key', 'metadata'), ('key', 'labels'), ('key', 'a/b~c'), ('index', '0'), ('append', '-'),
+            ('query', "[?name='app']"),
+        ])
+        self.assertEqual(tokens[3].index, 0)
+        self.assertEqual(tokens[5].query, ('name', 'app'))
+
+    def test_01_cached(self):
+        path = "/spec/template/spec/containers/[?name='app']/env/0"
+        self.assertIs(k8s_config_json_patch.compile_path(path), k8s_config_json_patch.compile_path(path))
+
+    def test_02_resolve_tokens(self):
+        tokens = k8s_config_json_patch.compile_path("/spec/template/spec/containers/[?name='app']/env/[?name='NOSUCH']/value")
+        value, context, key, matched_path, unmatched = k8s_config_json_patch.resolve_tokens(deployment, tokens)
+        self.assertEqual(context, deployment['spec']['template']['spec']['containers'][0]['env'])
+        self.assertEqual(matched_path, ['spec','template','spec','containers','0','env'])
+        self.assertEqual(unmatched, tokens[6:])
+
+        tokens = k8s_config_json_patch.compile_path("/spec/template/spec/containers/0/env/-")
+        value, context, key, matched_path, unmatched = k8s_config_json_patch.resolve_tokens(deployment, tokens)
+        self.assertEqual([(token.type, token.index) for token in unmatched], [('index', 2)])
+
 class TestJsonPatchAdd(unittest.TestCase):
     def test_00(self):
         deployment_copy = copy.deepcopy(deployment)
@@ -211,6 +243,27 @@ class TestJsonPatchAdd(unittest.TestCase):
         }, deployment_copy)
         self.assertEqual(processed_patch_operation, None)
 
+    def test_06_through_value(self):
+        with self.assertRaises(k8s_config_json_patch.JsonPatchFailException):
+            deployment_copy = copy.deepcopy(deployment)
+            k8s_config_json_patch.process_patch_add({
+                'op': 'add',
+                'path': '/metadata/name/willfail',
+                'value': 'willfail'
+            }, deployment_copy)
+
+    def test_07_query_item(self):
+        patch = [{
+            'op': 'add',
+            'path': "/spec/template/spec/containers/[?name='app']/env/[?name='VAR3']",
+            'value': {'value': 'value3'}
+        }]
+        patched_obj = k8s_config_json_patch.process_patch(patch, deployment)[1]
+        self.assertEqual(patched_obj['spec']['template']['spec']['containers'][0]['env'][2], {
+            'name': 'VAR3', 'value': 'value3'
+        })
+        self.assertEqual(k8s_config_json_patch.process_patch(patch, patched_obj), ([], patched_obj))
+
 class TestJsonPatchRemove(unittest.TestCase):
     def test_00(self):
         deployment_copy = copy.deepcopy(deployment)
@@ -345,6 +398,20 @@ class TestJsonPatchCopy(unittest.TestCase):
                 'path': "/spec/template/spec/containers/[?name='app']/env/[?name='WILLFAIL']"
             }, deployment_copy)
 
+    def test_02_list_index(self):
+        # Copying to a list index would insert, so the item is replaced
+        deployment_copy = copy.deepcopy(deployment)
+        processed_patch_operation = k8s_config_json_patch.process_patch_copy({
+            'op': 'copy',
+            'from': '/spec/template/spec/containers/0/env/0',
+            'path': '/spec/template/spec/containers/0/env/1'
+        }, deployment_copy)
+        self.assertEqual(processed_patch_operation, {
+            'op': 'replace',
+            'path': '/spec/template/spec/containers/0/env/1',
+            'value': {'name': 'VAR1', 'value': 'value1'}
+        })
+
 class TestJsonPatchMove(unittest.TestCase):
     def test_00(self):
         deployment_copy = copy.deepcopy(deployment)
@@ -371,6 +438,346 @@ class TestJsonPatchMove(unittest.TestCase):
                 'path': "/spec/template/spec/containers/[?name='app']/env/[?name='WILLFAIL']"
             }, deployment_copy)
 
+    def test_02_existing(self):
+        obj = {'items': ['a', 'b', {'name': 'c'}]}
+        processed_patch_operation = k8s_config_json_patch.process_patch_move({
+            'op': 'move',
+            'from': '/items/0',
+            'path': '/items/2/name'
+        }, obj)
+        # The destination is given as it is after removing the source
+        self.assertEqual(processed_patch_operation, {'op': 'move', 'from': '/items/0', 'path': '/items/1/name'})
+        self.assertEqual(obj, {'items': ['b', {'name': 'a'}]})
+
+    def test_03_within(self):
+        with self.assertRaises(k8s_config_json_patch.JsonPatchFailException):
+            deployment_copy = copy.deepcopy(deployment)
+            k8s_config_json_patch.process_patch_move({
+                'op': 'move',
+                'from': '/spec/template/spec/containers/0',
+                'path': '/spec/template/spec/containers/0/env/0'
+            }, deployment_copy)
+
+class TestJsonPatchListIndex(unittest.TestCase):
+    def test_00_append(self):
+        processed_patch, patched_obj = k8s_config_json_patch.process_patch([{
+            'op': 'add',
+            'path': "/spec/template/spec/containers/[?name='app']/env/[?name='NEWVAR']/value",
+            'value': 'new'
+        },{
+            'op': 'replace',
+            'path': "/spec/template/spec/containers/[?name='app']/env/[?name='NEWVAR']/value",
+            'value': 'updated'
+        }], deployment)
+        self.assertEqual(processed_patch[1], {
+            'op': 'replace',
+            'path': '/spec/template/spec/containers/0/env/2/value',
+            'value': 'updated'
+        })
+
+    def test_01_first_match_after_changes(self):
+        obj = {'items': [{'name': 'a', 'n': 0}, {'name': 'b', 'n': 1}, {'name': 'a', 'n': 2}]}
+        processed_patch, patched_obj = k8s_config_json_patch.process_patch([
+            {'op': 'test', 'path': "/items/[?name='b']/n", 'value': 1},
+            {'op': 'remove', 'path': "/items/[?name='a']"},
+            {'op': 'test', 'path': "/items/[?name='a']/n", 'value': 2},
+            {'op': 'replace', 'path': "/items/[?name='b']/name", 'value': 'a'},
+            {'op': 'test', 'path': "/items/[?name='a']/n", 'value': 1},
+        ], obj)
+        self.assertEqual([operation['path'] for operation in processed_patch], [
+            '/items/1/n', '/items/0', '/items/1/n', '/items/0/name', '/items/0/n'
+        ])
+        self.assertEqual(obj['items'][0], {'name': 'a', 'n': 0})
+
+class TestJsonPatchCopyOnWrite(unittest.TestCase):
+    def test_00_existing_unmodified(self):
+        existing = copy.deepcopy(deployment)
+        processed_patch, patched_obj = k8s_config_json_patch.process_patch([{
+            'op': 'add',
+            'path': "/spec/template/spec/containers/[?name='app']/env/[?name='VAR1']/value",
+            'value': 'updated'
+        },{
+            'op': 'remove',
+            'path': "/spec/template/spec/containers/[?name='app']/env/[?name='VAR2']"
+        }], existing)
+        self.assertEqual(existing, deployment)
+        self.assertEqual(patched_obj['spec']['template']['spec']['containers'][0]['env'], [
+            {'name': 'VAR1', 'value': 'updated'}
+        ])
+        # Unchanged values are shared
+        self.assertIs(patched_obj['metadata'], existing['metadata'])
+        self.assertIsNot(patched_obj['spec'], existing['spec'])
+
+    def test_01_copy_then_change(self):
+        existing = {'a': {'b': {'c': 1}}}
+        processed_patch, patched_obj = k8s_config_json_patch.process_patch([
+            {'op': 'copy', 'from': '/a', 'path': '/x'},
+            {'op': 'replace', 'path': '/x/b/c', 'value': 2},
+        ], existing)
+        self.assertEqual(existing, {'a': {'b': {'c': 1}}})
+        self.assertEqual(patched_obj['x'], {'b': {'c': 2}})
+        # The copy is not shared with its source
+        self.assertEqual(patched_obj['a'], {'b': {'c': 1}})
+
+    def test_02_processed_unchanged(self):
+        existing = {'a': {'b': 1}}
+        processed_patch, patched_obj = k8s_config_json_patch.process_patch([
+            {'op': 'replace', 'path': '/a', 'value': {'b': 2}},
+            {'op': 'add', 'path': '/a/c', 'value': 3},
+            {'op': 'copy', 'from': '/a', 'path': '/a/d'},
+        ], existing)
+        self.assertEqual(processed_patch, [
+            {'op': 'replace', 'path': '/a', 'value': {'b': 2}},
+            {'op': 'add', 'path': '/a/c', 'value': 3},
+            {'op': 'add', 'path': '/a/d', 'value': {'b': 2, 'c': 3}},
+        ])
+        self.assertEqual(patched_obj, {'a': {'b': 2, 'c': 3, 'd': {'b': 2, 'c': 3}}})
+        self.assertEqual(k8s_config_json_patch.apply_patch(processed_patch, existing), patched_obj)
+
+class TestJsonPatchMinimize(unittest.TestCase):
+    def test_00_superseded(self):
+        self.assertEqual(k8s_config_json_patch.minimize_patch([
+            {'op': 'add', 'path': '/metadata/labels', 'value': {'a': '1'}},
+            {'op': 'replace', 'path': '/spec/replicas', 'value': 2},
+            {'op': 'remove', 'path': '/spec/strategy/type'},
+            {'op': 'replace', 'path': '/metadata/labels', 'value': {'b': '2'}},
+            {'op': 'replace', 'path': '/spec/replicas', 'value': 3},
+            {'op': 'remove', 'path': '/spec/strategy'},
+        ]), [
+            {'op': 'add', 'path': '/metadata/labels', 'value': {'b': '2'}},
+            {'op': 'replace', 'path': '/spec/replicas', 'value': 3},
+            {'op': 'remove', 'path': '/spec/strategy'},
+        ])
+
+    def test_01_merge_adds(self):
+        json_patch = [
+            {'op': 'add', 'path': '/metadata/annotations', 'value': {}},
+            {'op': 'add', 'path': '/metadata/annotations/a', 'value': {'x': '1'}},
+            {'op': 'test', 'path': '/metadata/annotations/a/x', 'value': '1'},
+            {'op': 'add', 'path': '/metadata/annotations/a/y', 'value': '2'},
+        ]
+        self.assertEqual(k8s_config_json_patch.minimize_patch(json_patch), [
+            {'op': 'add', 'path': '/metadata/annotations', 'value': {'a': {'x': '1', 'y': '2'}}},
+        ])
+        # Added values are copied rather than changed
+        self.assertEqual(json_patch[0]['value'], {})
+
+    def test_02_tests(self):
+        self.assertEqual(k8s_config_json_patch.minimize_patch([
+            {'op': 'test', 'path': '/spec/replicas', 'value': 1},
+            {'op': 'test', 'path': '/spec/strategy', 'value': {'type': 'Recreate'}},
+            {'op': 'test', 'path': '/spec/strategy/type', 'value': 'Recreate'},
+        ]), [])
+        self.assertEqual(k8s_config_json_patch.minimize_patch([
+            {'op': 'test', 'path': '/spec/strategy', 'value': {'type': 'Recreate'}},
+            {'op': 'test', 'path': '/spec/strategy/type', 'value': 'Recreate'},
+            {'op': 'remove', 'path': '/spec/template/spec/containers/0/env/0'},
+            {'op': 'test', 'path': '/spec/template/spec/containers/0/env/0/name', 'value': 'VAR2'},
+            {'op': 'replace', 'path': '/spec/strategy/type', 'value': 'RollingUpdate'},
+            {'op': 'test', 'path': '/spec/strategy/type', 'value': 'RollingUpdate'},
+        ]), [
+            {'op': 'test', 'path': '/spec/strategy', 'value': {'type': 'Recreate'}},
+            {'op': 'remove', 'path': '/spec/template/spec/containers/0/env/0'},
+            {'op': 'test', 'path': '/spec/template/spec/containers/0/env/0/name', 'value': 'VAR2'},
+            {'op': 'replace', 'path': '/spec/strategy/type', 'value': 'RollingUpdate'},
+        ])
+
+    def test_03_list_positions(self):
+        # Items at the same index before and after a removal differ
+        json_patch = [
+            {'op': 'replace', 'path': '/spec/template/spec/containers/0/env/1/value', 'value': 'a'},
+            {'op': 'remove', 'path': '/spec/template/spec/containers/0/env/0'},
+            {'op': 'replace', 'path': '/spec/template/spec/containers/0/env/0/value', 'value': 'b'},
+        ]
+        self.assertEqual(k8s_config_json_patch.minimize_patch(json_patch), json_patch)
+
+    def test_04_same_patched_obj(self):
+        env = "/spec/template/spec/containers/[?name='app']/env"
+        for json_patch in ([
+            {'op': 'add', 'path': env + "/[?name='VAR3']/value", 'value': 'value3'},
+            {'op': 'add', 'path': env + "/[?name='VAR3']/valueFrom", 'value': {}},
+            {'op': 'remove', 'path': env + "/[?name='VAR3']/valueFrom"},
+            {'op': 'replace', 'path': env + "/[?name='VAR1']/value", 'value': 'a'},
+            {'op': 'replace', 'path': env + "/[?name='VAR1']/value", 'value': 'b'},
+        ], [
+            {'op': 'test', 'path': env + "/[?name='VAR1']/value", 'value': 'value1', 'operations': [
+                {'op': 'test', 'path': '/spec/replicas', 'value': 1, 'operations': [
+                    {'op': 'add', 'path': '/metadata/labels/a', 'value': '1'},
+                    {'op': 'add', 'path': '/metadata/labels/b', 'value': '2'},
+                ]},
+                {'op': 'remove', 'path': env + "/[?name='VAR2']"},
+                {'op': 'add', 'path': env + "/[?name='VAR2']", 'value': {'name': 'VAR2', 'value': 'new'}},
+            ]},
+            {'op': 'move', 'from': '/metadata/labels', 'path': '/metadata/annotations'},
+            {'op': 'replace', 'path': '/spec/strategy', 'value': {'type': 'RollingUpdate'}},
+        ], [
+            {'op': 'test', 'path': '/spec/replicas', 'state': 'present', 'operations': [
+                {'op': 'remove', 'path': '/spec/replicas'},
+            ]},
+            {'op': 'add', 'path': '/spec/replicas', 'value': 1},
+        ]):
+            processed_patch, patched_obj = k8s_config_json_patch.process_patch(json_patch, deployment)
+            minimized = k8s_config_json_patch.minimize_patch(processed_patch)
+            self.assertLess(len(minimized), len(processed_patch))
+            self.assertEqual(k8s_config_json_patch.apply_patch(processed_patch, deployment), patched_obj)
+            self.assertEqual(k8s_config_json_patch.apply_patch(minimized, deployment), patched_obj)
+
+    def test_05_move_into_superseded(self):
+        # Only removing the source remains of a move into a value which is later replaced
+        json_patch = [
+            {'op': 'add', 'path': '/metadata/labels', 'value': {'a': '1'}},
+            {'op': 'move', 'from': '/spec/strategy', 'path': '/metadata/labels/a'},
+            {'op': 'replace', 'path': '/metadata/labels', 'value': {'b': '2'}},
+        ]
+        self.assertEqual(k8s_config_json_patch.minimize_patch(json_patch), [
+            {'op': 'remove', 'path': '/spec/strategy'},
+            {'op': 'add', 'path': '/metadata/labels', 'value': {'b': '2'}},
+        ])
+        self.assertEqual(
+            k8s_config_json_patch.apply_patch(k8s_config_json_patch.minimize_patch(json_patch), deployment),
+            k8s_config_json_patch.apply_patch(json_patch, deployment)
+        )
+
+class FakeList(object):
+    def __init__(self, result):
+        self.result = result
+
+    def to_dict(self):
+        return self.result
+
+class FakeResource(object):
+    kind = 'ConfigMap'
+    group_version = 'v1'
+    namespaced = True
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def get(self, **params):
+        self.requests.append(params)
+        page = int(params.get('_continue', 0))
+        metadata = {'continue': str(page + 1)} if page + 1 < len(self.pages) else {}
+        return FakeList({'metadata': metadata, 'items': [
+            {'metadata': {'name': name, 'namespace': 'myproject'}} for name in self.pages[page]
+        ]})
+
+class FakeModuleFailed(Exception):
+    pass
+
+class FakeJsonPatchModule(object):
+    namespace = 'myproject'
+    check_mode = True
+    list_targets = k8s_config_json_patch.KubernetesJsonPatchModule.list_targets
+    patch_selected = k8s_config_json_patch.KubernetesJsonPatchModule.patch_selected
+    process = k8s_config_json_patch.KubernetesJsonPatchModule.process
+    send_patch = k8s_config_json_patch.KubernetesJsonPatchModule.send_patch
+
+    def __init__(self, names=None, **params):
+        self.names = names
+        self.params = params
+
+    def fail_json(self, **result):
+        raise FakeModuleFailed(result['msg'])
+
+    def request_stats(self):
+        return {}
+
+class TestJsonPatchListTargets(unittest.TestCase):
+    def test_00_pages(self):
+        resource = FakeResource([['a', 'b'], ['c']])
+        module = FakeJsonPatchModule(label_selectors=['app=myapp'], all_namespaces=True)
+        targets = list(module.list_targets(resource, limit=2))
+        self.assertEqual([item['metadata']['name'] for item in targets], ['a', 'b', 'c'])
+        self.assertEqual(targets[0]['kind'], 'ConfigMap')
+        self.assertEqual(resource.requests, [
+            {'limit': 2, 'label_selector': 'app=myapp'},
+            {'limit': 2, 'label_selector': 'app=myapp', '_continue': '1'},
+        ])
+
+    def test_01_names(self):
+        resource = FakeResource([['a', 'b', 'c']])
+        module = FakeJsonPatchModule(names=['c', 'a'])
+        self.assertEqual([item['metadata']['name'] for item in module.list_targets(resource)], ['a', 'c'])
+        self.assertEqual(resource.requests, [{'limit': 500, 'namespace': 'myproject'}])
+        resource = FakeResource([['b']])
+        module = FakeJsonPatchModule(names=['b'], field_selectors=['status.phase=Running'])
+        list(module.list_targets(resource))
+        self.assertEqual(resource.requests[0]['field_selector'], 'status.phase=Running,metadata.name=b')
+
+    def test_02_namespace_required(self):
+        resource = FakeResource([['a']])
+        module = FakeJsonPatchModule(label_selectors=['app=myapp'])
+        module.namespace = ''
+        with self.assertRaises(FakeModuleFailed) as cm:
+            module.patch_selected(resource)
+        self.assertEqual(str(cm.exception), 'namespace or all_namespaces is required to select ConfigMap objects')
+        self.assertEqual(resource.requests, [])
+        module.params['all_namespaces'] = True
+        module.patch = []
+        module.patch_selected(resource)
+        self.assertEqual(resource.requests, [{'limit': 500, 'label_selector': 'app=myapp'}])
+
+    def test_03_unchanged_results(self):
+        module = FakeJsonPatchModule(names=['a', 'b'])
+        module.patch = [{'op': 'add', 'path': '/metadata/name', 'value': 'a'}]
+        result = module.patch_selected(FakeResource([['a', 'b']]))
+        self.assertEqual(result['results'][0], {
+            'apiVersion': 'v1', 'kind': 'ConfigMap', 'name': 'a', 'namespace': 'myproject', 'changed': False,
+        })
+        self.assertEqual(result['results'][1]['json_patch'], [{'op': 'replace', 'path': '/metadata/name', 'value': 'a'}])
+        self.assertEqual(result['results'][1]['resource']['metadata']['name'], 'a')
+        self.assertEqual(result['summary'], {'matched': 2, 'changed': 1, 'unchanged': 1, 'failed': 0})
+
+class FakeApiException(Exception):
+    def __init__(self, status):
+        self.status = status
+        self.reason = 'Conflict'
+        self.body = 'conflict'
+        self.headers = {}
+
+class FakeRacingResource(object):
+    """ Resource for which patches fail while the object is changed by another client """
+    def __init__(self, races):
+        self.races = races
+        self.obj = {'metadata': {'name': 'a', 'resourceVersion': '1'}, 'data': {}}
+        self.patches = []
+
+    def get(self, **params):
+        return FakeList(copy.deepcopy(self.obj))
+
+    def patch(self, json_patch, **params):
+        self.patches.append(json_patch)
+        if self.races:
+            self.races -= 1
+            self.obj['data']['other'] = str(self.races)
+            self.obj['metadata']['resourceVersion'] = str(int(self.obj['metadata']['resourceVersion']) + 1)
+        if json_patch[0]['value'] != self.obj['metadata']['resourceVersion']:
+            raise DynamicApiError(FakeApiException(422))
+        self.obj = k8s_config_json_patch.process_patch(json_patch, self.obj)[1]
+        return FakeList(self.obj)
+
+class TestJsonPatchSendPatch(unittest.TestCase):
+    def setUp(self):
+        self.module = FakeJsonPatchModule(optimistic_concurrency=True, conflict_retries=2)
+        self.module.patch = [{'op': 'add', 'path': '/data/key', 'value': 'value'}]
+        self.module.request_scheduler = RequestScheduler(backoff=0)
+
+    def test_00_conflict_retry(self):
+        resource = FakeRacingResource(2)
+        k8s_obj, processed_patch, attempts = self.module.send_patch(
+            resource, 'a', None, '1', [{'op': 'add', 'path': '/data/key', 'value': 'value'}]
+        )
+        self.assertEqual(attempts, 3)
+        self.assertEqual(k8s_obj['data'], {'key': 'value', 'other': '0'})
+        self.assertEqual([json_patch[0]['value'] for json_patch in resource.patches], ['1', '2', '3'])
+
+    def test_01_retries_exhausted(self):
+        resource = FakeRacingResource(3)
+        with self.assertRaises(DynamicApiError):
+            self.module.send_patch(resource, 'a', None, '1', [{'op': 'add', 'path': '/data/key', 'value': 'value'}])
+        self.assertEqual(len(resource.patches), 3)
+
 class TestJsonPatch(unittest.TestCase):
     def test_00(self):
         deployment_copy = copy.deepcopy(deployment)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+"""
+Property tests of JSON patch processing on randomly generated objects and
+patches. Generated cases are reproducible from the seed, which may be set
+with JSON_PATCH_FUZZ_SEED along with the number of cases per property with
+JSON_PATCH_FUZZ_CASES. Processed patches are applied with the module's
+own RFC 6902 apply_patch as the reference implementation, and also with
+the jsonpatch library when it is installed.
+"""
+
+import copy
+import os
+import random
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../library'))
+
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
+from k8s_config_json_patch import JsonPatchFailException, apply_patch, minimize_patch, path_from_list, process_patch
+
+try:
+    import jsonpatch
+except ImportError:
+    jsonpatch = None
+
+# Reference implementations applying a patch to an object
+REFERENCES = [('apply_patch', lambda obj, json_patch: apply_patch(json_patch, obj))]
+if jsonpatch is not None:
+    REFERENCES.append(('jsonpatch', jsonpatch.apply_patch))
+
+SEED = int(os.environ.get('JSON_PATCH_FUZZ_SEED', 6902))
+CASES = int(os.environ.get('JSON_PATCH_FUZZ_CASES', 300))
+
+NAMES = ['app', 'proxy', 'VAR1', 'VAR2', 'VAR3', 'name', 'value']
+
+def random_scalar(rand):
+    return rand.choice(['value1', 'value2', '500m', '', 0, 1, 42, True, False, None])
+
+def random_value(rand, depth):
+    """ Random JSON value, with lists of items with unique names which may be queried """
+    kind = rand.random()
+    if depth <= 0 or kind < 0.35:
+        return random_scalar(rand)
+    elif kind < 0.7:
+        return dict(
+            (rand.choice(NAMES) + str(i), random_value(rand, depth - 1)) for i in range(rand.randint(0, 4))
+        )
+    elif kind < 0.85:
+        return [
+            {'name': name, 'value': random_value(rand, depth - 1)}
+            for name in rand.sample(NAMES, rand.randint(0, 4))
+        ]
+    return [random_scalar(rand) for i in range(rand.randint(0, 4))]
+
+def random_object(rand, depth=4):
+    return {
+        'apiVersion': 'v1',
+        'kind': 'ConfigMap',
+        'metadata': {'name': 'fuzz', 'labels': dict((name, 'true') for name in rand.sample(NAMES, 2))},
+        'spec': {'items': random_value(rand, depth)},
+    }
+
+def object_paths(value, path=(), queries=False):
+    """
+    Generate paths in value as tuples of keys, with the value at each path.
+    Given queries, named list items are given by list query and other list
+    items are skipped.
+    """
+    yield path, value
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list) and queries:
+        items = [
+            ("[?name='{0}']".format(item['name']), item)
+            for item in value if isinstance(item, dict) and 'name' in item
+        ]
+    elif isinstance(value, list):
+        items = [(str(i), item) for i, item in enumerate(value)]
+    else:
+        return
+    for key, item in items:
+        for item_path in object_paths(item, path + (key,), queries):
+            yield item_path
+
+def random_operation(rand, obj):
+    """ Random operation on existing or new paths of obj, including list indexes and ends """
+    paths = [path for path, value in object_paths(obj) if path] or [('metadata',)]
+    path = rand.choice(paths)
+    position = rand.random()
+    if position < 0.3:
+        path = path + (rand.choice(NAMES),)
+    elif position < 0.45:
+        path = path[:-1] + (rand.choice(['-', '0', '1']),)
+    operation = {'op': rand.choice(['add', 'add', 'remove', 'replace', 'copy', 'move', 'test'])}
+    operation['path'] = path_from_list(path)
+    if operation['op'] in ('add', 'replace'):
+        operation['value'] = random_value(rand, 2)
+    elif operation['op'] in ('copy', 'move'):
+        operation['from'] = path_from_list(rand.choice(paths))
+    elif operation['op'] == 'test':
+        operation['state'] = rand.choice(['present', 'absent', 'unequal'])
+        operation['value'] = random_value(rand, 1)
+        operation['operations'] = [{'op': 'add', 'path': path_from_list(path + ('added',)), 'value': 1}]
+    return operation
+
+def random_patch(rand, obj, length):
+    """ Random patch of operations which may each be processed in turn """
+    json_patch = []
+    for i in range(length):
+        operation = random_operation(rand, obj)
+        try:
+            obj = process_patch([operation], obj)[1]
+        except JsonPatchFailException:
+            continue
+        json_patch.append(operation)
+    return json_patch
+
+def is_disjoint(path, paths):
+    return all(path[:len(other)] != other and other[:len(path)] != path for other in paths)
+
+def random_declarative_patch(rand, obj, length):
+    """
+    Random patch describing a desired state, of operations on distinct paths
+    which neither contain each other nor are list indexes, so processing the
+    patch again should find nothing to change. List items are added and
+    removed by list query, and their names are left unchanged.
+    """
+    paths = []
+    new_paths = []
+    for path, value in object_paths(obj, queries=True):
+        if path and path[-1] != 'name':
+            paths.append(path)
+        if isinstance(value, dict):
+            new_paths.append(path + (rand.choice(NAMES) + '_new',))
+        elif isinstance(value, list) and all(isinstance(item, dict) for item in value):
+            new_paths.append(path + ("[?name='{0}_new']".format(rand.choice(NAMES)),))
+    used = []
+    json_patch = []
+    for i in range(length):
+        op = rand.choice(['add', 'add', 'remove', 'copy', 'test'])
+        if op == 'remove':
+            path = rand.choice(paths)
+        else:
+            path = rand.choice(new_paths + [path for path in paths if not path[-1].startswith('[?')])
+        if not is_disjoint(path, used):
+            continue
+        value = random_value(rand, 2)
+        if path[-1].startswith('[?'):
+            # Items are added by list query with a dict value
+            op = 'test' if op == 'copy' else op
+            value = {'value': value}
+        operation = {'op': op, 'path': path_from_list(path)}
+        if op == 'add':
+            operation['value'] = value
+        elif op == 'copy':
+            from_path = rand.choice(paths)
+            if not is_disjoint(from_path, used + [path]):
+                continue
+            operation['from'] = path_from_list(from_path)
+            used.append(from_path)
+        elif op == 'test':
+            operation['state'] = 'absent'
+            operation['operations'] = [{'op': 'add', 'value': value}]
+        used.append(path)
+        json_patch.append(operation)
+    return json_patch
+
+class TestJsonPatchProperties(unittest.TestCase):
+    def cases(self, generate_patch, seed):
+        rand = random.Random(seed)
+        for case in range(CASES):
+            obj = random_object(rand)
+            json_patch = generate_patch(rand, obj, rand.randint(1, 12))
+            yield 'seed {0} case {1}: {2!r} on {3!r}'.format(seed, case, json_patch, obj), obj, json_patch
+
+    def assertAppliedAsProcessed(self, processed_patch, existing, patched_obj, msg):
+        snapshot = copy.deepcopy(existing)
+        minimized_patch = minimize_patch(processed_patch)
+        for name, reference_apply in REFERENCES:
+            self.assertEqual(reference_apply(existing, processed_patch), patched_obj, name + ' ' + msg)
+            self.assertEqual(reference_apply(existing, minimized_patch), patched_obj, name + ' ' + msg)
+        self.assertEqual(existing, snapshot, msg)
+
+    def test_00_processed_patch_applies(self):
+        for msg, obj, json_patch in self.cases(random_patch, SEED):
+            processed_patch, patched_obj = process_patch(json_patch, obj)
+            self.assertAppliedAsProcessed(processed_patch, obj, patched_obj, msg)
+
+    def test_01_declarative_patch_applies(self):
+        for msg, obj, json_patch in self.cases(random_declarative_patch, SEED + 1):
+            processed_patch, patched_obj = process_patch(json_patch, obj)
+            self.assertAppliedAsProcessed(processed_patch, obj, patched_obj, msg)
+
+    def test_02_idempotent(self):
+        for msg, obj, json_patch in self.cases(random_declarative_patch, SEED + 2):
+            patched_obj = process_patch(json_patch, obj)[1]
+            processed_patch, repatched_obj = process_patch(json_patch, patched_obj)
+            # Processed tests of the desired state remain, which minimize to nothing
+            self.assertEqual(minimize_patch(processed_patch), [], msg)
+            self.assertEqual(repatched_obj, patched_obj, msg)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
+from kubernetes.client import Configuration
+from kubernetes.client.rest import ApiException
+from ansible.module_utils.k8s_config_agent import AgentRESTClient, AgentServer, agent_socket_dir
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, obj):
+        FakeApiHandler.connections.add(self.client_address)
+        data = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.startswith('/api/v1/namespaces/missing'):
+            self.reply(404, {'kind': 'Status', 'code': 404, 'reason': 'NotFound'})
+        else:
+            self.reply(200, {'path': self.path, 'authorization': self.headers.get('Authorization')})
+
+    def do_PATCH(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.reply(200, {'content_type': self.headers['Content-Type'], 'body': json.loads(body.decode('utf-8'))})
+
+class FakeApiServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class TestAgent(unittest.TestCase):
+    def setUp(self):
+        FakeApiHandler.connections = set()
+        self.api = FakeApiServer(('127.0.0.1', 0), FakeApiHandler)
+        threading.Thread(target=self.api.serve_forever).start()
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmpdir, 'agent.sock')
+        self.agent = AgentServer(self.socket_path)
+        threading.Thread(target=self.agent.serve_forever).start()
+        self.configuration = Configuration()
+        self.configuration.host = 'http://127.0.0.1:{0}'.format(self.api.server_address[1])
+
+    def tearDown(self):
+        self.api.shutdown()
+        self.api.server_close()
+        self.agent.shutdown()
+        self.agent.server_close()
+        shutil.rmtree(self.tmpdir)
+        shutil.rmtree(self.agent.tls_dir)
+
+    def url(self, path):
+        return self.configuration.host + path
+
+    def test_00_get(self):
+        client = AgentRESTClient(self.socket_path, self.configuration)
+        r = client.GET(
+            self.url('/api/v1/namespaces'), query_params=[('limit', 1)], headers={'Authorization': 'Bearer x'}
+        )
+        self.assertEqual(r.status, 200)
+        self.assertEqual(r.getheader('content-type'), 'application/json')
+        self.assertEqual(json.loads(r.data), {'path': '/api/v1/namespaces?limit=1', 'authorization': 'Bearer x'})
+
+    def test_01_connection_reused_across_clients(self):
+        for i in range(3):
+            client = AgentRESTClient(self.socket_path, self.configuration)
+            client.GET(self.url('/api/v1/namespaces'), _preload_content=False)
+        self.assertEqual(len(FakeApiHandler.connections), 1)
+
+    def test_02_error_status(self):
+        client = AgentRESTClient(self.socket_path, self.configuration)
+        with self.assertRaises(ApiException) as cm:
+            client.GET(self.url('/api/v1/namespaces/missing'))
+        self.assertEqual(cm.exception.status, 404)
+        self.assertEqual(json.loads(cm.exception.body)['reason'], 'NotFound')
+
+    def test_03_patch_body(self):
+        client = AgentRESTClient(self.socket_path, self.configuration)
+        r = client.PATCH(
+            self.url('/api/v1/namespaces/test'),
+            headers={'Content-Type': 'application/merge-patch+json'},
+            body={'metadata': {'labels': {'a': 'b'}}},
+        )
+        self.assertEqual(json.loads(r.data), {
+            'content_type': 'application/merge-patch+json',
+            'body': {'metadata': {'labels': {'a': 'b'}}},
+        })
+
+    def test_04_fallback_without_agent(self):
+        client = AgentRESTClient(os.path.join(self.tmpdir, 'missing.sock'), self.configuration)
+        r = client.GET(self.url('/api/v1/namespaces'))
+        self.assertEqual(r.status, 200)
+        self.assertFalse(client.agent_available)
+
+    def test_05_exit_with_parent(self):
+        parent = subprocess.Popen([sys.executable, '-c', 'pass'])
+        parent.wait()
+        agent = AgentServer(os.path.join(self.tmpdir, 'exit.sock'), parent_pid=parent.pid)
+        monitor = threading.Thread(target=agent.monitor, kwargs=dict(interval=0.01))
+        monitor.start()
+        agent.serve_forever(poll_interval=0.01)
+        monitor.join()
+        agent.server_close()
+        shutil.rmtree(agent.tls_dir)
+
+    def test_06_untrusted_socket_dir(self):
+        os.chmod(self.tmpdir, 0o755)
+        client = AgentRESTClient(self.socket_path, self.configuration)
+        r = client.GET(self.url('/api/v1/namespaces'))
+        self.assertEqual(r.status, 200)
+        self.assertFalse(client.agent_available)
+
+    def test_07_agent_socket_dir(self):
+        home = os.environ.get('HOME')
+        os.environ['HOME'] = self.tmpdir
+        try:
+            path = agent_socket_dir()
+            self.assertEqual(path, os.path.join(self.tmpdir, '.ansible', 'k8s_config_agent'))
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o700)
+            self.assertEqual(agent_socket_dir(), path)
+            os.chmod(path, 0o777)
+            with self.assertRaises(OSError):
+                agent_socket_dir()
+        finally:
+            if home is None:
+                del os.environ['HOME']
+            else:
+                os.environ['HOME'] = home
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
+from ansible.module_utils import basic
+from ansible.plugins.action import ActionBase
+from ansible.module_utils.k8s_config_controller import execute_module
+
+TEST_MODULE = '''
+from ansible.module_utils.basic import AnsibleModule
+
+# Module state is kept between runs in process, as API_CLIENTS is between loop items
+RUNS = []
+
+def main():
+    module = AnsibleModule(argument_spec=dict(
+        name=dict(type='str'),
+        fail=dict(type='bool', default=False),
+        error=dict(type='bool', default=False),
+    ))
+    RUNS.append(module.params['name'])
+    print('output before the result is captured')
+    if module.params['error']:
+        raise ValueError('unexpected')
+    if module.params['fail']:
+        module.fail_json(msg='failed {0}'.format(module.params['name']))
+    module.exit_json(changed=True, name=module.params['name'], runs=len(RUNS))
+'''
+
+BROKEN_MODULE = '''
+import k8s_config_missing_library
+'''
+
+class FakeConnection(object):
+    def __init__(self, transport):
+        self.transport = transport
+
+class FakeModuleLoader(object):
+    def __init__(self, module_dir):
+        self.module_dir = module_dir
+
+    def find_plugin(self, name, mod_type=None):
+        return os.path.join(self.module_dir, name + mod_type)
+
+class FakeSharedLoader(object):
+    def __init__(self, module_dir):
+        self.module_loader = FakeModuleLoader(module_dir)
+
+class FakeAction(object):
+    """ Action plugin interface used by execute_module, recording modules executed by Ansible """
+    _used_interpreter = None
+    _parse_returned_data = ActionBase._parse_returned_data
+
+    def __init__(self, module_dir, transport='local'):
+        self._connection = FakeConnection(transport)
+        self._shared_loader_obj = FakeSharedLoader(module_dir)
+        self.executed = []
+
+    def _update_module_args(self, module_name, module_args, task_vars):
+        module_args['_ansible_check_mode'] = False
+        module_args['_ansible_no_log'] = True
+        module_args['_ansible_module_name'] = module_name
+
+    def _execute_module(self, module_name, module_args, task_vars):
+        self.executed.append((module_name, module_args))
+        return dict(executed=True)
+
+class TestExecuteModule(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.module_dir = tempfile.mkdtemp()
+        for name, source in (('k8s_config_test', TEST_MODULE), ('k8s_config_test_broken', BROKEN_MODULE)):
+            with open(os.path.join(cls.module_dir, name + '.py'), 'w') as f:
+                f.write(source)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.module_dir)
+
+    def execute(self, module_args, module_name='k8s_config_test', transport='local'):
+        self.action = FakeAction(self.module_dir, transport)
+        stdout = sys.stdout
+        result = execute_module(self.action, module_name, dict(module_args, in_process=True), {})
+        self.assertIs(sys.stdout, stdout)
+        self.assertIsNone(basic._ANSIBLE_ARGS)
+        return result
+
+    def test_00_success(self):
+        result = self.execute(dict(name='a'))
+        self.assertTrue(result['changed'])
+        self.assertEqual(result['name'], 'a')
+        self.assertNotIn('failed', result)
+        self.assertEqual(self.action.executed, [])
+
+    def test_01_failure(self):
+        result = self.execute(dict(name='b', fail=True))
+        self.assertTrue(result['failed'])
+        self.assertEqual(result['msg'], 'failed b')
+
+    def test_02_exception(self):
+        result = self.execute(dict(name='c', error=True))
+        self.assertTrue(result['failed'])
+        self.assertEqual(result['msg'], 'Module failure in process: unexpected')
+        self.assertIn('ValueError', result['exception'])
+
+    def test_03_arguments_not_shared(self):
+        self.assertEqual(self.execute(dict(name='d', fail=True))['msg'], 'failed d')
+        result = self.execute(dict())
+        self.assertIsNone(result['name'])
+        self.assertNotIn('failed', result)
+
+    def test_04_module_state_reused(self):
+        runs = self.execute(dict(name='e'))['runs']
+        self.assertEqual(self.execute(dict(name='f'))['runs'], runs + 1)
+
+    def test_05_fallback(self):
+        result = self.execute(dict(name='g'), module_name='k8s_config_test_broken')
+        self.assertEqual(result, dict(executed=True))
+        self.assertEqual(self.action.executed, [('k8s_config_test_broken', dict(name='g'))])
+
+        result = self.execute(dict(name='h'), transport='ssh')
+        self.assertEqual(result, dict(executed=True))
+        self.assertEqual(self.action.executed, [('k8s_config_test', dict(name='h'))])
+
+if __name__ == '__main__':
+    unittest.main()
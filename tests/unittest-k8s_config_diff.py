@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
+from ansible.module_utils.k8s_config_diff import \
+    DEFAULT_DIFF_IGNORE, MISSING, compile_ignore, diff_paths, format_diff, objects_differ
+
+existing = {
+    'apiVersion': 'apps/v1',
+    'kind': 'Deployment',
+    'metadata': {
+        'name': 'myapp',
+        'namespace': 'mynamespace',
+        'generation': 3,
+        'resourceVersion': '1234',
+        'managedFields': [{
+            'manager': 'kubectl',
+            'operation': 'Update'
+        }]
+    },
+    'spec': {
+        'replicas': 1,
+        'template': {
+            'spec': {
+                'containers': [{
+                    'name': 'app',
+                    'image': 'app:1'
+                }]
+            }
+        }
+    },
+    'status': {
+        'readyReplicas': 1
+    }
+}
+
+updated = {
+    'apiVersion': 'apps/v1',
+    'kind': 'Deployment',
+    'metadata': {
+        'name': 'myapp',
+        'namespace': 'mynamespace',
+        'generation': 4,
+        'resourceVersion': '1240',
+        'managedFields': [{
+            'manager': 'k8s_config',
+            'operation': 'Apply'
+        }]
+    },
+    'spec': {
+        'replicas': 1,
+        'template': {
+            'spec': {
+                'containers': [{
+                    'name': 'app',
+                    'image': 'app:1'
+                }]
+            }
+        }
+    }
+}
+
+ignore = compile_ignore(DEFAULT_DIFF_IGNORE)
+
+class TestCompileIgnore(unittest.TestCase):
+    def test_00_tree(self):
+        self.assertEqual(ignore, {
+            'metadata': {'generation': True, 'managedFields': True, 'resourceVersion': True},
+            'status': True
+        })
+
+    def test_01_prefix(self):
+        self.assertEqual(compile_ignore(['metadata', 'metadata.generation']), {'metadata': True})
+        self.assertEqual(compile_ignore(['metadata.generation', 'metadata']), {'metadata': True})
+
+class TestObjectsDiffer(unittest.TestCase):
+    def test_00_server_fields_ignored(self):
+        self.assertFalse(objects_differ(existing, updated, ignore))
+
+    def test_01_server_fields_not_ignored(self):
+        self.assertTrue(objects_differ(existing, updated))
+
+    def test_02_nested_change(self):
+        changed = dict(updated, spec=dict(updated['spec'], replicas=2))
+        self.assertTrue(objects_differ(existing, changed, ignore))
+
+    def test_03_added_key(self):
+        changed = dict(updated, data={})
+        self.assertTrue(objects_differ(existing, changed, ignore))
+        self.assertTrue(objects_differ(changed, existing, ignore))
+
+class TestDiffPaths(unittest.TestCase):
+    def test_00_no_changes(self):
+        self.assertEqual(diff_paths(existing, updated, ignore), [])
+
+    def test_01_changes(self):
+        changed = dict(updated, spec={
+            'replicas': 2,
+            'template': {
+                'spec': {
+                    'containers': [{
+                        'name': 'app',
+                        'image': 'app:2'
+                    }]
+                }
+            },
+            'paused': True
+        })
+        self.assertEqual(sorted(diff_paths(existing, changed, ignore)), [
+            ('/spec/paused', MISSING, True),
+            ('/spec/replicas', 1, 2),
+            ('/spec/template/spec/containers/0/image', 'app:1', 'app:2'),
+        ])
+
+    def test_02_escape(self):
+        self.assertEqual(
+            diff_paths({'a/b': {'c~d': 1}}, {'a/b': {}}),
+            [('/a~1b/c~0d', 1, MISSING)]
+        )
+
+    def test_03_format(self):
+        self.assertEqual(
+            format_diff([('/spec/replicas', 1, 2), ('/spec/paused', MISSING, True)], 'Deployment myapp'),
+            {
+                'before_header': 'Deployment myapp',
+                'after_header': 'Deployment myapp',
+                'before': '/spec/replicas: 1\n',
+                'after': '/spec/replicas: 2\n/spec/paused: true\n',
+            }
+        )
+
+if __name__ == '__main__':
+    unittest.main()
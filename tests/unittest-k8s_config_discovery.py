@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
+from kubernetes.client import Configuration
+from kubernetes.client.rest import ApiException
+from ansible.module_utils.k8s_config_discovery import K8sConfigDiscoverer
+
+class Response(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def api_resource(kind, name):
+    return {'kind': kind, 'name': name, 'namespaced': True, 'verbs': ['get', 'list'], 'singularName': ''}
+
+class FakeDiscoveryClient(object):
+    """ API client answering discovery requests, recording request paths """
+
+    def __init__(self):
+        self.configuration = Configuration()
+        self.configuration.host = 'https://api.example.com:6443'
+        self.server_version = 'v1.20.0'
+        self.resources = {
+            'api/v1': [api_resource('ConfigMap', 'configmaps')],
+            'apis/example.com/v1': [api_resource('Widget', 'widgets')],
+        }
+        self.requests = []
+
+    def request(self, method, path, serializer=None, **kwargs):
+        self.requests.append(path)
+        if path == '/version':
+            return {'gitVersion': self.server_version}
+        elif path == '/version/openshift':
+            raise ApiException(status=404, reason='NotFound')
+        elif path == '/apis':
+            return Response(groups=[
+                {
+                    'name': group_version.split('/')[1],
+                    'versions': [{'groupVersion': group_version[5:], 'version': group_version.split('/')[2]}],
+                    'preferredVersion': {'groupVersion': group_version[5:], 'version': group_version.split('/')[2]},
+                }
+                for group_version in sorted(self.resources) if group_version.startswith('apis/')
+            ])
+        return Response(resources=[dict(resource) for resource in self.resources[path]])
+
+    def discovery_requests(self):
+        """ Return and reset discovery requests other than for the server version """
+        requests = [path for path in self.requests if not path.startswith('/version')]
+        self.requests = []
+        return requests
+
+class TestDiscoveryCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmpdir, 'cache', 'discovery.json')
+        self.client = FakeDiscoveryClient()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def discoverer(self, **kwargs):
+        return K8sConfigDiscoverer(self.client, cache_file=self.cache_file, **kwargs)
+
+    def widgets(self, discoverer):
+        return discoverer.search(api_version='example.com/v1', kind='Widget')
+
+    def test_00_cache_reused(self):
+        self.assertEqual(len(self.widgets(self.discoverer())), 1)
+        self.assertEqual(self.client.discovery_requests(), ['/apis', 'apis/example.com/v1'])
+        self.assertEqual(len(self.widgets(self.discoverer())), 1)
+        self.assertEqual(self.client.discovery_requests(), [])
+        self.assertEqual(os.listdir(os.path.dirname(self.cache_file)), ['discovery.json'])
+
+    def test_01_ttl_expired(self):
+        self.widgets(self.discoverer())
+        with open(self.cache_file) as f:
+            cache = json.load(f)
+        cache['timestamp'] = time.time() - 601
+        with open(self.cache_file, 'w') as f:
+            json.dump(cache, f)
+        self.client.discovery_requests()
+        self.widgets(self.discoverer())
+        self.assertEqual(self.client.discovery_requests(), ['/apis', 'apis/example.com/v1'])
+        self.widgets(self.discoverer(ttl=0))
+        self.assertEqual(self.client.discovery_requests(), ['/apis', 'apis/example.com/v1'])
+
+    def test_02_server_version_changed(self):
+        self.widgets(self.discoverer())
+        self.client.discovery_requests()
+        self.client.server_version = 'v1.21.0'
+        discoverer = self.discoverer()
+        self.widgets(discoverer)
+        self.assertEqual(self.client.discovery_requests(), ['/apis', 'apis/example.com/v1'])
+        self.assertEqual(discoverer.version['kubernetes'], {'gitVersion': 'v1.21.0'})
+        self.widgets(self.discoverer())
+        self.assertEqual(self.client.discovery_requests(), [])
+
+    def test_03_invalidate(self):
+        self.widgets(self.discoverer())
+        self.client.discovery_requests()
+        self.widgets(self.discoverer(invalidate=True))
+        self.assertEqual(self.client.discovery_requests(), ['/apis', 'apis/example.com/v1'])
+
+    def test_04_refresh_group(self):
+        discoverer = self.discoverer()
+        self.widgets(discoverer)
+        self.client.resources['apis/example.com/v1'].append(api_resource('Gadget', 'gadgets'))
+        self.client.discovery_requests()
+
+        # Search misses do not reload discovery
+        self.assertEqual(discoverer.search(api_version='example.com/v1', kind='Gadget'), [])
+        self.assertEqual(self.client.discovery_requests(), [])
+
+        self.assertTrue(discoverer.refresh_group('example.com/v1'))
+        self.assertEqual(self.client.discovery_requests(), ['/apis', 'apis/example.com/v1'])
+        self.assertEqual(len(discoverer.search(api_version='example.com/v1', kind='Gadget')), 1)
+        # Each group version is only refreshed once
+        self.assertFalse(discoverer.refresh_group('example.com/v1'))
+        self.assertFalse(discoverer.refresh_group('missing.example.com/v1'))
+
+        # Refreshed group is written to the shared cache
+        self.client.discovery_requests()
+        self.assertEqual(len(self.discoverer().search(api_version='example.com/v1', kind='Gadget')), 1)
+        self.assertEqual(self.client.discovery_requests(), [])
+
+    def test_05_cache_replaced(self):
+        self.widgets(self.discoverer())
+        with open(self.cache_file) as f:
+            cache = f.read()
+        with open(self.cache_file) as reader:
+            self.discoverer(invalidate=True)
+            # Readers of the previous cache still see it whole
+            self.assertEqual(reader.read(), cache)
+        self.assertEqual(os.listdir(os.path.dirname(self.cache_file)), ['discovery.json'])
+
+if __name__ == '__main__':
+    unittest.main()
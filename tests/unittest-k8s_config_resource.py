@@ -0,0 +1,832 @@
+#!/usr/bin/env python
+
+import copy
+import json
+import os
+import sys
+import threading
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../library'))
+
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
+import k8s_config_resource
+
+from ansible.module_utils import basic
+from ansible.module_utils._text import to_bytes
+from kubernetes.client.rest import ApiException
+from openshift.dynamic.exceptions import ConflictError, DynamicApiError, NotFoundError
+from openshift.dynamic.resource import ResourceInstance
+
+crd = {
+    'apiVersion': 'apiextensions.k8s.io/v1',
+    'kind': 'CustomResourceDefinition',
+    'metadata': {
+        'name': 'widgets.example.com'
+    },
+    'spec': {
+        'group': 'example.com',
+        'names': {
+            'kind': 'Widget',
+            'plural': 'widgets'
+        }
+    }
+}
+
+definitions = [{
+    'apiVersion': 'example.com/v1',
+    'kind': 'Widget',
+    'metadata': {'name': 'mywidget'}
+},{
+    'apiVersion': 'apps/v1',
+    'kind': 'Deployment',
+    'metadata': {'name': 'myapp'}
+},{
+    'apiVersion': 'v1',
+    'kind': 'List',
+    'items': [crd, {
+        'apiVersion': 'rbac.authorization.k8s.io/v1',
+        'kind': 'RoleBinding',
+        'metadata': {'name': 'myapp'}
+    }]
+},{
+    'apiVersion': 'v1',
+    'kind': 'ServiceAccount',
+    'metadata': {'name': 'myapp'}
+},{
+    'apiVersion': 'v1',
+    'kind': 'Namespace',
+    'metadata': {'name': 'myapp'}
+}]
+
+class TestDependencyWaves(unittest.TestCase):
+    def test_00_custom_resource_kinds(self):
+        self.assertEqual(
+            k8s_config_resource.custom_resource_kinds(definitions),
+            set([('example.com', 'Widget')])
+        )
+
+    def test_01_dependency_wave(self):
+        custom_kinds = set([('example.com', 'Widget')])
+        self.assertEqual(k8s_config_resource.dependency_wave(definitions[0], custom_kinds), 'custom-resources')
+        self.assertEqual(k8s_config_resource.dependency_wave(definitions[1], custom_kinds), 'workloads')
+        self.assertEqual(k8s_config_resource.dependency_wave(crd, custom_kinds), 'crds')
+        self.assertEqual(k8s_config_resource.dependency_wave(definitions[3], custom_kinds), 'rbac')
+        self.assertEqual(k8s_config_resource.dependency_wave(definitions[4], custom_kinds), 'namespaces')
+
+    def test_02_unknown_custom_resource(self):
+        self.assertEqual(k8s_config_resource.dependency_wave(definitions[0], set()), 'workloads')
+
+    def test_03_dependency_waves(self):
+        flattened = list(k8s_config_resource.iter_definitions(definitions))
+        waves = k8s_config_resource.dependency_waves(flattened, set([('example.com', 'Widget')]))
+        self.assertEqual(waves, [
+            ('namespaces', [5]),
+            ('crds', [2]),
+            ('rbac', [3, 4]),
+            ('workloads', [1]),
+            ('custom-resources', [0]),
+        ])
+
+    def test_04_dependency_waves_reverse(self):
+        flattened = list(k8s_config_resource.iter_definitions(definitions))
+        waves = k8s_config_resource.dependency_waves(flattened, set(), reverse=True)
+        self.assertEqual(waves, [
+            ('workloads', [0, 1]),
+            ('rbac', [3, 4]),
+            ('crds', [2]),
+            ('namespaces', [5]),
+        ])
+
+class TestContentHash(unittest.TestCase):
+    definition = {
+        'apiVersion': 'v1',
+        'kind': 'ConfigMap',
+        'metadata': {
+            'name': 'myconfig',
+            'namespace': 'mynamespace'
+        },
+        'data': {
+            'a': '1',
+            'b': '2'
+        }
+    }
+
+    def test_00_key_order(self):
+        reordered = {
+            'data': {'b': '2', 'a': '1'},
+            'metadata': {'namespace': 'mynamespace', 'name': 'myconfig'},
+            'kind': 'ConfigMap',
+            'apiVersion': 'v1'
+        }
+        self.assertEqual(
+            k8s_config_resource.content_hash(self.definition),
+            k8s_config_resource.content_hash(reordered)
+        )
+
+    def test_01_changed(self):
+        changed = dict(self.definition, data={'a': '1', 'b': '3'})
+        self.assertNotEqual(
+            k8s_config_resource.content_hash(self.definition),
+            k8s_config_resource.content_hash(changed)
+        )
+
+    def test_02_ignore_annotation(self):
+        digest = k8s_config_resource.content_hash(self.definition)
+        stamped = k8s_config_resource.set_content_hash(self.definition, digest)
+        self.assertEqual(
+            stamped['metadata']['annotations'],
+            {k8s_config_resource.CONTENT_HASH_ANNOTATION: digest}
+        )
+        self.assertEqual(k8s_config_resource.content_hash(stamped), digest)
+        self.assertNotIn('annotations', self.definition['metadata'])
+
+class TestDeepMerge(unittest.TestCase):
+    def test_00_rfc7386_examples(self):
+        # Test cases from RFC 7386 Appendix A
+        for source, patch, result in (
+            ({'a': 'b'}, {'a': 'c'}, {'a': 'c'}),
+            ({'a': 'b'}, {'b': 'c'}, {'a': 'b', 'b': 'c'}),
+            ({'a': 'b'}, {'a': None}, {}),
+            ({'a': 'b', 'b': 'c'}, {'a': None}, {'b': 'c'}),
+            ({'a': ['b']}, {'a': 'c'}, {'a': 'c'}),
+            ({'a': 'c'}, {'a': ['b']}, {'a': ['b']}),
+            ({'a': {'b': 'c'}}, {'a': {'b': 'd', 'c': None}}, {'a': {'b': 'd'}}),
+            ({'a': [{'b': 'c'}]}, {'a': [1]}, {'a': [1]}),
+            (['a', 'b'], ['c', 'd'], ['c', 'd']),
+            ({'a': 'b'}, ['c'], ['c']),
+            ({'a': 'foo'}, None, None),
+            ({'a': 'foo'}, 'bar', 'bar'),
+            ({'e': None}, {'a': 1}, {'e': None, 'a': 1}),
+            ([1, 2], {'a': 'b', 'c': None}, {'a': 'b'}),
+            ({}, {'a': {'bb': {'ccc': None}}}, {'a': {'bb': {}}}),
+        ):
+            self.assertEqual(k8s_config_resource.deep_merge(source, patch), result)
+
+    def test_01_source_unmodified(self):
+        source = {'metadata': {'name': 'a', 'labels': {'x': '1'}}, 'data': {'a': '1'}}
+        k8s_config_resource.deep_merge(source, {'metadata': {'labels': {'x': None, 'y': '2'}}, 'data': None})
+        self.assertEqual(source, {'metadata': {'name': 'a', 'labels': {'x': '1'}}, 'data': {'a': '1'}})
+
+    def test_02_untouched_shared(self):
+        source = {
+            'metadata': {'name': 'a', 'labels': {'x': '1'}},
+            'data': dict(('key{0}'.format(i), {'value': i}) for i in range(5000))
+        }
+        result = k8s_config_resource.deep_merge(source, {'data': {'key1': {'value': 'x'}}})
+        self.assertIs(result['metadata'], source['metadata'])
+        self.assertIsNot(result['data'], source['data'])
+        self.assertIs(result['data']['key0'], source['data']['key0'])
+        self.assertEqual(result['data']['key1'], {'value': 'x'})
+        self.assertEqual(source['data']['key1'], {'value': 1})
+
+    def test_03_unchanged_returns_source(self):
+        source = {'metadata': {'name': 'a'}}
+        self.assertIs(k8s_config_resource.deep_merge(source, {'metadata': {'labels': None}}), source)
+
+class FakeResource(object):
+    def __init__(self, kind, group_version, namespaced=True):
+        self.kind = kind
+        self.group_version = group_version
+        self.namespaced = namespaced
+
+class FakeResourceModule(object):
+    name = None
+    namespace = 'myproject'
+    flatten_list_kind = k8s_config_resource.KubernetesResourceModule.flatten_list_kind
+    set_defaults = k8s_config_resource.KubernetesResourceModule.set_defaults
+
+    def find_definition_resource(self, kind, api_version):
+        if kind == 'CustomResourceDefinition':
+            return FakeResource(kind, api_version, namespaced=False)
+        if kind == 'RoleBinding':
+            return FakeResource(kind, api_version)
+
+class TestFlattenListKind(unittest.TestCase):
+    def test_00_generator(self):
+        flattened = FakeResourceModule().flatten_list_kind(None, definitions[2])
+        self.assertFalse(isinstance(flattened, list))
+        self.assertEqual(
+            [(resource.kind, definition['metadata']) for resource, definition in flattened],
+            [('CustomResourceDefinition', {'name': 'widgets.example.com'}),
+             ('RoleBinding', {'name': 'myapp', 'namespace': 'myproject'})]
+        )
+
+    def test_01_definitions_unmodified(self):
+        definition = {'kind': 'RoleBinding', 'metadata': {'name': 'myapp'}, 'subjects': []}
+        resource = FakeResource('RoleBinding', 'rbac.authorization.k8s.io/v1')
+        result = FakeResourceModule().set_defaults(resource, definition)
+        self.assertEqual(definition, {'kind': 'RoleBinding', 'metadata': {'name': 'myapp'}, 'subjects': []})
+        self.assertEqual(result['apiVersion'], 'rbac.authorization.k8s.io/v1')
+        self.assertEqual(result['metadata'], {'name': 'myapp', 'namespace': 'myproject'})
+        self.assertIs(result['subjects'], definition['subjects'])
+
+        unknown = {'metadata': {'name': 'x'}}
+        module = FakeResourceModule()
+        module.find_definition_resource = lambda kind, api_version: None
+        flattened = list(module.flatten_list_kind(FakeResource('WidgetList', 'example.com/v1'), {'items': [unknown]}))
+        self.assertEqual(flattened, [(None, {'kind': 'Widget', 'apiVersion': 'example.com/v1', 'metadata': {'name': 'x'}})])
+        self.assertEqual(unknown, {'metadata': {'name': 'x'}})
+
+def api_error(error_class, status, reason):
+    exc = ApiException(status=status, reason=reason)
+    exc.body = json.dumps({'kind': 'Status', 'code': status, 'reason': reason})
+    return error_class(exc)
+
+class FakeApiResource(object):
+    """
+    API resource keeping objects in memory, with the request interface of a
+    dynamic client resource. Requests are recorded as (verb, namespace, name).
+    """
+
+    def __init__(self, kind, group_version, namespaced=True, objects=(), namespaces=None, requests=None, invalid=(),
+                 verbs=('get', 'list', 'create', 'patch', 'update', 'delete', 'deletecollection')):
+        self.kind = kind
+        self.group_version = group_version
+        self.group = k8s_config_resource.api_group(group_version)
+        self.namespaced = namespaced
+        self.namespaces = namespaces
+        self.invalid = invalid
+        self.verbs = list(verbs)
+        self.objects = {}
+        self.requests = [] if requests is None else requests
+        self.resource_version = 0
+        self.lock = threading.Lock()
+        for obj in objects:
+            self.store(obj)
+
+    def store(self, obj):
+        self.resource_version += 1
+        obj = copy.deepcopy(obj)
+        obj.setdefault('apiVersion', self.group_version)
+        obj.setdefault('kind', self.kind)
+        obj['metadata']['resourceVersion'] = str(self.resource_version)
+        obj['metadata'].setdefault('uid', 'uid-{0}'.format(self.resource_version))
+        self.objects[(obj['metadata'].get('namespace'), obj['metadata']['name'])] = obj
+        return obj
+
+    def record(self, verb, namespace, name, dry_run=None):
+        self.requests.append((verb, namespace, name))
+        if self.namespaces is not None and namespace and namespace not in self.namespaces:
+            raise api_error(NotFoundError, 404, 'NotFound')
+        if name in self.invalid and verb in ('create', 'patch', 'replace'):
+            raise api_error(DynamicApiError, 422, 'Invalid')
+        return dry_run is None
+
+    def existing(self, namespace, name):
+        if (namespace, name) not in self.objects:
+            raise api_error(NotFoundError, 404, 'NotFound')
+        return self.objects[(namespace, name)]
+
+    def selected(self, namespace, label_selector):
+        labels = dict(term.split('=') for term in label_selector.split(',')) if label_selector else {}
+        return [
+            obj for (obj_namespace, name), obj in sorted(self.objects.items(), key=lambda item: (item[0][0] or '', item[0][1]))
+            if namespace in (None, obj_namespace)
+            and all((obj['metadata'].get('labels') or {}).get(k) == v for k, v in labels.items())
+        ]
+
+    def get(self, name=None, namespace=None, label_selector=None, limit=None, _continue=None):
+        with self.lock:
+            self.record('list' if name is None else 'get', namespace, name)
+            if name is not None:
+                return ResourceInstance(None, copy.deepcopy(self.existing(namespace, name)))
+            items = self.selected(namespace, label_selector)
+            start = int(_continue or 0)
+            end = start + limit if limit else len(items)
+            return ResourceInstance(None, {
+                'apiVersion': self.group_version,
+                'kind': self.kind + 'List',
+                'metadata': {'continue': str(end) if end < len(items) else None},
+                'items': copy.deepcopy(items[start:end]),
+            })
+
+    def create(self, body, namespace=None, dry_run=None):
+        with self.lock:
+            persist = self.record('create', namespace, body['metadata']['name'], dry_run)
+            if (namespace, body['metadata']['name']) in self.objects:
+                raise api_error(ConflictError, 409, 'AlreadyExists')
+            obj = dict(body, metadata=dict(body['metadata'], namespace=namespace))
+            return ResourceInstance(None, self.store(obj) if persist else obj)
+
+    def patch(self, body, name=None, namespace=None, content_type=None, dry_run=None, query_params=None):
+        with self.lock:
+            persist = self.record('patch', namespace, name, dry_run)
+            if content_type == 'application/apply-patch+yaml':
+                body = json.loads(body)
+                existing = self.objects.get((namespace, name), {'metadata': {'name': name, 'namespace': namespace}})
+            else:
+                existing = self.existing(namespace, name)
+            obj = k8s_config_resource.deep_merge(existing, body)
+            if obj == existing:
+                return ResourceInstance(None, copy.deepcopy(existing))
+            return ResourceInstance(None, self.store(obj) if persist else obj)
+
+    def replace(self, body, name=None, namespace=None, dry_run=None):
+        with self.lock:
+            persist = self.record('replace', namespace, name, dry_run)
+            self.existing(namespace, name)
+            return ResourceInstance(None, self.store(body) if persist else body)
+
+    def delete(self, name=None, namespace=None, label_selector=None, body=None, dry_run=None):
+        with self.lock:
+            persist = self.record('delete' if name else 'deletecollection', namespace, name, dry_run)
+            if name is None:
+                deleted = self.selected(namespace, label_selector)
+            else:
+                existing = self.existing(namespace, name)
+                preconditions = (body or {}).get('preconditions', {})
+                if any(existing['metadata'].get(k) != v for k, v in preconditions.items()):
+                    raise api_error(ConflictError, 409, 'Conflict')
+                deleted = [existing]
+            if persist:
+                for obj in deleted:
+                    del self.objects[(obj['metadata'].get('namespace'), obj['metadata']['name'])]
+            return ResourceInstance(None, {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Success'})
+
+class ModuleExit(Exception):
+    def __init__(self, failed, result):
+        super(ModuleExit, self).__init__(result.get('msg'))
+        self.failed = failed
+        self.result = result
+
+class FakeResourceModuleRun(k8s_config_resource.KubernetesResourceModule):
+    """ Resource module using fake API resources and raising ModuleExit with the module result """
+
+    def __init__(self, api_resources):
+        self.api_resources = api_resources
+        super(FakeResourceModuleRun, self).__init__()
+        self.module._diff = False
+        self.exit_json = lambda **result: self.exit(False, result)
+        self.fail_json = self.fail = lambda **result: self.exit(True, result)
+
+    def exit(self, failed, result):
+        raise ModuleExit(failed, result)
+
+    def get_api_client(self, **auth_params):
+        return None
+
+    def find_resource(self, kind, api_version, fail=False):
+        for resource in self.api_resources:
+            if resource.kind == kind and api_version in (None, resource.group_version):
+                return resource
+        if fail:
+            self.exit(True, dict(msg='Failed to find {0}.{1}'.format(api_version, kind)))
+
+    def set_connection_pool_size(self, size):
+        pass
+
+def resource_module(api_resources, check_mode=False, **module_args):
+    """ Return resource module with fake API resources """
+    module_args['_ansible_check_mode'] = check_mode
+    basic._ANSIBLE_ARGS = to_bytes(json.dumps({'ANSIBLE_MODULE_ARGS': module_args}))
+    return FakeResourceModuleRun(api_resources)
+
+def run_resource_module(api_resources, check_mode=False, **module_args):
+    """ Run resource module with fake API resources, returning (failed, result) """
+    try:
+        resource_module(api_resources, check_mode, **module_args).execute_module()
+    except ModuleExit as e:
+        return e.failed, e.result
+    raise AssertionError('module did not exit')
+
+def config_map(name, namespace='myproject', labels=None, data=None):
+    metadata = dict(name=name, namespace=namespace)
+    if labels:
+        metadata['labels'] = labels
+    return dict(apiVersion='v1', kind='ConfigMap', metadata=metadata, data=data or {'a': '1'})
+
+class TestMissingNamespace(unittest.TestCase):
+    def setUp(self):
+        self.config_maps = FakeApiResource('ConfigMap', 'v1', namespaces=[])
+
+    def test_00_check_mode(self):
+        for action in ('apply', 'create', 'merge'):
+            failed, result = run_resource_module(
+                [self.config_maps], check_mode=True, action=action, resource_definition=config_map('a')
+            )
+            self.assertFalse(failed, action)
+            self.assertEqual(result['results'][0]['changed'], True, action)
+
+    def test_01_fail(self):
+        for action in ('apply', 'create', 'merge'):
+            failed, result = run_resource_module(
+                [self.config_maps], action=action, resource_definition=config_map('a')
+            )
+            self.assertTrue(failed, action)
+            self.assertIn('NotFound', result['msg'], action)
+            self.assertEqual(result['status'], 404)
+
+    def test_02_fail_in_parallel(self):
+        failed, result = run_resource_module(
+            [self.config_maps], action='apply', parallelism=2,
+            resource_definition=[config_map('a'), config_map('b')],
+        )
+        self.assertTrue(failed)
+        self.assertEqual(result['msg'].count('Failed to apply object'), 2)
+        self.assertEqual([r['error']['status'] for r in result['results']], [404, 404])
+
+class TestPrune(unittest.TestCase):
+    def setUp(self):
+        owned = {'app': 'myapp'}
+        self.config_maps = FakeApiResource('ConfigMap', 'v1', objects=[
+            config_map('a', labels=owned),
+            config_map('b', labels=owned),
+            config_map('c'),
+            config_map('b', namespace='other', labels=owned),
+        ])
+        self.cluster_roles = FakeApiResource('ClusterRole', 'rbac.authorization.k8s.io/v1', namespaced=False, objects=[
+            {'metadata': {'name': 'myapp-view', 'labels': owned}},
+            {'metadata': {'name': 'myapp-edit', 'labels': owned}},
+        ])
+
+    def run_prune(self, definitions, check_mode=False, **module_args):
+        return run_resource_module(
+            [self.config_maps, self.cluster_roles], check_mode=check_mode,
+            resource_definition=definitions, prune_selector='app=myapp', **module_args
+        )
+
+    def test_00_namespaced(self):
+        failed, result = self.run_prune([config_map('a', labels={'app': 'myapp'})])
+        self.assertFalse(failed)
+        self.assertTrue(result['changed'])
+        self.assertEqual(result['pruned'], [
+            {'apiVersion': 'v1', 'kind': 'ConfigMap', 'namespace': 'myproject', 'name': 'b'},
+        ])
+        self.assertEqual(sorted(self.config_maps.objects), [('myproject', 'a'), ('myproject', 'c'), ('other', 'b')])
+        self.assertNotIn(('deletecollection', 'myproject', None), self.config_maps.requests)
+
+    def test_01_all_namespaces(self):
+        # A namespaced definition without a namespace lists objects in all namespaces
+        definition = config_map('b', namespace=None, labels={'app': 'myapp'})
+        del definition['metadata']['namespace']
+        failed, result = self.run_prune([definition], action='create')
+        self.assertEqual(sorted((r['namespace'], r['name']) for r in result['pruned']), [
+            ('myproject', 'a'), ('myproject', 'b'), ('other', 'b'),
+        ])
+
+    def test_02_cluster_scoped(self):
+        failed, result = self.run_prune([
+            {'apiVersion': 'rbac.authorization.k8s.io/v1', 'kind': 'ClusterRole',
+             'metadata': {'name': 'myapp-view', 'labels': {'app': 'myapp'}}},
+        ])
+        self.assertFalse(failed)
+        self.assertEqual(result['pruned'], [{
+            'apiVersion': 'rbac.authorization.k8s.io/v1', 'kind': 'ClusterRole', 'namespace': None, 'name': 'myapp-edit',
+        }])
+        self.assertEqual(sorted(self.cluster_roles.objects), [(None, 'myapp-view')])
+
+    def test_03_prune_kinds(self):
+        failed, result = self.run_prune(
+            [config_map('a', labels={'app': 'myapp'}), config_map('b', labels={'app': 'myapp'})],
+            prune_kinds=[{'apiVersion': 'rbac.authorization.k8s.io/v1', 'kind': 'ClusterRole'}],
+        )
+        self.assertEqual([r['name'] for r in result['pruned']], ['myapp-edit', 'myapp-view'])
+        self.assertEqual(self.cluster_roles.objects, {})
+
+    def test_04_check_mode(self):
+        for server_dry_run in (True, False):
+            failed, result = self.run_prune(
+                [config_map('a', labels={'app': 'myapp'})], check_mode=True, server_dry_run=server_dry_run
+            )
+            self.assertFalse(failed)
+            self.assertTrue(result['changed'])
+            self.assertEqual([r['name'] for r in result['pruned']], ['b'])
+            self.assertIn(('myproject', 'b'), self.config_maps.objects)
+        # Only the server-side dry run requests deletion
+        self.assertEqual(self.config_maps.requests.count(('delete', 'myproject', 'b')), 1)
+
+    def test_05_recreated_kept(self):
+        list_existing = k8s_config_resource.KubernetesResourceModule.list_existing
+        def list_then_recreate(module, resource, namespace, **kwargs):
+            existing = list_existing(module, resource, namespace, **kwargs)
+            # Object is recreated with a new uid after listing
+            resource.objects[('myproject', 'b')]['metadata']['uid'] = 'recreated'
+            return existing
+        k8s_config_resource.KubernetesResourceModule.list_existing = list_then_recreate
+        try:
+            failed, result = self.run_prune([config_map('a', labels={'app': 'myapp'})])
+        finally:
+            k8s_config_resource.KubernetesResourceModule.list_existing = list_existing
+        self.assertFalse(failed)
+        self.assertEqual(result['pruned'], [])
+        self.assertIn(('myproject', 'b'), self.config_maps.objects)
+
+    def test_06_unchanged(self):
+        failed, result = self.run_prune([
+            config_map('a', labels={'app': 'myapp'}), config_map('b', labels={'app': 'myapp'}),
+        ])
+        self.assertFalse(failed)
+        self.assertEqual(result['pruned'], [])
+        self.assertFalse([request for request in self.config_maps.requests if request[0] == 'delete'])
+
+class TestServerSideApply(unittest.TestCase):
+    def setUp(self):
+        self.config_maps = FakeApiResource('ConfigMap', 'v1', objects=[config_map('a'), config_map('b')])
+
+    def run_apply(self, definitions, check_mode=False, **module_args):
+        return run_resource_module(
+            [self.config_maps], check_mode=check_mode, action='server-side-apply',
+            resource_definition=definitions, **module_args
+        )
+
+    def test_00_changed(self):
+        failed, result = self.run_apply([config_map('a', data={'a': '2'}), config_map('b'), config_map('c')])
+        self.assertFalse(failed)
+        self.assertEqual([r['changed'] for r in result['results']], [True, False, True])
+        self.assertEqual(self.config_maps.objects[('myproject', 'a')]['data'], {'a': '2'})
+
+    def test_01_check_mode(self):
+        failed, result = self.run_apply(
+            [config_map('a', data={'a': '2'}), config_map('b'), config_map('c')], check_mode=True
+        )
+        self.assertFalse(failed)
+        self.assertEqual([r['changed'] for r in result['results']], [True, False, True])
+        self.assertEqual(self.config_maps.objects[('myproject', 'a')]['data'], {'a': '1'})
+
+    def test_02_prefetched(self):
+        failed, result = self.run_apply(
+            [config_map('a', data={'a': '2'}), config_map('b'), config_map('a', data={'a': '2'})], prefetch_threshold=2
+        )
+        self.assertEqual([r['changed'] for r in result['results']], [True, False, False])
+        self.assertEqual([verb for verb, namespace, name in self.config_maps.requests], ['list', 'patch', 'patch', 'patch'])
+
+    def test_03_not_prefetched(self):
+        definitions = [config_map('a', data={'a': '2'}), config_map('b'), config_map('c')]
+        failed, result = self.run_apply(definitions)
+        self.assertEqual([r['changed'] for r in result['results']], [True, False, True])
+        self.assertEqual([verb for verb, namespace, name in self.config_maps.requests], ['list', 'patch', 'patch', 'patch'])
+
+        # Objects are not retrieved individually, and are reported changed without a listed copy
+        del self.config_maps.requests[:]
+        failed, result = self.run_apply(definitions, prefetch_threshold=0)
+        self.assertEqual([r['changed'] for r in result['results']], [True, True, True])
+        self.assertEqual([verb for verb, namespace, name in self.config_maps.requests], ['patch'] * 3)
+
+        self.config_maps.verbs.remove('list')
+        del self.config_maps.requests[:]
+        failed, result = self.run_apply(definitions)
+        self.assertEqual([r['changed'] for r in result['results']], [True, True, True])
+        self.assertEqual([verb for verb, namespace, name in self.config_maps.requests], ['patch'] * 3)
+
+class TestPerformActions(unittest.TestCase):
+    def setUp(self):
+        self.requests = []
+        self.namespaces = FakeApiResource('Namespace', 'v1', namespaced=False, requests=self.requests)
+        self.service_accounts = FakeApiResource('ServiceAccount', 'v1', requests=self.requests)
+        self.config_maps = FakeApiResource('ConfigMap', 'v1', requests=self.requests)
+        self.api_resources = [self.namespaces, self.service_accounts, self.config_maps]
+        self.definitions = [
+            config_map('myconfig'),
+            {'apiVersion': 'v1', 'kind': 'ServiceAccount', 'metadata': {'name': 'myaccount', 'namespace': 'myproject'}},
+            {'apiVersion': 'v1', 'kind': 'Namespace', 'metadata': {'name': 'myproject'}},
+        ]
+
+    def created(self):
+        return [name for verb, namespace, name in self.requests if verb == 'create']
+
+    def test_00_dependency_waves(self):
+        failed, result = run_resource_module(
+            self.api_resources, ordering='dependency', parallelism=4, resource_definition=self.definitions
+        )
+        self.assertFalse(failed)
+        self.assertEqual(self.created(), ['myproject', 'myaccount', 'myconfig'])
+        self.assertEqual([r['wave'] for r in result['results']], ['workloads', 'rbac', 'namespaces'])
+        self.assertEqual(result['waves'], [
+            {'name': 'namespaces', 'count': 1}, {'name': 'rbac', 'count': 1}, {'name': 'workloads', 'count': 1},
+        ])
+
+    def test_01_delete_reverse_waves(self):
+        run_resource_module(self.api_resources, resource_definition=self.definitions)
+        del self.requests[:]
+        failed, result = run_resource_module(
+            self.api_resources, action='delete', ordering='dependency', resource_definition=self.definitions
+        )
+        self.assertFalse(failed)
+        self.assertEqual(
+            [name for verb, namespace, name in self.requests if verb == 'delete'],
+            ['myconfig', 'myaccount', 'myproject']
+        )
+
+    def test_02_failed_wave_stops_later_waves(self):
+        self.namespaces.namespaces = []
+        self.service_accounts.namespaces = []
+        failed, result = run_resource_module(
+            self.api_resources, ordering='dependency', parallelism=4,
+            resource_definition=self.definitions + [
+                {'apiVersion': 'v1', 'kind': 'ServiceAccount', 'metadata': {'name': 'other', 'namespace': 'other'}},
+            ],
+        )
+        self.assertTrue(failed)
+        self.assertEqual(self.created(), ['myproject', 'myaccount', 'other'])
+        self.assertEqual([r['changed'] for r in result['results']], [False, False, True, False])
+        self.assertNotIn('error', result['results'][0])
+        self.assertEqual(result['results'][0]['skipped'], True)
+        self.assertEqual(
+            result['results'][0]['msg'],
+            'Skipped after failure of ServiceAccount myproject/myaccount in wave rbac, '
+            'ServiceAccount other/other in wave rbac'
+        )
+        self.assertNotIn('skipped', result['results'][2])
+        self.assertEqual([r['error']['status'] for r in result['results'][1::2]], [404, 404])
+        self.assertEqual(result['msg'].split(':')[0], 'Failed processing 2 of 4 resources')
+
+    def test_03_unexpected_errors_collected(self):
+        create = self.config_maps.create
+        def create_or_raise(body, **kwargs):
+            if body['metadata']['name'] == 'broken':
+                raise ValueError('unexpected')
+            return create(body, **kwargs)
+        self.config_maps.create = create_or_raise
+        failed, result = run_resource_module(
+            self.api_resources, parallelism=2,
+            resource_definition=[config_map('a'), config_map('broken'), config_map('b')],
+        )
+        self.assertTrue(failed)
+        self.assertEqual(sorted(name for namespace, name in self.config_maps.objects), ['a', 'b'])
+        self.assertEqual([r['changed'] for r in result['results']], [True, False, True])
+        self.assertEqual(result['results'][1]['error'], {'msg': 'Failed to process object: ValueError: unexpected'})
+        self.assertEqual(result['resources'][0]['metadata']['name'], 'a')
+
+class TestCustomResources(unittest.TestCase):
+    def setUp(self):
+        self.requests = []
+        self.crds = FakeApiResource(
+            'CustomResourceDefinition', 'apiextensions.k8s.io/v1', namespaced=False, requests=self.requests
+        )
+        self.config_maps = FakeApiResource('ConfigMap', 'v1', requests=self.requests)
+        self.widget = dict(definitions[0], metadata={'name': 'mywidget', 'namespace': 'myproject'})
+
+    def test_00_check_mode_crd_wave(self):
+        failed, result = run_resource_module(
+            [self.crds, self.config_maps], check_mode=True, ordering='dependency',
+            resource_definition=[self.widget, crd, config_map('myconfig')],
+        )
+        self.assertFalse(failed, result.get('msg'))
+        self.assertTrue(result['changed'])
+        self.assertEqual(
+            [(r['kind'], r['changed'], r.get('method'), r['wave']) for r in result['results']],
+            [('Widget', True, 'create', 'custom-resources'),
+             ('CustomResourceDefinition', True, None, 'crds'),
+             ('ConfigMap', True, None, 'workloads')]
+        )
+        self.assertEqual(result['resources'][0], self.widget)
+        self.assertEqual((self.crds.objects, self.config_maps.objects), ({}, {}))
+
+    def test_01_check_mode_crd_wave_delete(self):
+        failed, result = run_resource_module(
+            [self.crds], check_mode=True, ordering='dependency', action='delete',
+            resource_definition=[self.widget, crd],
+        )
+        self.assertFalse(failed, result.get('msg'))
+        self.assertEqual([r['changed'] for r in result['results']], [False, False])
+
+class TestBatchEquivalence(unittest.TestCase):
+    """ Batch module runs give the same outcomes as running the module per definition """
+
+    definitions = [
+        config_map('new', namespace=None, data={'a': '1'}),
+        config_map('same', namespace=None, data={'a': '1'}),
+        config_map('old', namespace=None, data={'a': '2'}),
+        config_map('invalid', namespace=None, data={'a': '1'}),
+        config_map('added', namespace=None, data={'b': '1'}),
+    ]
+
+    def config_maps(self):
+        return FakeApiResource('ConfigMap', 'v1', invalid=['invalid'], objects=[
+            config_map('same', data={'a': '1'}),
+            config_map('old', data={'a': '1'}),
+        ])
+
+    def run_batch(self, check_mode, **module_args):
+        config_maps = self.config_maps()
+        failed, result = run_resource_module(
+            [config_maps], check_mode=check_mode, namespace='myproject',
+            resource_definition=self.definitions, **module_args
+        )
+        outcomes = [
+            (r['changed'], r.get('error', {}).get('msg'), resource)
+            for r, resource in zip(result['results'], result['resources'])
+        ]
+        return failed, result['changed'], outcomes, config_maps.objects
+
+    def run_per_definition(self, check_mode, **module_args):
+        config_maps = self.config_maps()
+        outcomes = []
+        for definition in self.definitions:
+            # Namespace is combined into each definition by the legacy loop
+            definition = dict(definition, metadata=dict(definition['metadata'], namespace='myproject'))
+            failed, result = run_resource_module(
+                [config_maps], check_mode=check_mode, resource_definition=definition, **module_args
+            )
+            outcomes.append((result['changed'], result['msg'] if failed else None, result['resources'][0]))
+        failed = any(msg for changed, msg, resource in outcomes)
+        changed = any(changed for changed, msg, resource in outcomes)
+        return failed, changed, outcomes, config_maps.objects
+
+    def assertEquivalent(self, **module_args):
+        batch = self.run_batch(**module_args)
+        self.assertEqual(batch, self.run_per_definition(**module_args), module_args)
+        self.assertTrue(batch[0])
+        self.assertEqual([msg is None for changed, msg, resource in batch[2]], [True, True, True, False, True])
+
+    def test_00_actions(self):
+        for action in ('apply', 'create', 'merge', 'replace', 'server-side-apply', 'strategic-merge'):
+            for check_mode in (False, True):
+                self.assertEquivalent(action=action, check_mode=check_mode)
+
+    def test_01_delete(self):
+        for check_mode in (False, True):
+            batch = self.run_batch(check_mode, action='delete')
+            self.assertEqual(batch, self.run_per_definition(check_mode, action='delete'))
+            self.assertFalse(batch[0])
+            self.assertEqual([changed for changed, msg, resource in batch[2]], [False, True, True, False, False])
+
+    def test_02_parallelism(self):
+        # Parallel requests are made in any order, so compare without resource versions
+        def without_versions(run):
+            failed, changed, outcomes, objects = run
+            for obj in [resource for c, m, resource in outcomes if resource] + list(objects.values()):
+                obj['metadata'].pop('resourceVersion', None)
+                obj['metadata'].pop('uid', None)
+            return run
+        for action in ('apply', 'merge', 'replace'):
+            self.assertEqual(
+                without_versions(self.run_batch(False, action=action, parallelism=4)),
+                without_versions(self.run_per_definition(False, action=action)),
+            )
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.config_maps = FakeApiResource('ConfigMap', 'v1', objects=[
+            config_map('cm{0}'.format(i)) for i in range(5)
+        ] + [config_map('cm0', namespace='other')])
+
+    def verbs(self):
+        return [verb for verb, namespace, name in self.config_maps.requests]
+
+    def run_apply(self, count, **module_args):
+        return run_resource_module(
+            [self.config_maps], action='merge',
+            resource_definition=[config_map('cm{0}'.format(i), data={'a': str(i % 2)}) for i in range(count)],
+            **module_args
+        )
+
+    def test_00_threshold(self):
+        failed, result = self.run_apply(6, prefetch_threshold=6)
+        self.assertFalse(failed)
+        self.assertEqual(self.verbs(), ['list'] + ['patch'] * 5 + ['create'])
+        self.assertEqual([r['changed'] for r in result['results']], [True, False, True, False, True, True])
+
+    def test_01_below_threshold(self):
+        failed, result = self.run_apply(5, prefetch_threshold=6)
+        self.assertFalse(failed)
+        self.assertEqual(self.verbs(), ['get', 'patch'] * 5)
+        self.assertEqual([r['changed'] for r in result['results']], [True, False, True, False, True])
+
+    def test_02_disabled(self):
+        self.run_apply(5, prefetch_threshold=0)
+        self.assertNotIn('list', self.verbs())
+
+    def test_03_list_not_permitted(self):
+        self.config_maps.verbs.remove('list')
+        failed, result = self.run_apply(5, prefetch_threshold=1)
+        self.assertNotIn('list', self.verbs())
+        self.assertEqual([r['changed'] for r in result['results']], [True, False, True, False, True])
+
+    def test_04_check_mode(self):
+        failed, result = self.run_apply(6, check_mode=True, prefetch_threshold=6)
+        self.assertEqual(self.verbs().count('list'), 1)
+        self.assertNotIn('get', self.verbs())
+        self.assertEqual([r['changed'] for r in result['results']], [True, False, True, False, True, True])
+
+    def test_05_repeated_definition(self):
+        failed, result = run_resource_module(
+            [self.config_maps], action='merge', prefetch_threshold=2,
+            resource_definition=[config_map('cm0', data={'a': '2'}), config_map('cm1'), config_map('cm0', data={'a': '2'})],
+        )
+        # Prefetched objects are kept current with the objects written
+        self.assertEqual([r['changed'] for r in result['results']], [True, False, False])
+
+    def test_06_pagination(self):
+        module = resource_module([self.config_maps])
+        existing = module.list_existing(self.config_maps, 'myproject', limit=2)
+        self.assertEqual([obj.metadata.name for obj in existing], ['cm{0}'.format(i) for i in range(5)])
+        self.assertEqual(self.config_maps.requests, [('list', 'myproject', None)] * 3)
+        existing = module.list_existing(self.config_maps, 'myproject', names=set(['cm1', 'cm4', 'cm9']), limit=2)
+        self.assertEqual([obj.metadata.name for obj in existing], ['cm1', 'cm4'])
+        self.assertEqual(existing[0].kind, 'ConfigMap')
+
+    def test_07_paginated_prefetch(self):
+        module = resource_module([self.config_maps], prefetch_threshold=2)
+        list_existing = module.list_existing
+        module.list_existing = lambda resource, namespace, **kwargs: list_existing(resource, namespace, limit=2, **kwargs)
+        module.prefetch([(self.config_maps, config_map('cm{0}'.format(i))) for i in range(6)])
+        self.assertEqual(sorted(module.prefetched[('v1', 'ConfigMap', 'myproject')]), ['cm0', 'cm1', 'cm2', 'cm3', 'cm4'])
+        self.assertEqual(self.verbs(), ['list'] * 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
+from ansible.module_utils.k8s_config_result import result_formatter
+
+secret = {
+    'apiVersion': 'v1',
+    'kind': 'Secret',
+    'metadata': {
+        'name': 'mysecret',
+        'namespace': 'myproject',
+        'uid': '6b1d4c1e-0000-0000-0000-000000000000',
+        'resourceVersion': '42',
+        'labels': {'app': 'myapp'},
+    },
+    'data': {'password': 'c2VjcmV0'},
+    'status': {'conditions': [{'type': 'A'}, {'type': 'B'}]},
+}
+
+class TestResultFormat(unittest.TestCase):
+    def test_00_full(self):
+        self.assertIs(result_formatter('full')(secret, True), secret)
+        self.assertIs(result_formatter(None)(secret), secret)
+
+    def test_01_summary(self):
+        self.assertEqual(result_formatter('summary')(secret, True), {
+            'apiVersion': 'v1',
+            'kind': 'Secret',
+            'name': 'mysecret',
+            'namespace': 'myproject',
+            'uid': '6b1d4c1e-0000-0000-0000-000000000000',
+            'resourceVersion': '42',
+            'changed': True,
+        })
+        self.assertNotIn('changed', result_formatter('summary')(secret))
+        self.assertIsNone(result_formatter('summary')(None, False))
+
+    def test_02_jsonpath(self):
+        format_result = result_formatter(['{.metadata.labels.app}', '{.status.conditions[*].type}', '{.spec}'])
+        self.assertEqual(format_result(secret, False), {
+            '{.metadata.labels.app}': 'myapp',
+            '{.status.conditions[*].type}': ['A', 'B'],
+            '{.spec}': None,
+        })
+
+    def test_03_invalid(self):
+        for result_format in ('compact', [], [1], {'a': 'b'}):
+            with self.assertRaises(ValueError):
+                result_formatter(result_format)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import unittest
+
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
+from kubernetes.client.rest import ApiException
+from ansible.module_utils.k8s_config_scheduler import K8sConfigSchedulerMixin, RequestScheduler, TokenBucket
+
+def api_exception(status, retry_after=None):
+    exc = ApiException(status=status, reason='Error')
+    exc.headers = {'Retry-After': retry_after} if retry_after else {}
+    return exc
+
+class FakeRequest(object):
+    def __init__(self, *failures):
+        self.failures = list(failures)
+        self.calls = 0
+
+    def __call__(self, method, path, serializer=None, **kwargs):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return 'ok'
+
+class TestTokenBucket(unittest.TestCase):
+    def test_00_burst(self):
+        bucket = TokenBucket(qps=1000, burst=5)
+        self.assertEqual([bucket.acquire() for i in range(5)], [0] * 5)
+
+    def test_01_limit(self):
+        bucket = TokenBucket(qps=100, burst=1)
+        start = time.time()
+        for i in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.time() - start, 0.04)
+
+class TestRequestScheduler(unittest.TestCase):
+    def scheduler(self, **kwargs):
+        scheduler = RequestScheduler(backoff=0.001, **kwargs)
+        return scheduler
+
+    def test_00_retry_throttled(self):
+        scheduler = self.scheduler()
+        request = FakeRequest(api_exception(429), api_exception(503))
+        self.assertEqual(scheduler.wrap(request)('get', '/api/v1'), 'ok')
+        self.assertEqual(request.calls, 3)
+        self.assertEqual(scheduler.stats()['retries'], 2)
+        self.assertEqual(scheduler.stats()['requests'], 3)
+
+    def test_01_retry_limit(self):
+        scheduler = self.scheduler(retries=2)
+        request = FakeRequest(*[api_exception(500) for i in range(3)])
+        self.assertRaises(ApiException, scheduler.wrap(request), 'get', '/api/v1')
+        self.assertEqual(request.calls, 3)
+
+    def test_02_no_retry(self):
+        scheduler = self.scheduler()
+        for method, status, kwargs in (
+            ('get', 404, {}),
+            ('post', 409, {}),
+            ('post', 503, {}),
+            ('patch', 409, {'content_type': 'application/apply-patch+yaml'}),
+        ):
+            request = FakeRequest(api_exception(status))
+            self.assertRaises(ApiException, scheduler.wrap(request), method, '/api/v1', **kwargs)
+            self.assertEqual(request.calls, 1)
+
+    def test_03_conflict_retry(self):
+        scheduler = self.scheduler()
+        for method in ('put', 'patch'):
+            request = FakeRequest(api_exception(409))
+            self.assertEqual(scheduler.wrap(request)(method, '/api/v1'), 'ok')
+        self.assertEqual(scheduler.stats()['conflict_retries'], 2)
+
+    def test_04_retry_after(self):
+        scheduler = self.scheduler()
+        self.assertEqual(scheduler.retry_delay(api_exception(429, '3'), 0), 3)
+        self.assertLessEqual(scheduler.retry_delay(api_exception(429, '3600'), 0), scheduler.max_backoff)
+        delay = scheduler.retry_delay(api_exception(503), 2)
+        self.assertTrue(0.002 <= delay <= 0.004)
+
+    def test_05_throttled(self):
+        scheduler = self.scheduler(qps=100, burst=1)
+        request = FakeRequest()
+        for i in range(3):
+            scheduler.wrap(request)('get', '/api/v1')
+        self.assertEqual(scheduler.stats()['throttled'], 2)
+
+    def test_06_conditional_conflict(self):
+        scheduler = self.scheduler()
+        for method, body in (
+            ('put', {'metadata': {'name': 'test', 'resourceVersion': '1'}}),
+            ('patch', {'metadata': {'resourceVersion': '1'}, 'data': {'key': 'value'}}),
+            ('patch', [{'op': 'test', 'path': '/metadata/resourceVersion', 'value': '1'}]),
+        ):
+            request = FakeRequest(api_exception(409))
+            self.assertRaises(ApiException, scheduler.wrap(request), method, '/api/v1', body=body)
+            self.assertEqual(request.calls, 1)
+        request = FakeRequest(api_exception(409))
+        scheduler.wrap(request)('put', '/api/v1', body={'metadata': {'name': 'test'}})
+        self.assertEqual(request.calls, 2)
+
+    def test_07_retried_delete_not_found(self):
+        scheduler = self.scheduler()
+        request = FakeRequest(api_exception(504), api_exception(404))
+        result = scheduler.wrap(request)('delete', '/api/v1')
+        self.assertEqual(result.to_dict()['status'], 'Success')
+        self.assertEqual(request.calls, 2)
+        # Not found without a retry still fails
+        request = FakeRequest(api_exception(404))
+        self.assertRaises(ApiException, scheduler.wrap(request), 'delete', '/api/v1')
+
+    def test_08_append_not_retried(self):
+        scheduler = self.scheduler()
+        content_type = 'application/json-patch+json'
+        append = [{'op': 'add', 'path': '/spec/env/-', 'value': {'name': 'VAR'}}]
+        request = FakeRequest(api_exception(504))
+        self.assertRaises(
+            ApiException, scheduler.wrap(request), 'patch', '/api/v1', body=append, content_type=content_type
+        )
+        self.assertEqual(request.calls, 1)
+
+        # Appends are retried when throttled, or when guarded by a test
+        for status, body in (
+            (429, append),
+            (504, [{'op': 'test', 'path': '/metadata/resourceVersion', 'value': '1'}] + append),
+            (504, [{'op': 'add', 'path': '/spec/env/0', 'value': {'name': 'VAR'}}]),
+        ):
+            request = FakeRequest(api_exception(status))
+            self.assertEqual(
+                scheduler.wrap(request)('patch', '/api/v1', body=body, content_type=content_type), 'ok'
+            )
+            self.assertEqual(request.calls, 2)
+
+class FakeClient(object):
+    def __init__(self):
+        self.request = FakeRequest()
+
+class FakeHelper(object):
+    client = FakeClient()
+
+    def get_api_client(self, **auth_params):
+        return self.client
+
+class FakeModule(K8sConfigSchedulerMixin, FakeHelper):
+    params = {}
+
+class TestSchedulerMixin(unittest.TestCase):
+    def test_00_reused_client(self):
+        # Modules run in process get the same client for each run
+        for i in range(3):
+            module = FakeModule()
+            client = module.get_api_client()
+            client.request('get', '/api/v1')
+            self.assertEqual(module.request_stats()['requests'], 1)
+        self.assertEqual(client.unscheduled_request.calls, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
+from ansible.module_utils.k8s_config_wait import \
+    WaitFailedException, condition_ready, deployment_ready, job_ready, jsonpath_ready, jsonpath_values, \
+    wait_for_object
+
+pod = {
+    'metadata': {'name': 'mypod'},
+    'spec': {
+        'containers': [{'name': 'a', 'image': 'a:1'}, {'name': 'b', 'image': 'b:1'}]
+    },
+    'status': {
+        'phase': 'Running',
+        'conditions': [
+            {'type': 'Initialized', 'status': 'True'},
+            {'type': 'Ready', 'status': 'False', 'reason': 'ContainersNotReady'}
+        ]
+    }
+}
+
+class TestJsonPath(unittest.TestCase):
+    def test_00_field(self):
+        self.assertEqual(jsonpath_values(pod, '{.status.phase}'), ['Running'])
+        self.assertEqual(jsonpath_values(pod, 'status.phase'), ['Running'])
+
+    def test_01_index(self):
+        self.assertEqual(jsonpath_values(pod, '.spec.containers[1].image'), ['b:1'])
+        self.assertEqual(jsonpath_values(pod, '.spec.containers[-1].name'), ['b'])
+        self.assertEqual(jsonpath_values(pod, '.spec.containers[2].name'), [])
+
+    def test_02_wildcard(self):
+        self.assertEqual(jsonpath_values(pod, '.status.conditions[*].type'), ['Initialized', 'Ready'])
+
+    def test_03_missing(self):
+        self.assertEqual(jsonpath_values(pod, '.status.podIP'), [])
+
+    def test_04_ready(self):
+        self.assertTrue(jsonpath_ready('{.status.phase}', 'Running')(pod))
+        self.assertFalse(jsonpath_ready('{.status.phase}', 'Pending')(pod))
+        self.assertTrue(jsonpath_ready('{.status.phase}')(pod))
+        self.assertFalse(jsonpath_ready('{.status.podIP}')(pod))
+
+    def test_05_ready_falsy(self):
+        obj = {'spec': {'replicas': 0, 'paused': False, 'selector': {}, 'name': ''}}
+        for path in ('.spec.replicas', '.spec.paused', '.spec.selector', '.spec.name'):
+            self.assertTrue(jsonpath_ready(path)(obj), path)
+        self.assertTrue(jsonpath_ready('.spec.paused', 'false')(obj))
+        self.assertFalse(jsonpath_ready('.spec.missing')(obj))
+
+class FakeWatchResource(object):
+    """
+    Resource returning obj and watching until an event makes it ready,
+    recording gets and watch timeouts. With expired set watches end without
+    events, as the kubernetes client does for an expired resourceVersion.
+    """
+    kind = 'Pod'
+
+    def __init__(self, obj, expired=False):
+        self.obj = obj
+        self.expired = expired
+        self.gets = 0
+        self.timeouts = []
+
+    def get(self, name, namespace):
+        self.gets += 1
+        return FakeResourceInstance(self.obj)
+
+    def watch(self, resource_version, timeout, **params):
+        self.timeouts.append(timeout)
+        if self.expired:
+            return
+        yield {'type': 'MODIFIED', 'raw_object': dict(self.obj, status={'phase': 'Running'})}
+
+class FakeResourceInstance(object):
+    def __init__(self, obj):
+        self.obj = obj
+
+    def to_dict(self):
+        return self.obj
+
+class TestWaitForObject(unittest.TestCase):
+    def test_00_subsecond_timeout(self):
+        resource = FakeWatchResource({'metadata': {'name': 'mypod', 'resourceVersion': '1'}, 'status': {}})
+        ready = jsonpath_ready('{.status.phase}', 'Running')
+        k8s_obj = wait_for_object(resource, 'mypod', 'myproject', ready, 0.5)
+        self.assertEqual(k8s_obj['status'], {'phase': 'Running'})
+        self.assertEqual(resource.timeouts, [1])
+
+    def test_01_expired_watch(self):
+        resource = FakeWatchResource(
+            {'metadata': {'name': 'mypod', 'resourceVersion': '1'}, 'status': {}}, expired=True
+        )
+        ready = jsonpath_ready('{.status.phase}', 'Running')
+        self.assertRaises(WaitFailedException, wait_for_object, resource, 'mypod', 'myproject', ready, 1)
+        # Each watch is preceded by a get and followed by a backoff
+        self.assertIn(len(resource.timeouts), (2, 3))
+        self.assertEqual(resource.gets, len(resource.timeouts) + 1)
+
+    def test_02_expired_watch_recovers(self):
+        resource = FakeWatchResource(
+            {'metadata': {'name': 'mypod', 'resourceVersion': '1'}, 'status': {}}, expired=True
+        )
+        ready = jsonpath_ready('{.status.phase}', 'Running')
+
+        def get(name, namespace):
+            resource.gets += 1
+            if resource.gets > 1:
+                resource.obj = dict(resource.obj, status={'phase': 'Running'})
+            return FakeResourceInstance(resource.obj)
+        resource.get = get
+        k8s_obj = wait_for_object(resource, 'mypod', 'myproject', ready, 10)
+        self.assertEqual(k8s_obj['status'], {'phase': 'Running'})
+        self.assertEqual((resource.gets, len(resource.timeouts)), (2, 1))
+
+class TestConditionReady(unittest.TestCase):
+    def test_00_status(self):
+        self.assertTrue(condition_ready({'type': 'Initialized'})(pod))
+        self.assertFalse(condition_ready({'type': 'Ready'})(pod))
+        self.assertTrue(condition_ready({'type': 'Ready', 'status': 'False'})(pod))
+        self.assertFalse(condition_ready({'type': 'PodScheduled'})(pod))
+
+    def test_01_reason(self):
+        self.assertTrue(condition_ready({'type': 'Ready', 'status': 'False', 'reason': 'ContainersNotReady'})(pod))
+        self.assertFalse(condition_ready({'type': 'Ready', 'status': 'False', 'reason': 'Other'})(pod))
+
+class TestKindReady(unittest.TestCase):
+    def deployment(self, **status):
+        return {
+            'metadata': {'name': 'myapp', 'generation': 2},
+            'spec': {'replicas': 2},
+            'status': status
+        }
+
+    def test_00_deployment_rolled_out(self):
+        self.assertTrue(deployment_ready(self.deployment(
+            observedGeneration=2, replicas=2, updatedReplicas=2, availableReplicas=2
+        )))
+
+    def test_01_deployment_old_generation(self):
+        self.assertFalse(deployment_ready(self.deployment(
+            observedGeneration=1, replicas=2, updatedReplicas=2, availableReplicas=2
+        )))
+
+    def test_02_deployment_old_replicas(self):
+        self.assertFalse(deployment_ready(self.deployment(
+            observedGeneration=2, replicas=3, updatedReplicas=2, availableReplicas=2
+        )))
+
+    def test_03_deployment_deadline(self):
+        deployment = self.deployment(conditions=[{
+            'type': 'Progressing', 'status': 'False', 'reason': 'ProgressDeadlineExceeded'
+        }])
+        self.assertRaises(WaitFailedException, deployment_ready, deployment)
+
+    def test_04_job(self):
+        job = {'metadata': {'name': 'myjob'}, 'status': {}}
+        self.assertFalse(job_ready(job))
+        job['status']['conditions'] = [{'type': 'Complete', 'status': 'True'}]
+        self.assertTrue(job_ready(job))
+        job['status']['conditions'] = [{'type': 'Failed', 'status': 'True', 'message': 'BackoffLimitExceeded'}]
+        self.assertRaises(WaitFailedException, job_ready, job)
+
+if __name__ == '__main__':
+    unittest.main()
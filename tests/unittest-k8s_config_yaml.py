@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+import io
+import json
+import os
+import unittest
+
+import yaml
+
+# Role module_utils are made available by Ansible when running modules
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(__file__), '../module_utils'))
+
+from ansible.module_utils.k8s_config_yaml import YAMLError, load_all
+
+manifests = os.path.join(os.path.dirname(__file__), '00-cluster-admin/files')
+
+class TestLoadAll(unittest.TestCase):
+    def test_00_multiple_documents(self):
+        documents = load_all('---\nkind: A\n---\n---\nkind: B\n')
+        self.assertFalse(isinstance(documents, list))
+        self.assertEqual(list(documents), [{'kind': 'A'}, None, {'kind': 'B'}])
+
+    def test_01_same_as_pure_python_loader(self):
+        for filename in os.listdir(manifests):
+            with open(os.path.join(manifests, filename)) as f:
+                content = f.read()
+            self.assertEqual(list(load_all(content)), list(yaml.load_all(content, Loader=yaml.SafeLoader)))
+            self.assertEqual(list(load_all(io.StringIO(content))), list(load_all(content, yaml.SafeLoader)))
+
+    def test_02_json(self):
+        definition = {'kind': 'ConfigMap', 'data': {'a': '1', 'b': 'yes'}}
+        self.assertEqual(list(load_all(json.dumps(definition, indent=2))), [definition])
+        self.assertEqual(list(load_all('[{"kind": "A"}]')), [[{'kind': 'A'}]])
+
+    def test_03_flow_style_yaml(self):
+        self.assertEqual(list(load_all('{kind: A, data: {b: yes}}')), [{'kind': 'A', 'data': {'b': True}}])
+        self.assertEqual(list(load_all('{"kind": "A"}\n---\n{"kind": "B"}')), [{'kind': 'A'}, {'kind': 'B'}])
+
+    def test_04_invalid(self):
+        with self.assertRaises(YAMLError):
+            list(load_all('kind: [A'))
+
+if __name__ == '__main__':
+    unittest.main()